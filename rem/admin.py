@@ -3,9 +3,15 @@
 """
 
 from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponse
+from django.template.response import TemplateResponse
+from django.urls import path
 from import_export.admin import ImportExportActionModelAdmin
 from import_export import resources
-from .models import Client, Master, Order, Speciality, Service, Review
+from . import profiling
+from .autocomplete import prefix_object_ids
+from .models import REVIEW_FIELDS, Client, Master, Order, Speciality, Service, Review
 
 
 class MasterResource(resources.ModelResource):
@@ -99,11 +105,33 @@ class ClientResource(resources.ModelResource):
         return instance.email or "email не указан"
 
 
+class AutocompleteSearchMixin:
+    """
+    Примесь поиска в админ-панели: к обычному поиску по ``search_fields``
+    (подстрока) добавляются объекты, найденные по индексу автодополнения
+    (``rem.autocomplete``) — слова запроса как префиксы слов имени, без
+    учёта регистра и «ё»/«е».
+
+    Атрибуты:
+        autocomplete_kind (str): Тип объектов в индексе автодополнения.
+    """
+
+    autocomplete_kind = None
+
+    def get_search_results(self, request, queryset, search_term):
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if search_term:
+            results |= queryset.filter(
+                pk__in=prefix_object_ids(self.autocomplete_kind, search_term)
+            )
+        return results, may_have_duplicates
+
+
 admin.site.register(Speciality)
 admin.site.register(Order)
 
 @admin.register(Client)
-class ClientAdmin(ImportExportActionModelAdmin, admin.ModelAdmin):
+class ClientAdmin(AutocompleteSearchMixin, ImportExportActionModelAdmin, admin.ModelAdmin):
     """
     Класс для управления клиентами в админ-панели.
     """
@@ -111,12 +139,13 @@ class ClientAdmin(ImportExportActionModelAdmin, admin.ModelAdmin):
     resource_class = ClientResource
     list_display = ["full_name", "email", "created_at"]
     list_editable = ["email"]
+    autocomplete_kind = "client"
     search_fields = ("full_name", "email")
     date_hierarchy = "created_at"
 
 
 @admin.register(Master)
-class MasterAdmin(ImportExportActionModelAdmin, admin.ModelAdmin):
+class MasterAdmin(AutocompleteSearchMixin, ImportExportActionModelAdmin, admin.ModelAdmin):
     """
     Класс для управления мастерами в админ-панели.
     """
@@ -124,6 +153,18 @@ class MasterAdmin(ImportExportActionModelAdmin, admin.ModelAdmin):
     resource_class = MasterResource
     list_display = ["full_name", "speciality", "rating"]
     list_filter = ["speciality"]
+    autocomplete_kind = "master"
+    search_fields = ("full_name",)
+
+    def get_readonly_fields(self, request, obj=None):
+        """
+        Поля отзывов меняются только отзывами, рейтинг мастера с отзывами —
+        тоже (см. ``Master.save``).
+        """
+        fields = [*super().get_readonly_fields(request, obj), *REVIEW_FIELDS]
+        if obj is not None and obj.review_count:
+            fields.append("rating")
+        return fields
 
 
 @admin.register(Service)
@@ -148,3 +189,81 @@ class ReviewAdmin(ImportExportActionModelAdmin, admin.ModelAdmin):
     search_fields = ["client", "master", "rating"]
     date_hierarchy = "created_at"
     raw_id_fields = ('client', 'master')
+
+
+def _profiling_context(request, title):
+    """
+    Проверяет доступ к профилям (только суперпользователь: в профиле есть
+    тексты SQL, а при REM_PROFILING_CAPTURE_PARAMS и значения параметров)
+    и возвращает контекст страницы админ-панели.
+    """
+    if not request.user.is_superuser:
+        raise PermissionDenied
+    return {**admin.site.each_context(request), "title": title}
+
+
+def profile_list_view(request):
+    """
+    Список сохранённых профилей запросов, самые долгие первыми, и
+    заголовок с токеном для профилирования запроса по требованию.
+    """
+    context = _profiling_context(request, "Профили запросов")
+    context.update(
+        profiles=profiling.ProfileStore().list(),
+        header=profiling.header_name(),
+        token=profiling.make_token(),
+        token_max_age=profiling.token_max_age(),
+    )
+    return TemplateResponse(request, "admin/rem/profile_list.html", context)
+
+
+def profile_detail_view(request, profile_id):
+    """
+    Профиль запроса: flame graph, самые частые кадры и хронология SQL.
+    С ``?format=collapsed`` отдаёт свёрнутые стеки для внешних
+    инструментов (flamegraph.pl, speedscope).
+    """
+    context = _profiling_context(request, "Профиль запроса")
+    profile = profiling.ProfileStore().load(profile_id)
+    if profile is None:
+        raise Http404
+    stacks = [(tuple(stack), count) for stack, count in profile["stacks"]]
+    if request.GET.get("format") == "collapsed":
+        response = HttpResponse(profiling.collapsed_stacks(stacks), content_type="text/plain; charset=utf-8")
+        response["Content-Disposition"] = f'attachment; filename="{profile_id}.folded"'
+        return response
+
+    meta = profile["meta"]
+    duration = meta["duration_ms"] or 1
+    queries = [
+        {
+            **query,
+            "left": min(100, query["offset_ms"] / duration * 100),
+            "width": max(0.2, query["duration_ms"] / duration * 100),
+        }
+        for query in profile["queries"]
+    ]
+    blocks = profiling.flame_blocks(stacks)
+    context.update(
+        meta=meta,
+        blocks=[{**block, "left": block["left"] * 100, "width": block["width"] * 100} for block in blocks],
+        flame_height=(max((block["depth"] for block in blocks), default=0) + 1) * 18,
+        frames=profiling.top_frames(stacks),
+        queries=queries,
+    )
+    return TemplateResponse(request, "admin/rem/profile_detail.html", context)
+
+
+def profiling_urls():
+    """
+    Возвращает маршруты страниц профилей; подключаются до ``admin/``.
+    """
+    return [
+        path("admin/profiles/", admin.site.admin_view(profile_list_view), name="rem-profiles"),
+        path(
+            "admin/profiles/<str:profile_id>/",
+            admin.site.admin_view(profile_detail_view),
+            name="rem-profile",
+        ),
+    ]
+
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class RemConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'rem'
+
+    def ready(self):
+        from . import metrics, signals  # noqa: F401
+
+        metrics.connect_task_signals()
@@ -0,0 +1,189 @@
+"""
+Этот модуль содержит асинхронные представления чтения (list и retrieve)
+для ViewSet'ов приложения, обслуживаемые через ASGI (``remonte.asgi``).
+
+Представление переиспользует ViewSet: аутентификация, права, согласование
+формата и фильтры выполняются его синхронным кодом в потоке, а проверка
+версий моделей, условный GET, кэш ответов и выборка записей — асинхронно
+(``cache.aget``, ``async for``, ``acount``). Пока запрос ждёт базу данных
+или Redis, ASGI-воркер обслуживает другие запросы, а ответы 304 и
+попадания в кэш вовсе не обращаются к базе.
+"""
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.http import Http404, HttpResponse
+from django.urls import path
+from django.utils.cache import get_conditional_response
+from django.views import View
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.views import exception_handler
+
+from . import metrics
+from .caching import acount_cache_event, aget_model_versions
+from .pagination import KeysetPagination
+from .renderers import FastJSONRenderer, MessagePackRenderer
+
+# Префиксы маршрутизатора, для которых доступны асинхронные представления
+ASYNC_READ_PREFIXES = ("masters", "orders", "reviews", "specialisties", "services")
+
+
+class AsyncReadView(View):
+    """
+    Асинхронные list и retrieve для ViewSet'а ``viewset_class``.
+
+    Браузерный API не поддерживается: ответы рендерятся в JSON или MessagePack.
+    """
+
+    viewset_class = None
+    renderer_classes = (FastJSONRenderer, MessagePackRenderer)
+
+    async def get(self, request, pk=None):
+        """
+        Возвращает список или объект.
+        """
+        action = "list" if pk is None else "retrieve"
+        viewset = self.viewset_class(action_map={"get": action, "head": action})
+        kwargs = {} if pk is None else {"pk": pk}
+        drf_request = viewset.initialize_request(request, **kwargs)
+        try:
+            queryset = await sync_to_async(self.prepare)(viewset, drf_request, kwargs)
+            return await self.respond(viewset, drf_request, queryset, action, pk)
+        except Exception as exc:
+            response = exception_handler(exc, {"view": viewset, "request": drf_request})
+            if response is None:
+                raise
+            if not getattr(drf_request, "accepted_renderer", None):
+                negotiated = viewset.perform_content_negotiation(drf_request, force=True)
+                drf_request.accepted_renderer, drf_request.accepted_media_type = negotiated
+            return self.render(drf_request, viewset, response.data, response.status_code)
+
+    def prepare(self, viewset, request, kwargs):
+        """
+        Синхронная подготовка ViewSet'а: аутентификация, права, согласование
+        формата и фильтры. Возвращает ленивый queryset.
+        """
+        viewset.renderer_classes = self.renderer_classes
+        viewset.args, viewset.kwargs = (), kwargs
+        viewset.format_kwarg = None
+        viewset.request = request
+        viewset.headers = viewset.default_response_headers
+        viewset.initial(request, **kwargs)
+        metrics.set_view_name(f"async-{viewset.get_metrics_name()}")
+        return viewset.filter_queryset(viewset.get_queryset())
+
+    async def respond(self, viewset, drf_request, queryset, action, pk):
+        """
+        Проверяет актуальность копии клиента и кэш, при необходимости
+        выбирает данные из базы.
+        """
+        viewset._versions = await aget_model_versions(viewset.get_version_models())
+        etag, last_modified = viewset.get_validators()
+        response = get_conditional_response(
+            drf_request._request, etag=etag, last_modified=last_modified
+        )
+        if response is not None:
+            return viewset.patch_conditional_headers(response, etag, last_modified)
+
+        cacheable = action in viewset.cache_actions
+        data = None
+        if cacheable:
+            name, key = viewset.get_response_cache_key()
+            data = await cache.aget(key)
+            await acount_cache_event(name, "miss" if data is None else "hit")
+
+        if data is None:
+            if action == "list":
+                data = await self.list(viewset, drf_request, queryset)
+            else:
+                data = await self.retrieve(viewset, drf_request, queryset, pk)
+            if cacheable:
+                await cache.aset(key, data, timeout=viewset.get_cache_timeout())
+
+        response = self.render(drf_request, viewset, data, 200)
+        return viewset.patch_conditional_headers(response, etag, last_modified)
+
+    async def list(self, viewset, request, queryset):
+        """
+        Возвращает данные страницы списка.
+        """
+        paginator = viewset.paginator
+        if isinstance(paginator, KeysetPagination):
+            page_queryset = paginator.get_page_queryset(queryset, request, viewset)
+            page = paginator.build_page([obj async for obj in page_queryset])
+        elif isinstance(paginator, LimitOffsetPagination):
+            page = await self.paginate_limit_offset(paginator, queryset, request)
+        elif paginator is not None:
+            page = await sync_to_async(paginator.paginate_queryset)(queryset, request, viewset)
+        else:
+            page = None
+
+        if page is None:
+            return viewset.get_serializer([obj async for obj in queryset], many=True).data
+        return paginator.get_paginated_response(
+            viewset.get_serializer(page, many=True).data
+        ).data
+
+    @staticmethod
+    async def paginate_limit_offset(paginator, queryset, request):
+        """
+        Асинхронный вариант ``LimitOffsetPagination.paginate_queryset``.
+        """
+        paginator.request = request
+        paginator.limit = paginator.get_limit(request)
+        if paginator.limit is None:
+            return None
+        paginator.count = await queryset.acount()
+        paginator.offset = paginator.get_offset(request)
+        if paginator.count > paginator.limit and paginator.template is not None:
+            paginator.display_page_controls = True
+        if paginator.count == 0 or paginator.offset > paginator.count:
+            return []
+        end = paginator.offset + paginator.limit
+        return [obj async for obj in queryset[paginator.offset:end]]
+
+    @staticmethod
+    async def retrieve(viewset, request, queryset, pk):
+        """
+        Возвращает данные объекта.
+        """
+        try:
+            obj = await queryset.aget(**{viewset.lookup_field: pk})
+        except (ObjectDoesNotExist, ValidationError, TypeError, ValueError):
+            raise Http404
+        viewset.check_object_permissions(request, obj)
+        return viewset.get_serializer(obj).data
+
+    @staticmethod
+    def render(request, viewset, data, status):
+        """
+        Рендерит данные выбранным при согласовании рендерером.
+        """
+        renderer = request.accepted_renderer
+        content = renderer.render(
+            data,
+            request.accepted_media_type,
+            {"view": viewset, "request": request, "response": None},
+        )
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type = f"{content_type}; charset={renderer.charset}"
+        return HttpResponse(content, status=status, content_type=content_type)
+
+
+def async_read_urlpatterns(router, prefix="api/async/"):
+    """
+    Возвращает маршруты асинхронных представлений для ViewSet'ов маршрутизатора
+    с префиксами из ``ASYNC_READ_PREFIXES``.
+    """
+    urlpatterns = []
+    for resource, viewset, basename in router.registry:
+        if resource not in ASYNC_READ_PREFIXES:
+            continue
+        view = AsyncReadView.as_view(viewset_class=viewset)
+        urlpatterns += [
+            path(f"{prefix}{resource}/", view, name=f"async-{basename}-list"),
+            path(f"{prefix}{resource}/<pk>/", view, name=f"async-{basename}-detail"),
+        ]
+    return urlpatterns
@@ -0,0 +1,263 @@
+"""
+Этот модуль поддерживает индекс автодополнения имён клиентов и мастеров
+(``Client.full_name``, ``Master.full_name``).
+
+Имя разбивается на слова, приведённые к единому виду (casefold, «ё»
+заменена на «е»). Каждое слово хранится строкой ``AutocompleteToken``:
+поиск по префиксу — диапазон ``token >= префикс AND token < префикс + U+10FFFF``
+по индексу (тип, слово), поэтому он не зависит от числа имён и
+прекращается, набрав ``limit`` строк. Для поиска с опечатками слова
+словаря разбиты на триграммы (``AutocompleteTrigram``): сначала находятся
+слова, содержащие достаточную долю триграмм запроса, затем — имена с
+этими словами. Словарь слов намного меньше числа имён, поэтому списки
+совпадений по триграммам короткие.
+
+Индекс обновляется сигналами сохранения и удаления клиентов и мастеров
+и перестраивается командой ``rebuild_autocomplete``.
+"""
+
+import math
+import re
+
+from django.conf import settings
+from django.db.models import Count, Exists, OuterRef
+
+from .models import AutocompleteToken, AutocompleteTrigram, Client, Master
+
+AUTOCOMPLETE_MODELS = {"client": Client, "master": Master}
+AUTOCOMPLETE_KINDS = tuple(AUTOCOMPLETE_MODELS)
+# Верхняя граница диапазона префикса: больше любого символа в слове
+PREFIX_END = "\U0010ffff"
+# Слова короче не ищутся по триграммам: в них слишком мало триграмм
+MIN_FUZZY_LENGTH = 3
+
+
+def kind_of(model):
+    """
+    Возвращает тип объекта в индексе для модели.
+    """
+    for kind, kind_model in AUTOCOMPLETE_MODELS.items():
+        if kind_model is model:
+            return kind
+    raise KeyError(model)
+
+
+def normalize(text):
+    """
+    Возвращает слова текста в едином виде: без учёта регистра (casefold)
+    и с «е» вместо «ё».
+    """
+    return re.findall(r"\w+", (text or "").casefold().replace("ё", "е"))
+
+
+def trigrams(word):
+    """
+    Возвращает множество триграмм слова, дополненного двумя пробелами
+    слева и одним справа (как в pg_trgm): начало слова весомее.
+    """
+    padded = f"  {word} "
+    return {padded[index: index + 3] for index in range(len(padded) - 2)}
+
+
+def _rows(kind, object_id, name):
+    """
+    Возвращает несохранённые строки слов и триграмм имени.
+    """
+    words = sorted(set(normalize(name)))
+    tokens = [
+        AutocompleteToken(kind=kind, object_id=object_id, token=word, name=name)
+        for word in words
+    ]
+    return tokens, _trigram_rows(kind, words)
+
+
+def _trigram_rows(kind, words):
+    """
+    Возвращает несохранённые строки триграмм слов.
+    """
+    return [
+        AutocompleteTrigram(kind=kind, token=word, trigram=gram)
+        for word in words
+        for gram in sorted(trigrams(word))
+    ]
+
+
+def index_name(kind, object_id, name, created=False):
+    """
+    Записывает имя объекта в индекс, заменяя прежнее (кроме новых объектов).
+    Триграммы добавляются только для слов, которых ещё нет в словаре.
+    """
+    if not created:
+        remove_name(kind, object_id)
+    tokens, grams = _rows(kind, object_id, name)
+    AutocompleteToken.objects.bulk_create(tokens)
+    AutocompleteTrigram.objects.bulk_create(grams, ignore_conflicts=True)
+
+
+def remove_name(kind, object_id):
+    """
+    Удаляет имя объекта из индекса. Триграммы слов остаются в словаре:
+    слова без имён не дают результатов и удаляются при перестройке.
+    """
+    AutocompleteToken.objects.filter(kind=kind, object_id=object_id).delete()
+
+
+def rebuild_autocomplete(kinds=AUTOCOMPLETE_KINDS, batch_size=1000):
+    """
+    Перестраивает индекс для типов ``kinds`` по таблицам моделей и
+    возвращает словарь {тип: число объектов}.
+    """
+    result = {}
+    for kind in kinds:
+        AutocompleteToken.objects.filter(kind=kind).delete()
+        AutocompleteTrigram.objects.filter(kind=kind).delete()
+        tokens, vocabulary, count = [], set(), 0
+        names = AUTOCOMPLETE_MODELS[kind].objects.values_list("pk", "full_name")
+        for object_id, name in names.iterator(chunk_size=batch_size):
+            count += 1
+            object_tokens, _ = _rows(kind, object_id, name)
+            tokens += object_tokens
+            vocabulary.update(token.token for token in object_tokens)
+            if len(tokens) >= batch_size:
+                AutocompleteToken.objects.bulk_create(tokens, batch_size=batch_size)
+                tokens = []
+        AutocompleteToken.objects.bulk_create(tokens, batch_size=batch_size)
+        AutocompleteTrigram.objects.bulk_create(
+            _trigram_rows(kind, sorted(vocabulary)), batch_size=batch_size
+        )
+        result[kind] = count
+    return result
+
+
+def _prefix(word, field="token"):
+    """
+    Возвращает условия диапазона для поиска слов с префиксом ``word``.
+    """
+    return {f"{field}__gte": word, f"{field}__lt": word + PREFIX_END}
+
+
+def complete(query, kinds=AUTOCOMPLETE_KINDS, limit=10):
+    """
+    Возвращает до ``limit`` объектов, имена которых подходят к запросу:
+    список словарей ``type``, ``id``, ``name``, ``match`` и ``score``.
+
+    Сначала ищутся имена, каждое слово запроса в которых — префикс
+    одного из слов имени (``match`` = ``"prefix"``, по алфавиту
+    совпавших слов). Если их меньше ``limit``, добавляются имена,
+    похожие на запрос по триграммам (``match`` = ``"fuzzy"``, по
+    убыванию доли совпавших триграмм ``score``).
+    """
+    words = normalize(query)
+    if not words:
+        return []
+    results, found = [], set()
+    for kind in kinds:
+        for row in _prefix_matches(kind, words, limit):
+            if (kind, row["object_id"]) not in found:
+                found.add((kind, row["object_id"]))
+                results.append((row["token"], kind, row["object_id"], row["name"]))
+    results = [
+        {"type": kind, "id": object_id, "name": name, "match": "prefix", "score": 1.0}
+        for _, kind, object_id, name in sorted(results)[:limit]
+    ]
+    if len(results) < limit:
+        results += _fuzzy_matches(words, kinds, limit - len(results), found)
+    return results
+
+
+def _matches(kind, words, tokens):
+    """
+    Ограничивает queryset слов ``tokens`` объектами, в именах которых
+    каждое из слов запроса ``words`` — префикс одного из слов имени
+    (подзапросы ``EXISTS`` по индексу).
+    """
+    for word in words:
+        tokens = tokens.filter(
+            Exists(
+                AutocompleteToken.objects.filter(
+                    kind=kind, object_id=OuterRef("object_id"), **_prefix(word)
+                )
+            )
+        )
+    return tokens
+
+
+def prefix_object_ids(kind, query):
+    """
+    Возвращает queryset id объектов типа ``kind``, в именах которых каждое
+    слово запроса — префикс одного из слов имени (для подзапросов ``IN``).
+    """
+    words = normalize(query)
+    if not words:
+        return AutocompleteToken.objects.none().values("object_id")
+    others = list(words)
+    driving = max(others, key=len)
+    others.remove(driving)
+    tokens = AutocompleteToken.objects.filter(kind=kind, **_prefix(driving))
+    return _matches(kind, others, tokens).values("object_id")
+
+
+def _prefix_matches(kind, words, limit):
+    """
+    Возвращает строки слов объекта типа ``kind``, подходящих ко всем словам
+    запроса. Диапазон задаётся самым длинным словом запроса (самым
+    избирательным), остальные слова проверяются подзапросами.
+    """
+    others = list(words)
+    driving = max(others, key=len)
+    others.remove(driving)
+    tokens = _matches(kind, others, AutocompleteToken.objects.filter(kind=kind, **_prefix(driving)))
+    # Одно имя может дать несколько подходящих слов: берём с запасом
+    return tokens.order_by("token", "object_id").values("object_id", "token", "name")[: limit * 2]
+
+
+def _fuzzy_matches(words, kinds, limit, exclude):
+    """
+    Возвращает объекты, в именах которых есть слово, содержащее не меньше
+    доли ``REM_AUTOCOMPLETE_SIMILARITY`` триграмм самого длинного слова
+    запроса; остальные слова запроса должны быть префиксами слов имени.
+    """
+    others = list(words)
+    driving = max(others, key=len)
+    others.remove(driving)
+    if len(driving) < MIN_FUZZY_LENGTH:
+        return []
+    grams = trigrams(driving)
+    similarity = getattr(settings, "REM_AUTOCOMPLETE_SIMILARITY", 0.4)
+    threshold = max(1, math.ceil(len(grams) * similarity))
+
+    candidates = []
+    for kind in kinds:
+        similar = dict(
+            AutocompleteTrigram.objects.filter(kind=kind, trigram__in=grams)
+            .values("token")
+            .annotate(hits=Count("id"))
+            .filter(hits__gte=threshold)
+            .order_by("-hits", "token")
+            .values_list("token", "hits")[: limit * 5]
+        )
+        if not similar:
+            continue
+        tokens = _matches(kind, others, AutocompleteToken.objects.filter(kind=kind, token__in=similar))
+        rows = tokens.values_list("object_id", "token", "name")[: (limit + len(exclude)) * 2]
+        candidates += [
+            (-similar[token], token, kind, object_id, name)
+            for object_id, token, name in rows
+            if (kind, object_id) not in exclude
+        ]
+
+    results, found = [], set()
+    for hits, _, kind, object_id, name in sorted(candidates):
+        if (kind, object_id) in found:
+            continue
+        found.add((kind, object_id))
+        results.append(
+            {
+                "type": kind,
+                "id": object_id,
+                "name": name,
+                "match": "fuzzy",
+                "score": round(-hits / len(grams), 2),
+            }
+        )
+    return results[:limit]
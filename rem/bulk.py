@@ -0,0 +1,224 @@
+"""
+Этот модуль содержит массовые операции над заказами.
+
+Пакет заказов проверяется целиком: существование клиентов и мастеров
+устанавливается двумя запросами ``pk IN (...)`` на весь пакет, а заказы
+и их исторические записи вставляются через ``bulk_create``.
+
+Массовое изменение цен выполняется одним ``UPDATE ... SET price = ...``
+на пачку заказов, история пишется через ``bulk_history_create``.
+Массовые операции не отправляют сигналов, поэтому дневные агрегаты
+(``rem.rollups``) пересчитываются для затронутых дней, а рейтинги мастеров
+(``rem.leaderboards``) — для затронутых мастеров явно.
+"""
+
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Round
+from django.utils import timezone
+from rest_framework import serializers
+from simple_history.utils import bulk_create_with_history
+
+from . import leaderboards
+from .caching import bump_model_version_on_commit
+from .models import Client, Master, Order
+from .rollups import refresh_order_rollups
+from .serializers import OrderSerializer
+
+MODE_ATOMIC = "atomic"
+MODE_PARTIAL = "partial"
+BULK_MODES = (MODE_ATOMIC, MODE_PARTIAL)
+
+
+class OrderBulkItemSerializer(OrderSerializer):
+    """
+    Сериализатор одного заказа в пакете.
+
+    Внешние ключи принимаются как числа и проверяются по множествам
+    существующих id из контекста (``client_ids``, ``master_ids``), а не
+    отдельным запросом на каждый заказ.
+    """
+
+    id_user = serializers.IntegerField()
+    id_master = serializers.IntegerField()
+
+    def validate_id_user(self, value):
+        """Проверка существования клиента."""
+        if value not in self.context["client_ids"]:
+            raise serializers.ValidationError(f"Клиент с id={value} не существует.")
+        return value
+
+    def validate_id_master(self, value):
+        """Проверка существования мастера."""
+        if value not in self.context["master_ids"]:
+            raise serializers.ValidationError(f"Мастер с id={value} не существует.")
+        return value
+
+
+class OrderBulkRequestSerializer(serializers.Serializer):
+    """
+    Сериализатор тела запроса массового создания заказов.
+
+    Принимает либо список заказов, либо объект ``{"items": [...], "mode": ...}``.
+    Режим ``atomic`` создаёт заказы только если все они корректны,
+    ``partial`` создаёт корректные и возвращает ошибки остальных.
+    """
+
+    items = serializers.ListField(child=serializers.DictField(), allow_empty=False)
+    mode = serializers.ChoiceField(choices=BULK_MODES, required=False)
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            data = {"items": data}
+        return super().to_internal_value(data)
+
+    def validate_items(self, value):
+        """Проверка размера пакета."""
+        limit = getattr(settings, "REM_BULK_MAX_ITEMS", 1000)
+        if len(value) > limit:
+            raise serializers.ValidationError(f"Пакет не может содержать больше {limit} заказов.")
+        return value
+
+    def validate(self, attrs):
+        attrs.setdefault("mode", getattr(settings, "REM_BULK_DEFAULT_MODE", MODE_ATOMIC))
+        return attrs
+
+
+def _existing_ids(model, items, field):
+    """
+    Возвращает множество существующих id модели среди значений поля пакета.
+    """
+    ids = set()
+    for item in items:
+        try:
+            ids.add(int(item.get(field)))
+        except (TypeError, ValueError):
+            continue
+    if not ids:
+        return set()
+    return set(model.objects.filter(pk__in=ids).values_list("pk", flat=True))
+
+
+def bulk_create_orders(items, mode=MODE_ATOMIC, user=None):
+    """
+    Проверяет и создаёт пакет заказов.
+
+    Возвращает пару (созданные заказы, ошибки), где ошибка — словарь
+    ``{"index": номер элемента, "errors": ошибки полей}``. В режиме
+    ``atomic`` при наличии ошибок ничего не создаётся.
+    """
+    context = {
+        "client_ids": _existing_ids(Client, items, "id_user"),
+        "master_ids": _existing_ids(Master, items, "id_master"),
+    }
+    item_serializer = OrderBulkItemSerializer(context=context)
+
+    orders, errors = [], []
+    for index, item in enumerate(items):
+        try:
+            data = item_serializer.run_validation(item)
+        except serializers.ValidationError as exc:
+            errors.append({"index": index, "errors": exc.detail})
+            continue
+        data["id_user_id"] = data.pop("id_user")
+        data["id_master_id"] = data.pop("id_master")
+        orders.append(Order(**data))
+
+    if not orders or (errors and mode == MODE_ATOMIC):
+        return [], errors
+
+    batch_size = getattr(settings, "REM_BULK_BATCH_SIZE", 500)
+    with transaction.atomic():
+        created = bulk_create_with_history(
+            orders, Order, batch_size=batch_size, default_user=user
+        )
+        states = [(order.create_at, order.id_master_id, order.price) for order in created]
+        specialities = refresh_order_rollups(states)
+        leaderboards.record_orders(states, specialities)
+        bump_model_version_on_commit(Order)
+    return created, errors
+
+
+class OrderRepriceSerializer(serializers.Serializer):
+    """
+    Сериализатор массового изменения цены: ровно одно из полей
+    ``percent`` (изменение в процентах) или ``delta`` (абсолютное изменение).
+    """
+
+    percent = serializers.DecimalField(
+        max_digits=7, decimal_places=2, required=False, min_value=Decimal("-100")
+    )
+    delta = serializers.DecimalField(max_digits=10, decimal_places=0, required=False)
+
+    def validate(self, attrs):
+        if ("percent" in attrs) == ("delta" in attrs):
+            raise serializers.ValidationError("Укажите ровно одно из полей: percent или delta.")
+        return attrs
+
+
+def new_price_expression(percent=None, delta=None):
+    """
+    Возвращает SQL-выражение новой цены заказа, округлённой до целого.
+    """
+    if percent is not None:
+        factor = Decimal(1) + Decimal(percent) / Decimal(100)
+        return Round(F("price") * Value(factor))
+    return F("price") + Value(Decimal(delta))
+
+
+def bulk_change_price(queryset, percent=None, delta=None, user=None):
+    """
+    Изменяет цену всех заказов queryset'а пачками по ``REM_BULK_REPRICE_CHUNK_SIZE``.
+
+    Правило неотрицательной цены проверяется в SQL: если хотя бы один заказ
+    получил бы отрицательную цену, изменение не выполняется и возвращается
+    ``(0, число таких заказов)``. Проверка и все ``UPDATE`` выполняются в
+    одной транзакции; заказы пачки блокируются и отбираются тем же условием,
+    и история, агрегаты и рейтинги обновляются только для действительно
+    изменённых заказов. Иначе возвращается ``(число изменённых заказов, 0)``.
+    """
+    new_price = new_price_expression(percent, delta)
+    chunk_size = getattr(settings, "REM_BULK_REPRICE_CHUNK_SIZE", 500)
+    pks = queryset.order_by("pk").values_list("pk", flat=True)
+    updated, last_pk = 0, 0
+    with transaction.atomic():
+        negative = queryset.alias(new_price=new_price).filter(new_price__lt=0).count()
+        if negative:
+            return 0, negative
+
+        while True:
+            chunk = list(pks.filter(pk__gt=last_pk)[:chunk_size])
+            if not chunk:
+                break
+            last_pk = chunk[-1]
+            # Заказ, цена которого стала бы отрицательной после проверки
+            # (параллельное изменение), пропускается без записи истории
+            ids = list(
+                Order.objects.select_for_update()
+                .filter(pk__in=chunk)
+                .alias(new_price=new_price)
+                .filter(new_price__gte=0)
+                .values_list("pk", flat=True)
+            )
+            if not ids:
+                continue
+            updated += Order.objects.filter(pk__in=ids).update(
+                price=new_price, updated_at=timezone.now()
+            )
+            changed = list(Order.objects.filter(pk__in=ids))
+            Order.history.bulk_history_create(
+                changed,
+                update=True,
+                default_user=user,
+                default_change_reason="Массовое изменение цены",
+            )
+            refresh_order_rollups((order.create_at, order.id_master_id) for order in changed)
+            leaderboards.refresh_masters(
+                {order.id_master_id for order in changed}, metrics=("revenue",)
+            )
+        if updated:
+            bump_model_version_on_commit(Order)
+    return updated, 0
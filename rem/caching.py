@@ -0,0 +1,149 @@
+"""
+Этот модуль содержит версии моделей для кэширования и условных GET-запросов,
+а также счётчики попаданий и промахов кэша ответов (они же передаются
+в метрики, см. ``rem.metrics``).
+
+Версия модели — отметка времени (в наносекундах) последнего изменения
+любой её записи. Она хранится в кэше (Redis) под отдельным ключом и
+обновляется сигналами ``post_save``/``post_delete`` после фиксации
+транзакции, поэтому проверка актуальности ответа не обращается к
+таблицам модели.
+"""
+
+import time
+from functools import partial
+
+from django.core.cache import cache
+from django.db import transaction
+
+from . import metrics
+
+VERSION_KEY = "rem:version:{}"
+COUNTER_KEY = "rem:cache-stats:{}:{}"
+
+# Имена кэшируемых действий ("MasterViewSet.list"), для которых ведутся счётчики
+CACHED_ACTIONS = []
+
+
+def _version_key(model):
+    """
+    Возвращает ключ кэша с версией модели.
+    """
+    return VERSION_KEY.format(model._meta.label_lower)
+
+
+def get_model_versions(models):
+    """
+    Возвращает словарь {модель: версия} за одно обращение к кэшу.
+
+    Отсутствующие версии инициализируются текущим временем.
+    """
+    keys = {_version_key(model): model for model in models}
+    stored = cache.get_many(list(keys))
+    versions = {}
+    for key, model in keys.items():
+        version = stored.get(key)
+        if version is None:
+            version = time.time_ns()
+            if not cache.add(key, version, timeout=None):
+                version = cache.get(key) or version
+        versions[model] = version
+    return versions
+
+
+async def aget_model_versions(models):
+    """
+    Асинхронный вариант ``get_model_versions`` для ASGI-представлений.
+    """
+    keys = {_version_key(model): model for model in models}
+    stored = await cache.aget_many(list(keys))
+    versions = {}
+    for key, model in keys.items():
+        version = stored.get(key)
+        if version is None:
+            version = time.time_ns()
+            if not await cache.aadd(key, version, timeout=None):
+                version = await cache.aget(key) or version
+        versions[model] = version
+    return versions
+
+
+def get_model_version(model):
+    """
+    Возвращает версию одной модели.
+    """
+    return get_model_versions([model])[model]
+
+
+def bump_model_version(*models):
+    """
+    Обновляет версии моделей, делая недействительными связанные с ними
+    ETag и закэшированные ответы.
+    """
+    version = time.time_ns()
+    cache.set_many({_version_key(model): version for model in models}, timeout=None)
+
+
+def bump_model_version_on_commit(*models):
+    """
+    Обновляет версии моделей после фиксации текущей транзакции, чтобы
+    параллельный читатель не закэшировал состояние до изменения под новой
+    версией. Используется сигналами и массовыми операциями, которые
+    сигналов не отправляют.
+    """
+    transaction.on_commit(partial(bump_model_version, *models))
+
+
+def count_cache_event(name, event):
+    """
+    Увеличивает счётчик события кэша (``"hit"`` или ``"miss"``) действия ``name``.
+    """
+    metrics.record_cache_event(event, name)
+    key = COUNTER_KEY.format(name, event)
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+async def acount_cache_event(name, event):
+    """
+    Асинхронный вариант ``count_cache_event``.
+    """
+    metrics.record_cache_event(event, name)
+    key = COUNTER_KEY.format(name, event)
+    try:
+        await cache.aincr(key)
+    except ValueError:
+        if await cache.aadd(key, 1, timeout=None):
+            return
+        # Асинхронный aincr бэкенда выражен через aget/aset и при недоступном
+        # кэше снова не находит ключ; счётчик — не повод ломать ответ
+        try:
+            await cache.aincr(key)
+        except ValueError:
+            pass
+
+
+def get_cache_stats():
+    """
+    Возвращает счётчики попаданий и промахов по всем кэшируемым действиям.
+    """
+    keys = {
+        (name, event): COUNTER_KEY.format(name, event)
+        for name in CACHED_ACTIONS
+        for event in ("hit", "miss")
+    }
+    stored = cache.get_many(list(keys.values()))
+    stats = {}
+    for name in CACHED_ACTIONS:
+        hits = stored.get(keys[name, "hit"], 0)
+        misses = stored.get(keys[name, "miss"], 0)
+        total = hits + misses
+        stats[name] = {
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / total, 4) if total else None,
+        }
+    return stats
@@ -0,0 +1,438 @@
+"""
+Этот модуль генерирует синтетические данные для нагрузочных измерений:
+специальности, услуги, клиентов, мастеров, заказы, отзывы и записи
+истории изменений (``simple_history``).
+
+Строки вставляются пачками через ``executemany`` (``TableWriter``),
+без создания объектов моделей и без сигналов, поэтому миллионы строк
+создаются за минуты. Производные данные (рейтинги мастеров, дневные агрегаты,
+индексы поиска и автодополнения, рейтинги в Redis), которые обычно
+поддерживают сигналы, перестраиваются в конце функцией
+``rebuild_derived``.
+
+Распределения приближены к реальным: популярные мастера получают
+больше заказов, цены распределены логнормально, оценки смещены к
+высоким. Генератор детерминирован при одинаковом ``seed``.
+"""
+
+import datetime
+import logging
+import math
+import random
+from dataclasses import dataclass
+from decimal import Decimal
+
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connections, models, transaction
+from django.db.models import Max
+from django.utils import timezone
+from redis.exceptions import RedisError
+
+from .models import Client, Master, Order, Review, Service, Speciality
+
+logger = logging.getLogger(__name__)
+
+SPECIALITY_NAMES = (
+    "Электрик", "Сантехник", "Плотник", "Маляр", "Плиточник", "Штукатур",
+    "Кровельщик", "Сварщик", "Каменщик", "Столяр", "Монтажник окон",
+    "Паркетчик", "Мастер по потолкам", "Установщик дверей", "Мастер по кондиционерам",
+    "Отделочник", "Сборщик мебели", "Мастер по отоплению", "Фасадчик", "Дизайнер интерьера",
+)
+LAST_NAMES = (
+    "Иванов", "Петров", "Сидоров", "Смирнов", "Кузнецов", "Попов", "Васильев",
+    "Соколов", "Михайлов", "Новиков", "Фёдоров", "Морозов", "Волков", "Алексеев",
+    "Лебедев", "Семёнов", "Егоров", "Павлов", "Козлов", "Степанов", "Николаев",
+    "Орлов", "Андреев", "Макаров", "Никитин", "Захаров", "Зайцев", "Соловьёв",
+    "Борисов", "Яковлев", "Григорьев", "Романов", "Воробьёв", "Сергеев", "Кузьмин",
+    "Фролов", "Александров", "Дмитриев", "Королёв", "Гусев",
+)
+FIRST_NAMES = (
+    "Александр", "Сергей", "Дмитрий", "Андрей", "Алексей", "Максим", "Евгений",
+    "Иван", "Михаил", "Артём", "Николай", "Владимир", "Павел", "Роман", "Олег",
+    "Игорь", "Денис", "Константин", "Юрий", "Виктор", "Пётр", "Григорий",
+    "Антон", "Кирилл", "Степан", "Фёдор", "Георгий", "Леонид", "Тимур", "Вадим",
+)
+PATRONYMICS = (
+    "Александрович", "Сергеевич", "Дмитриевич", "Андреевич", "Алексеевич",
+    "Максимович", "Евгеньевич", "Иванович", "Михайлович", "Николаевич",
+    "Владимирович", "Павлович", "Романович", "Олегович", "Игоревич",
+    "Викторович", "Петрович", "Юрьевич", "Григорьевич", "Фёдорович",
+)
+EMAIL_DOMAINS = ("mail.ru", "yandex.ru", "gmail.com", "bk.ru", "inbox.ru", "rambler.ru")
+SERVICE_WORDS = (
+    ("Замена", "Установка", "Ремонт", "Монтаж", "Демонтаж", "Покраска", "Укладка", "Чистка"),
+    ("проводки", "розеток", "смесителя", "унитаза", "ламината", "плитки", "обоев",
+     "потолка", "окна", "двери", "радиатора", "кондиционера", "кровли", "забора"),
+)
+REVIEW_PHRASES = (
+    "Работа выполнена быстро и аккуратно.",
+    "Мастер приехал вовремя, всё объяснил.",
+    "Цена соответствует качеству.",
+    "Пришлось переделывать, но в итоге всё хорошо.",
+    "Рекомендую, обращусь ещё.",
+    "Убрал за собой мусор, спасибо.",
+    "Опоздал на час, но работу сделал хорошо.",
+    "Качество отличное, сроки соблюдены.",
+    "Не всё понравилось, есть замечания к отделке.",
+    "Очень вежливый и внимательный мастер.",
+)
+# Вероятности оценок 1–5: оценки смещены к высоким, как в реальных отзывах
+RATING_WEIGHTS = (0.04, 0.06, 0.15, 0.35, 0.40)
+
+
+@dataclass
+class DatasetSize:
+    """
+    Число создаваемых записей каждого вида. ``history_updates`` — число
+    записей истории об изменении цены на заказ (кроме записи о создании).
+    """
+
+    specialities: int = 20
+    services: int = 50
+    clients: int = 10_000
+    masters: int = 1_000
+    orders: int = 100_000
+    reviews: int = 50_000
+    history_updates: int = 1
+
+    def scaled(self, scale):
+        """
+        Возвращает размеры, умноженные на ``scale`` (кроме справочников
+        и числа изменений на заказ).
+        """
+        return DatasetSize(
+            specialities=self.specialities,
+            services=self.services,
+            clients=max(1, round(self.clients * scale)),
+            masters=max(1, round(self.masters * scale)),
+            orders=round(self.orders * scale),
+            reviews=round(self.reviews * scale),
+            history_updates=self.history_updates,
+        )
+
+
+def _unique_name(words, index):
+    """
+    Возвращает уникальное имя по номеру: сочетание слов из списков
+    ``words``, а после исчерпания сочетаний — с числовым суффиксом.
+    """
+    parts, rest = [], index
+    for choices in words:
+        rest, position = divmod(rest, len(choices))
+        parts.append(choices[position])
+    name = " ".join(parts)
+    return f"{name} {rest + 1}" if rest else name
+
+
+class TableWriter:
+    """
+    Вставляет строки таблицы модели пачками через ``executemany`` без
+    создания объектов моделей. Первичные ключи назначаются явно,
+    начиная с текущего максимума, поэтому строки истории и внешние
+    ключи ссылаются на них без чтения из базы; после вставки
+    последовательности ключей обновляются (``finish``).
+    """
+
+    def __init__(self, model, columns, batch_size):
+        self.model = model
+        self.batch_size = batch_size
+        # Само соединение, а не прокси ``django.db.connection``: обращение
+        # к прокси на каждое значение заметно в профиле
+        self.connection = connections[DEFAULT_DB_ALIAS]
+        self.rows = []
+        self.count = 0
+        fields = {field.attname: field for field in model._meta.concrete_fields}
+        # Колонки, не переданные явно, получают значения по умолчанию модели
+        defaults = [
+            name for name, field in fields.items()
+            if name not in columns and field.has_default()
+        ]
+        self.defaults = tuple(fields[name].get_default() for name in defaults)
+        columns = (*columns, *defaults)
+        quote = self.connection.ops.quote_name
+        self.sql = (
+            f"INSERT INTO {quote(model._meta.db_table)} "
+            f"({', '.join(quote(fields[name].column) for name in columns)}) "
+            f"VALUES ({', '.join(['%s'] * len(columns))})"
+        )
+        # Приведение к виду базы нужно только датам и десятичным числам
+        self.prepare = [
+            fields[name].get_db_prep_save
+            if isinstance(fields[name], (models.DateTimeField, models.DecimalField))
+            else None
+            for name in columns
+        ]
+        self.next_id = (model.objects.aggregate(last=Max("pk"))["last"] or 0) + 1
+
+    def allocate(self):
+        """
+        Возвращает первичный ключ следующей строки.
+        """
+        pk, self.next_id = self.next_id, self.next_id + 1
+        return pk
+
+    def add(self, row):
+        """
+        Добавляет строку (значения в порядке колонок, без колонок со
+        значениями по умолчанию); полная пачка записывается сразу.
+        """
+        self.rows.append(
+            tuple(
+                value if prepare is None else prepare(value, self.connection)
+                for prepare, value in zip(self.prepare, (*row, *self.defaults))
+            )
+        )
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Записывает накопленные строки одной транзакцией.
+        """
+        if not self.rows:
+            return
+        with transaction.atomic(), self.connection.cursor() as cursor:
+            cursor.executemany(self.sql, self.rows)
+        self.count += len(self.rows)
+        self.rows = []
+
+    def finish(self):
+        """
+        Записывает остаток строк и обновляет последовательность ключей.
+        """
+        self.flush()
+        statements = self.connection.ops.sequence_reset_sql(no_style(), [self.model])
+        if statements:
+            with self.connection.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
+        return self.count
+
+
+class DataGenerator:
+    """
+    Генератор набора данных. Для моделей с историей вместе со строкой
+    создаётся запись истории о создании, для заказов — ещё
+    ``history_updates`` записей об изменении цены.
+    """
+
+    def __init__(self, size, days=365, seed=0, batch_size=5000, with_history=True):
+        self.size = size
+        self.days = days
+        self.random = random.Random(seed)
+        self.batch_size = batch_size
+        self.with_history = with_history
+        self.now = timezone.now()
+        self.writers = {}
+
+    def random_moment(self):
+        """
+        Возвращает случайный момент за последние ``days`` дней.
+        """
+        return self.now - datetime.timedelta(seconds=self.random.uniform(0, self.days * 86400))
+
+    def writer(self, model, columns):
+        """
+        Возвращает вставку строк модели (и её истории) с колонками ``columns``;
+        первая колонка — первичный ключ.
+        """
+        if model not in self.writers:
+            history = None
+            if self.with_history and hasattr(model, "history"):
+                history = TableWriter(
+                    model.history.model,
+                    ("history_id", *columns, "history_date", "history_type"),
+                    self.batch_size,
+                )
+            self.writers[model] = (TableWriter(model, columns, self.batch_size), history)
+        return self.writers[model]
+
+    def flush(self, model):
+        """
+        Записывает накопленные строки модели.
+        """
+        if model in self.writers:
+            self.writers[model][0].flush()
+
+    def add(self, model, columns, values, history_date=None, versions=()):
+        """
+        Добавляет строку модели со значениями ``values`` (без первичного
+        ключа) и возвращает её ключ. Запись истории о создании датируется
+        ``history_date``; ``versions`` — пары (дата, значения) последующих
+        изменений.
+        """
+        table, history = self.writer(model, ("id", *columns))
+        pk = table.allocate()
+        table.add((pk, *values))
+        if history is not None:
+            history.add((history.allocate(), pk, *values, history_date or self.now, "+"))
+            for moment, changed in versions:
+                history.add((history.allocate(), pk, *changed, moment, "~"))
+        return pk
+
+    def generate(self):
+        """
+        Создаёт весь набор данных и возвращает словарь {вид: число записей}.
+        Имена продолжают нумерацию уже существующих записей, поэтому
+        генератор можно запускать повторно.
+        """
+        offset = Speciality.objects.count()
+        for index in range(self.size.specialities):
+            self.add(Speciality, ("name",), (_unique_name((SPECIALITY_NAMES,), offset + index),))
+        # Внешние ключи проверяются при фиксации: справочник записывается
+        # до строк, которые на него ссылаются
+        self.flush(Speciality)
+        speciality_ids = list(Speciality.objects.values_list("pk", flat=True))
+
+        offset = Service.objects.count()
+        for index in range(self.size.services):
+            self.add(
+                Service,
+                ("name", "description"),
+                (_unique_name(SERVICE_WORDS, offset + index), self.random.choice(REVIEW_PHRASES)),
+            )
+
+        client_ids = self._clients(Client.objects.count())
+        master_ids = self._masters(Master.objects.count(), speciality_ids)
+        self._orders(client_ids, master_ids)
+        self._reviews(client_ids, master_ids)
+
+        counts = {}
+        for model, (table, history) in self.writers.items():
+            counts[model._meta.model_name] = table.finish()
+            if history is not None:
+                counts[history.model._meta.model_name] = history.finish()
+        return counts
+
+    def _clients(self, offset):
+        """
+        Создаёт клиентов и возвращает id всех клиентов.
+        """
+        for index in range(offset, offset + self.size.clients):
+            created_at = self.random_moment()
+            self.add(
+                Client,
+                ("full_name", "email", "created_at"),
+                (
+                    _unique_name((LAST_NAMES, FIRST_NAMES, PATRONYMICS), index),
+                    f"client{index}@{self.random.choice(EMAIL_DOMAINS)}",
+                    created_at,
+                ),
+                history_date=created_at,
+            )
+        self.flush(Client)
+        logger.info("Клиенты: %s", self.size.clients)
+        return list(Client.objects.values_list("pk", flat=True))
+
+    def _masters(self, offset, speciality_ids):
+        """
+        Создаёт мастеров (рейтинги вычисляет ``rebuild_derived``) и
+        возвращает id всех мастеров.
+        """
+        for index in range(offset, offset + self.size.masters):
+            self.add(
+                Master,
+                ("full_name", "speciality_id", "description", "rating"),
+                (
+                    # Слова имени мастера идут в другом порядке, чтобы имена
+                    # не совпадали с именами клиентов
+                    _unique_name((FIRST_NAMES, PATRONYMICS, LAST_NAMES), index),
+                    self.random.choice(speciality_ids),
+                    self.random.choice(REVIEW_PHRASES),
+                    Decimal(0),
+                ),
+            )
+        self.flush(Master)
+        logger.info("Мастера: %s", self.size.masters)
+        return list(Master.objects.values_list("pk", flat=True))
+
+    def _skewed(self, ids):
+        """
+        Возвращает случайный id со смещением к началу списка: первые
+        записи (популярные мастера, постоянные клиенты) выбираются чаще.
+        """
+        return ids[int(len(ids) * self.random.random() ** 2)]
+
+    def _price(self, base=None):
+        """
+        Возвращает цену, кратную 100: логнормальную или изменённую ``base``.
+        """
+        if base is None:
+            value = math.exp(self.random.gauss(8, 0.8))
+        else:
+            value = float(base) * self.random.uniform(0.8, 1.3)
+        return Decimal(max(100, round(value, -2)))
+
+    def _orders(self, client_ids, master_ids):
+        """
+        Создаёт заказы с историей изменений цены. Версии вычисляются до
+        вставки, и заказ сохраняется сразу в последней версии.
+        """
+        columns = ("number", "id_user_id", "id_master_id", "create_at", "updated_at", "price")
+        updates = self.size.history_updates if self.with_history else 0
+        for index in range(self.size.orders):
+            number = Decimal(index % 1000)
+            client_id, master_id = self._skewed(client_ids), self._skewed(master_ids)
+            create_at = updated_at = self.random_moment()
+            price = self._price()
+            first = (number, client_id, master_id, create_at, updated_at, price)
+            versions = []
+            for _ in range(updates):
+                updated_at = min(self.now, updated_at + datetime.timedelta(hours=self.random.uniform(1, 72)))
+                price = self._price(price)
+                versions.append((updated_at, (number, client_id, master_id, create_at, updated_at, price)))
+            if versions:
+                # История хранит первую версию, таблица — последнюю
+                current = versions[-1][1]
+                table, history = self.writer(Order, ("id", *columns))
+                pk = table.allocate()
+                table.add((pk, *current))
+                history.add((history.allocate(), pk, *first, create_at, "+"))
+                for moment, values in versions:
+                    history.add((history.allocate(), pk, *values, moment, "~"))
+            else:
+                self.add(Order, columns, first, history_date=create_at)
+            if (index + 1) % 100_000 == 0:
+                logger.info("Заказы: %s", index + 1)
+
+    def _reviews(self, client_ids, master_ids):
+        ratings = self.random.choices(range(1, 6), RATING_WEIGHTS, k=self.size.reviews)
+        for index, rating in enumerate(ratings):
+            self.add(
+                Review,
+                ("client_id", "master_id", "rating", "comment", "created_at"),
+                (
+                    self._skewed(client_ids),
+                    self._skewed(master_ids),
+                    Decimal(rating),
+                    " ".join(self.random.sample(REVIEW_PHRASES, 2)),
+                    self.random_moment(),
+                ),
+            )
+            if (index + 1) % 100_000 == 0:
+                logger.info("Отзывы: %s", index + 1)
+
+
+def rebuild_derived():
+    """
+    Перестраивает данные, которые поддерживаются сигналами и не
+    обновляются при вставке ``TableWriter``, и возвращает словарь {вид: результат}.
+    """
+    from . import autocomplete, leaderboards, rollups, search
+    from .ratings import recompute_master_ratings
+
+    result = {}
+    with transaction.atomic():
+        result["ratings"] = recompute_master_ratings(Master.objects.all())
+    with transaction.atomic():
+        result["rollups"] = rollups.rebuild_rollups()
+    with transaction.atomic():
+        result["search"] = search.rebuild_search_index()
+    with transaction.atomic():
+        result["autocomplete"] = autocomplete.rebuild_autocomplete()
+    try:
+        result["leaderboards"] = leaderboards.rebuild_leaderboards()
+    except (leaderboards.LeaderboardUnavailable, RedisError) as exc:
+        result["leaderboards"] = None
+        logger.warning("Рейтинги мастеров в Redis не перестроены: %s", exc)
+    return result
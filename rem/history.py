@@ -0,0 +1,401 @@
+"""
+Этот модуль содержит историю изменений моделей (``simple_history``):
+подкласс ``HistoricalRecords`` с индексом для чтения истории объекта,
+удаление записей истории без изменений и архивирование записей старше
+срока хранения.
+
+Срок хранения задаётся настройкой ``REM_HISTORY_RETENTION``:
+{метка модели: дней}, ``None`` — хранить всегда. Записи старше срока
+пачками по ``REM_HISTORY_BATCH_SIZE`` дописываются в архив —
+gzip-файл JSON Lines в каталоге ``REM_HISTORY_ARCHIVE_DIR`` (каждая
+пачка — отдельный член gzip, файл читается ``gzip.open`` целиком) — и
+после записи на диск удаляются из таблицы, каждая пачка в своей
+транзакции. Если процесс прервётся между записью и удалением, пачка
+попадёт в архив повторно при следующем запуске: архив не теряет строк.
+
+Для моделей из ``REM_DEFERRED_HISTORY`` запись истории может быть
+отложена: внутри ``deferred_history()`` (``DeferredHistoryMiddleware``
+включает его на время запроса) записи копятся в памяти после фиксации
+транзакции, в которой сохранён объект, и пишутся одним ``bulk_create``
+при выходе из блока. При ``REM_DEFERRED_HISTORY_COLLAPSE`` несколько
+изменений одного объекта дают одну запись с последним состоянием.
+Оба режима по умолчанию выключены. До выхода из блока отложенные
+записи в истории не видны; записи откатившихся транзакций не попадают
+в историю, как и без отсрочки; записи транзакций, зафиксированных
+после выхода из блока, пишутся сразу при фиксации.
+"""
+
+import contextlib
+import contextvars
+import datetime
+import gzip
+import json
+import logging
+import os
+from functools import partial
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.utils import timezone
+from simple_history.models import HistoricalRecords
+from simple_history.signals import (
+    post_create_historical_record,
+    pre_create_historical_record,
+)
+
+logger = logging.getLogger(__name__)
+
+# Служебные поля записи истории, не входящие в состояние объекта
+HISTORY_FIELDS = {
+    "history_id",
+    "history_date",
+    "history_change_reason",
+    "history_type",
+    "history_user",
+}
+
+# Буфер отложенных записей истории текущего запроса или блока
+_deferred = contextvars.ContextVar("rem_deferred_history", default=None)
+
+
+class IndexedHistoricalRecords(HistoricalRecords):
+    """
+    ``HistoricalRecords`` с составным индексом (id объекта, дата записи):
+    история объекта и его последние изменения читаются по индексу без
+    сортировки. Отдельный индекс по id объекта при этом не нужен.
+
+    Для моделей из ``REM_DEFERRED_HISTORY`` внутри ``deferred_history()``
+    записи истории откладываются в буфер вместо вставки при сохранении.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault("no_db_index", ["id"])
+        super().__init__(**kwargs)
+
+    def get_meta_options(self, model):
+        options = super().get_meta_options(model)
+        options["indexes"] = (
+            *options.get("indexes", ()),
+            models.Index(
+                fields=(model._meta.pk.attname, "history_date"),
+                name=f"rem_hist_{model._meta.model_name}_id_date",
+            ),
+        )
+        return options
+
+    def create_historical_record(self, instance, history_type, using=None):
+        buffer = _deferred.get()
+        if buffer is None or self.m2m_fields or not is_deferred(instance):
+            return super().create_historical_record(instance, history_type, using=using)
+
+        # Как в HistoricalRecords.create_historical_record, но без save():
+        # запись попадает в буфер после фиксации транзакции объекта
+        alias = using
+        using = using if self.use_base_model_db else None
+        history_date = getattr(instance, "_history_date", timezone.now())
+        history_user = self.get_history_user(instance)
+        history_change_reason = self.get_change_reason_for_object(instance, history_type, using)
+        manager = getattr(instance, self.manager_name)
+        attrs = {field.attname: getattr(instance, field.attname) for field in self.fields_included(instance)}
+        if getattr(manager.model, "history_relation", None) is not None:
+            attrs["history_relation"] = instance
+        history_instance = manager.model(
+            history_date=history_date,
+            history_type=history_type,
+            history_user=history_user,
+            history_change_reason=history_change_reason,
+            **attrs,
+        )
+        pre_create_historical_record.send(
+            sender=manager.model,
+            instance=instance,
+            history_date=history_date,
+            history_user=history_user,
+            history_change_reason=history_change_reason,
+            history_instance=history_instance,
+            using=using,
+        )
+        transaction.on_commit(
+            partial(buffer.add, instance, history_instance, using), using=alias
+        )
+
+
+def is_deferred(instance):
+    """
+    Возвращает ``True``, если запись истории модели объекта откладывается.
+    """
+    return instance._meta.label in getattr(settings, "REM_DEFERRED_HISTORY", ())
+
+
+class HistoryBuffer:
+    """
+    Отложенные записи истории в порядке фиксации транзакций.
+    """
+
+    def __init__(self, collapse=False):
+        self.collapse = collapse
+        self.closed = False
+        self.entries = []
+        # (модель истории, база, id объекта) -> индекс последней записи
+        # объекта, которую можно заменить
+        self.latest = {}
+
+    def add(self, instance, history_instance, using):
+        """
+        Добавляет запись истории; при ``collapse`` изменение объекта
+        заменяет его предыдущую запись создания или изменения, сохраняя
+        её тип.
+        """
+        if self.closed:
+            # Транзакция зафиксирована после выхода из блока (внешний
+            # atomic): запись пишется сразу, а не в уже записанный буфер
+            self.write([(instance, history_instance, using)])
+            return
+        key = (type(history_instance), using, instance.pk)
+        index = self.latest.get(key) if self.collapse else None
+        if index is not None and history_instance.history_type == "~":
+            _, previous, _ = self.entries[index]
+            history_instance.history_type = previous.history_type
+            self.entries[index] = (instance, history_instance, using)
+            return
+        if history_instance.history_type == "-":
+            self.latest.pop(key, None)
+        else:
+            self.latest[key] = len(self.entries)
+        self.entries.append((instance, history_instance, using))
+
+    def close(self):
+        """
+        Закрывает буфер и записывает накопленные записи. Записи,
+        добавленные после закрытия, пишутся сразу.
+        """
+        self.closed = True
+        entries, self.entries, self.latest = self.entries, [], {}
+        return self.write(entries)
+
+    def write(self, entries):
+        """
+        Вставляет записи одним ``bulk_create`` на модель истории и базу и
+        возвращает их число. Изменения объектов к этому моменту уже
+        зафиксированы, поэтому ошибка записи истории попадает в лог и не
+        превращает успешный запрос в ошибку.
+        """
+        groups = {}
+        for entry in entries:
+            _, history_instance, using = entry
+            groups.setdefault((type(history_instance), using), []).append(entry)
+        written = 0
+        for (historical, using), group in groups.items():
+            try:
+                with transaction.atomic(using=using):
+                    historical.objects.using(using).bulk_create([entry[1] for entry in group])
+            except Exception:
+                logger.exception("Отложенные записи истории %s не записаны", historical._meta.label)
+                continue
+            written += len(group)
+            for instance, history_instance, _ in group:
+                post_create_historical_record.send(
+                    sender=historical,
+                    instance=instance,
+                    history_instance=history_instance,
+                    history_date=history_instance.history_date,
+                    history_user=history_instance.history_user,
+                    history_change_reason=history_instance.history_change_reason,
+                    using=using,
+                )
+        return written
+
+
+@contextlib.contextmanager
+def deferred_history(collapse=None):
+    """
+    Откладывает запись истории моделей из ``REM_DEFERRED_HISTORY`` до
+    выхода из блока. Вложенный блок использует буфер внешнего.
+    """
+    if _deferred.get() is not None:
+        yield _deferred.get()
+        return
+    if collapse is None:
+        collapse = getattr(settings, "REM_DEFERRED_HISTORY_COLLAPSE", False)
+    buffer = HistoryBuffer(collapse)
+    token = _deferred.set(buffer)
+    try:
+        yield buffer
+    finally:
+        _deferred.reset(token)
+        buffer.close()
+
+
+class DeferredHistoryMiddleware:
+    """
+    Промежуточный слой, откладывающий запись истории моделей из
+    ``REM_DEFERRED_HISTORY`` до конца запроса. Ставится после
+    ``HistoryRequestMiddleware``, чтобы в отложенных записях был
+    пользователь запроса.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, "REM_DEFERRED_HISTORY", ()):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with deferred_history():
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        buffer = HistoryBuffer(getattr(settings, "REM_DEFERRED_HISTORY_COLLAPSE", False))
+        token = _deferred.set(buffer)
+        try:
+            return await self.get_response(request)
+        finally:
+            _deferred.reset(token)
+            await sync_to_async(buffer.close)()
+
+
+def get_retention():
+    """
+    Возвращает словарь {модель с историей: срок хранения в днях}.
+    """
+    retention = {}
+    for label, days in getattr(settings, "REM_HISTORY_RETENTION", {}).items():
+        retention[apps.get_model(label)] = days
+    return retention
+
+
+def state_fields(model):
+    """
+    Возвращает имена полей состояния объекта в модели истории ``model``.
+    """
+    return [
+        field.attname
+        for field in model.history.model._meta.concrete_fields
+        if field.name not in HISTORY_FIELDS
+    ]
+
+
+def deduplicate_history(model, since=None, batch_size=1000):
+    """
+    Удаляет записи истории об изменении (``~``), в которых состояние
+    объекта совпадает с предыдущей записью того же объекта, и возвращает
+    число удалённых записей. ``since`` ограничивает проверку записями
+    не старше этой даты; первая запись объекта в окне не удаляется,
+    так как предыдущая запись не проверяется.
+    """
+    historical = model.history.model
+    fields = state_fields(model)
+    rows = historical.objects.order_by(model._meta.pk.attname, "history_date", "history_id")
+    if since is not None:
+        rows = rows.filter(history_date__gte=since)
+    rows = rows.values_list("history_id", "history_type", *fields).iterator(chunk_size=batch_size)
+
+    deleted, duplicates, previous = 0, [], None
+    for history_id, history_type, *state in rows:
+        # Первое поле состояния — id объекта: запись другого объекта
+        # никогда не совпадёт с предыдущей
+        if history_type == "~" and state == previous:
+            duplicates.append(history_id)
+            if len(duplicates) >= batch_size:
+                deleted += _delete(historical, duplicates)
+                duplicates = []
+        previous = state
+    return deleted + _delete(historical, duplicates)
+
+
+def _delete(historical, history_ids):
+    """
+    Удаляет записи истории по ``history_id`` и возвращает их число.
+    """
+    if not history_ids:
+        return 0
+    with transaction.atomic():
+        return historical.objects.filter(history_id__in=history_ids).delete()[0]
+
+
+def archive_path(model, now=None):
+    """
+    Возвращает путь файла архива истории модели для текущего запуска.
+    """
+    now = now or timezone.now()
+    directory = Path(getattr(settings, "REM_HISTORY_ARCHIVE_DIR", "history_archive"))
+    return directory / model._meta.label_lower / f"{now:%Y%m%d-%H%M%S}.jsonl.gz"
+
+
+def archive_history(model, days, batch_size=1000, max_batches=None, now=None):
+    """
+    Архивирует и удаляет записи истории модели старше ``days`` дней.
+    Возвращает пару (число архивированных записей, ``True``, если
+    устаревших записей не осталось). ``max_batches`` ограничивает работу
+    одного вызова.
+    """
+    now = now or timezone.now()
+    historical = model.history.model
+    expired = historical.objects.filter(
+        history_date__lt=now - datetime.timedelta(days=days)
+    ).order_by("history_id")
+    path = archive_path(model, now)
+    archived, batches = 0, 0
+    while max_batches is None or batches < max_batches:
+        rows = list(expired.values()[:batch_size])
+        if not rows:
+            return archived, True
+        _append_archive(path, rows)
+        history_ids = [row["history_id"] for row in rows]
+        with transaction.atomic():
+            historical.objects.filter(history_id__in=history_ids).delete()
+        archived += len(rows)
+        batches += 1
+        logger.info("История %s: архивировано %s записей", model._meta.label, archived)
+    return archived, not expired.exists()
+
+
+def _append_archive(path, rows):
+    """
+    Дописывает строки в архив отдельным членом gzip и сбрасывает файл
+    на диск до удаления строк из базы.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    content = "".join(json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + "\n" for row in rows)
+    with open(path, "ab") as archive:
+        archive.write(gzip.compress(content.encode("utf-8")))
+        archive.flush()
+        os.fsync(archive.fileno())
+
+
+def compact_history(targets=None, batch_size=None, max_batches=None, deduplicate_days=None):
+    """
+    Удаляет записи истории без изменений и архивирует устаревшие записи
+    моделей ``targets`` (по умолчанию — из ``REM_HISTORY_RETENTION``).
+    Возвращает пару: словарь {метка модели: {"deduplicated", "archived"}}
+    и ``True``, если устаревших записей не осталось.
+    """
+    batch_size = batch_size or getattr(settings, "REM_HISTORY_BATCH_SIZE", 1000)
+    retention = get_retention()
+    since = None
+    if deduplicate_days is not None:
+        since = timezone.now() - datetime.timedelta(days=deduplicate_days)
+
+    result, done = {}, True
+    for model in targets or retention:
+        deduplicated = deduplicate_history(model, since=since, batch_size=batch_size)
+        archived = 0
+        days = retention.get(model)
+        if days is not None:
+            archived, model_done = archive_history(
+                model, days, batch_size=batch_size, max_batches=max_batches
+            )
+            done = done and model_done
+        result[model._meta.label] = {"deduplicated": deduplicated, "archived": archived}
+    return result, done
@@ -0,0 +1,353 @@
+"""
+Этот модуль содержит рейтинги (leaderboards) мастеров по специальностям,
+хранящиеся в Redis в виде упорядоченных множеств (sorted sets).
+
+Для каждой специальности и метрики (``rating`` — рейтинг, ``orders`` —
+количество заказов, ``revenue`` — выручка) ведётся множество
+``rem:leaderboard:<метрика>:<id специальности>`` с id мастеров и их
+значениями. Первые N мастеров (``ZREVRANGE``) и место мастера
+(``ZCOUNT``) получаются за O(log n) без обращения к таблицам. Мастера с
+равными значениями упорядочиваются по id, как и при чтении из базы
+(Redis упорядочил бы их по строкам id в обратном порядке).
+
+Множества обновляются после фиксации транзакций при записи мастеров,
+заказов и отзывов; ``rebuild_leaderboards`` перестраивает их по базе и
+ставит отметку ``rem:leaderboard:built``. Если кэш — не Redis или Redis
+недоступен, изменения пропускаются (их исправит перестройка), а чтение
+выполняется запросом к базе. Без отметки (рейтинги ещё не построены,
+Redis очищен) множества неполны: чтение тоже выполняется из базы, а
+перестройка ставится в очередь задач.
+"""
+
+import logging
+from collections import defaultdict
+from functools import partial
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+from .models import Master
+
+logger = logging.getLogger(__name__)
+
+LEADERBOARD_KEY = "rem:leaderboard:{}:{}"
+# Отметка построенных рейтингов и блокировка повторной постановки перестройки
+BUILT_KEY = "rem:leaderboard:built"
+REBUILD_SCHEDULED_KEY = "rem:leaderboard:rebuild-scheduled"
+REBUILD_SCHEDULE_TIMEOUT = 300
+METRICS = ("rating", "orders", "revenue")
+
+# Выражения метрик для чтения из базы и перестройки
+METRIC_EXPRESSIONS = {
+    "rating": lambda: Coalesce("rating", Value(0), output_field=DecimalField()),
+    "orders": lambda: Count("order"),
+    "revenue": lambda: Coalesce(Sum("order__price"), Value(0), output_field=DecimalField()),
+}
+
+
+class LeaderboardUnavailable(Exception):
+    """
+    Исключение: хранилище рейтингов (Redis) недоступно.
+    """
+
+
+def leaderboard_key(metric, speciality_id):
+    """
+    Возвращает ключ множества рейтинга специальности по метрике.
+    """
+    return LEADERBOARD_KEY.format(metric, speciality_id)
+
+
+def get_connection():
+    """
+    Возвращает соединение с Redis кэша по умолчанию или выбрасывает
+    ``LeaderboardUnavailable``, если кэш — не Redis.
+    """
+    try:
+        return get_redis_connection("default")
+    except NotImplementedError:
+        raise LeaderboardUnavailable("Кэш по умолчанию не является Redis.")
+
+
+def _execute(build):
+    """
+    Выполняет команды, добавленные ``build`` в конвейер Redis.
+    Ошибки хранилища записываются в лог: расхождение исправит перестройка.
+    """
+    try:
+        pipeline = get_connection().pipeline(transaction=False)
+        build(pipeline)
+        pipeline.execute()
+    except LeaderboardUnavailable as exc:
+        # Кэш — не Redis (разработка, тесты): рейтинги не ведутся вовсе
+        logger.debug("Рейтинги мастеров не обновлены: %s", exc)
+    except RedisError as exc:
+        logger.warning("Рейтинги мастеров не обновлены: %s", exc)
+
+
+def _on_commit(build):
+    """
+    Выполняет команды Redis после фиксации текущей транзакции.
+    """
+    transaction.on_commit(partial(_execute, build))
+
+
+def record_order_change(old, new, specialities):
+    """
+    Применяет изменение заказа из состояния ``old`` в ``new``
+    (id мастера вторым, цена третьим элементом) к метрикам ``orders`` и
+    ``revenue``. ``specialities`` — словарь {id мастера: id специальности}.
+    """
+    if old == new:
+        return
+    changes = defaultdict(int), defaultdict(int)
+    for sign, state in ((-1, old), (1, new)):
+        if state is None or state[1] not in specialities:
+            continue
+        member = (specialities[state[1]], state[1])
+        changes[0][member] += sign
+        changes[1][member] += sign * float(state[2])
+    _record(changes)
+
+
+def record_orders(states, specialities):
+    """
+    Добавляет созданные заказы (id мастера вторым, цена третьим элементом)
+    к метрикам ``orders`` и ``revenue``.
+    """
+    changes = defaultdict(int), defaultdict(int)
+    for state in states:
+        if state[1] in specialities:
+            member = (specialities[state[1]], state[1])
+            changes[0][member] += 1
+            changes[1][member] += float(state[2])
+    _record(changes)
+
+
+def _record(changes):
+    """
+    Планирует ``ZINCRBY`` для изменений метрик ``orders`` и ``revenue``.
+    """
+    orders, revenue = changes
+
+    def build(pipeline):
+        for metric, values in (("orders", orders), ("revenue", revenue)):
+            for (speciality_id, master_id), amount in values.items():
+                if amount:
+                    pipeline.zincrby(leaderboard_key(metric, speciality_id), amount, master_id)
+
+    if any(orders.values()) or any(revenue.values()):
+        _on_commit(build)
+
+
+def record_master(master_id, speciality_id, rating, old_speciality_id=None):
+    """
+    Обновляет рейтинг мастера в множестве его специальности; при смене
+    специальности переносит все метрики мастера в новые множества.
+    """
+
+    def build(pipeline):
+        if old_speciality_id is not None and old_speciality_id != speciality_id:
+            connection = get_connection()
+            for metric in ("orders", "revenue"):
+                score = connection.zscore(leaderboard_key(metric, old_speciality_id), master_id)
+                pipeline.zrem(leaderboard_key(metric, old_speciality_id), master_id)
+                pipeline.zadd(leaderboard_key(metric, speciality_id), {master_id: score or 0})
+            pipeline.zrem(leaderboard_key("rating", old_speciality_id), master_id)
+        else:
+            for metric in ("orders", "revenue"):
+                pipeline.zadd(leaderboard_key(metric, speciality_id), {master_id: 0}, nx=True)
+        pipeline.zadd(leaderboard_key("rating", speciality_id), {master_id: float(rating)})
+
+    _on_commit(build)
+
+
+def remove_master(master_id, speciality_id):
+    """
+    Удаляет мастера из множеств его специальности.
+    """
+
+    def build(pipeline):
+        for metric in METRICS:
+            pipeline.zrem(leaderboard_key(metric, speciality_id), master_id)
+
+    _on_commit(build)
+
+
+def refresh_masters(master_ids, metrics=METRICS):
+    """
+    Перечитывает из базы метрики мастеров и записывает их в множества
+    после фиксации транзакции. Используется после изменений, выполненных
+    ``UPDATE`` без сигналов (рейтинг по отзывам, массовое изменение цен).
+
+    Значения читаются сразу, а не после фиксации: иначе в них попали бы
+    и последующие изменения транзакции, которые применятся к множествам
+    своими командами.
+    """
+    master_ids = set(master_ids)
+    if not master_ids:
+        return
+    try:
+        get_connection()
+    except LeaderboardUnavailable:
+        return
+    rows = list(
+        Master.objects.filter(pk__in=master_ids)
+        .values("pk", "speciality_id")
+        .annotate(**{metric: METRIC_EXPRESSIONS[metric]() for metric in metrics})
+    )
+
+    def build(pipeline):
+        for row in rows:
+            for metric in metrics:
+                pipeline.zadd(
+                    leaderboard_key(metric, row["speciality_id"]),
+                    {row["pk"]: float(row[metric])},
+                )
+
+    _on_commit(build)
+
+
+def rebuild_leaderboards():
+    """
+    Перестраивает все множества по базе и возвращает число мастеров.
+
+    Множества собираются во временных ключах и заменяют рабочие командой
+    ``RENAME``, поэтому читатели не видят частично заполненных рейтингов.
+    """
+    connection = get_connection()
+    rows = Master.objects.values("pk", "speciality_id").annotate(
+        **{metric: METRIC_EXPRESSIONS[metric]() for metric in METRICS}
+    )
+    boards = defaultdict(dict)
+    count = 0
+    for row in rows.iterator():
+        count += 1
+        for metric in METRICS:
+            boards[leaderboard_key(metric, row["speciality_id"])][row["pk"]] = float(row[metric])
+
+    stale = set(connection.scan_iter(match=LEADERBOARD_KEY.format("*", "*")))
+    pipeline = connection.pipeline(transaction=True)
+    for key, members in boards.items():
+        temporary = f"{key}:rebuild"
+        pipeline.delete(temporary)
+        pipeline.zadd(temporary, members)
+        pipeline.rename(temporary, key)
+    for key in stale:
+        key = key.decode() if isinstance(key, bytes) else key
+        if key not in boards:
+            pipeline.delete(key)
+    pipeline.set(BUILT_KEY, 1)
+    pipeline.delete(REBUILD_SCHEDULED_KEY)
+    pipeline.execute()
+    return count
+
+
+def _read(build):
+    """
+    Выполняет команды чтения, добавленные ``build`` в конвейер Redis, и
+    возвращает их результаты. Если рейтинги ещё не построены, ставит
+    перестройку в очередь и выбрасывает ``LeaderboardUnavailable``.
+    """
+    connection = get_connection()
+
+    def read(pipeline):
+        pipeline.exists(BUILT_KEY)
+        build(pipeline)
+
+    built, *results = _query(connection, read)
+    if not built:
+        schedule_rebuild(connection)
+        raise LeaderboardUnavailable("Рейтинги мастеров ещё не построены.")
+    return results
+
+
+def _query(connection, build):
+    """
+    Выполняет команды чтения, добавленные ``build`` в конвейер Redis, и
+    возвращает их результаты; ошибка Redis — ``LeaderboardUnavailable``.
+    """
+    try:
+        pipeline = connection.pipeline(transaction=False)
+        build(pipeline)
+        return pipeline.execute()
+    except RedisError as exc:
+        raise LeaderboardUnavailable(str(exc))
+
+
+def schedule_rebuild(connection):
+    """
+    Ставит задачу ``rebuild_leaderboards`` в очередь не чаще раза в
+    ``REBUILD_SCHEDULE_TIMEOUT`` секунд.
+    """
+    from .tasks import rebuild_leaderboards as rebuild_task
+
+    try:
+        if not connection.set(REBUILD_SCHEDULED_KEY, 1, nx=True, ex=REBUILD_SCHEDULE_TIMEOUT):
+            return
+        rebuild_task.delay()
+    except Exception as exc:
+        logger.warning("Перестройка рейтингов мастеров не запланирована: %s", exc)
+
+
+def top_masters(speciality_id, metric, limit):
+    """
+    Возвращает список пар (id мастера, значение) первых ``limit`` мастеров
+    специальности по метрике, начиная с лучшего.
+    """
+    key = leaderboard_key(metric, speciality_id)
+    (members,) = _read(lambda pipeline: pipeline.zrevrange(key, 0, limit - 1, withscores=True))
+    top = [(int(member), score) for member, score in members]
+    if len(top) == limit:
+        # Мастера с последним значением могут не поместиться все: они
+        # дочитываются и отбираются по id
+        last = top[-1][1]
+        (tied,) = _query(
+            get_connection(), lambda pipeline: pipeline.zrangebyscore(key, last, last, withscores=True)
+        )
+        top = [item for item in top if item[1] > last]
+        top += [(int(member), score) for member, score in tied]
+    return sorted(top, key=lambda item: (-item[1], item[0]))[:limit]
+
+
+def master_rank(speciality_id, metric, master_id):
+    """
+    Возвращает пару (место начиная с 1, значение) мастера или ``None``,
+    если мастера нет в рейтинге.
+    """
+    key = leaderboard_key(metric, speciality_id)
+    (score,) = _read(lambda pipeline: pipeline.zscore(key, master_id))
+    if score is None:
+        return None
+
+    def build(pipeline):
+        pipeline.zcount(key, f"({score!r}", "+inf")
+        pipeline.zrangebyscore(key, score, score)
+
+    ahead, tied = _query(get_connection(), build)
+    ahead += sum(1 for member in tied if int(member) < master_id)
+    return ahead + 1, score
+
+
+def ranked_masters(queryset, metric):
+    """
+    Возвращает queryset мастеров с аннотацией ``score`` по метрике,
+    упорядоченный от лучшего. Используется, когда Redis недоступен.
+    """
+    return queryset.annotate(score=METRIC_EXPRESSIONS[metric]()).order_by("-score", "id")
+
+
+def master_rank_in(queryset, metric, master_id):
+    """
+    Возвращает пару (место начиная с 1, значение) мастера среди мастеров
+    queryset'а, вычисленную запросами к базе, или ``None``.
+    """
+    ranked = ranked_masters(queryset.order_by(), metric)
+    score = ranked.filter(pk=master_id).values_list("score", flat=True).first()
+    if score is None:
+        return None
+    ahead = ranked.filter(Q(score__gt=score) | Q(score=score, pk__lt=master_id)).count()
+    return ahead + 1, float(score)
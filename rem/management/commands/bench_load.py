@@ -0,0 +1,101 @@
+"""
+Команда для нагрузочного сравнения синхронного (WSGI) и асинхронного (ASGI)
+путей чтения API.
+"""
+
+import statistics
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+DEFAULT_PATHS = ("masters/", "orders/", "reviews/")
+
+
+class Command(BaseCommand):
+    """
+    Отправляет запросы к запущенным серверам с заданной конкурентностью и
+    выводит пропускную способность, p50/p99 задержки и число ошибок.
+
+    Пример::
+
+        python manage.py bench_load \\
+            --target wsgi=http://localhost:8000/api \\
+            --target asgi=http://localhost:8001/api/async \\
+            --concurrency 32 --requests 2000 masters/ "orders/?page_size=50"
+
+    Пути добавляются к адресу каждой цели, поэтому один набор путей
+    сравнивает ``/api/orders/`` и ``/api/async/orders/``.
+    """
+
+    help = "Нагрузочное сравнение путей чтения API на запущенных серверах."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "paths", nargs="*", help="Пути запросов (по умолчанию списки мастеров, заказов и отзывов)."
+        )
+        parser.add_argument(
+            "--target",
+            action="append",
+            required=True,
+            help="Цель в виде метка=адрес, можно указать несколько раз.",
+        )
+        parser.add_argument("--concurrency", type=int, default=16, help="Число параллельных запросов.")
+        parser.add_argument("--requests", type=int, default=500, help="Запросов на путь.")
+        parser.add_argument("--timeout", type=float, default=10, help="Таймаут запроса в секундах.")
+
+    def handle(self, *args, **options):
+        targets = []
+        for target in options["target"]:
+            label, sep, base = target.partition("=")
+            if not sep or not base:
+                raise CommandError(f"Неверная цель {target!r}, ожидается метка=адрес.")
+            targets.append((label, base.rstrip("/")))
+        paths = options["paths"] or DEFAULT_PATHS
+
+        for path in paths:
+            self.stdout.write(path)
+            for label, base in targets:
+                url = f"{base}/{path.lstrip('/')}"
+                result = self.run(url, options["requests"], options["concurrency"], options["timeout"])
+                self.stdout.write(
+                    f"  {label:<8} {result['rps']:8.1f} запр/с  "
+                    f"p50 {result['p50']:7.2f} мс  p99 {result['p99']:7.2f} мс  "
+                    f"ошибок {result['errors']}"
+                )
+
+    @staticmethod
+    def fetch(url, timeout):
+        """
+        Выполняет запрос и возвращает пару (задержка в мс, успех).
+        """
+        request = urllib.request.Request(url, headers={"Accept": "application/json"})
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                response.read()
+                ok = response.status == 200
+        except (urllib.error.URLError, OSError):
+            ok = False
+        return (time.perf_counter() - started) * 1000, ok
+
+    def run(self, url, count, concurrency, timeout):
+        """
+        Выполняет ``count`` запросов к ``url`` и возвращает сводку.
+        """
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(lambda _: self.fetch(url, timeout), range(count)))
+        elapsed = time.perf_counter() - started
+        latencies = sorted(latency for latency, ok in results if ok)
+        errors = len(results) - len(latencies)
+        if not latencies:
+            return {"rps": 0.0, "p50": 0.0, "p99": 0.0, "errors": errors}
+        return {
+            "rps": len(latencies) / elapsed,
+            "p50": statistics.median(latencies),
+            "p99": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+            "errors": errors,
+        }
@@ -0,0 +1,106 @@
+"""
+Команда для сравнения стоимости рендеринга ответов API разными рендерерами.
+"""
+
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from rem.models import Client, Master, Order, Review
+from rem.renderers import FastJSONRenderer, MessagePackRenderer
+from rem.serializers import OrderSerializer, ReviewSerializer
+
+RENDERERS = (
+    ("json (DRF)", JSONRenderer),
+    ("json (orjson)", FastJSONRenderer),
+    ("msgpack", MessagePackRenderer),
+)
+
+
+class Command(BaseCommand):
+    """
+    Рендерит страницы заказов и отзывов заданного размера каждым рендерером
+    и выводит стоимость в микросекундах на строку и размер ответа.
+    Данные строятся в памяти, база данных не используется.
+    """
+
+    help = "Сравнивает стоимость рендеринга заказов и отзывов в JSON и MessagePack."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1000, help="Строк на странице.")
+        parser.add_argument("--repeat", type=int, default=20, help="Повторов рендеринга.")
+
+    def handle(self, *args, **options):
+        rows, repeat = options["rows"], options["repeat"]
+        for name, data in (
+            ("orders", self.order_page(rows)),
+            ("reviews", self.review_page(rows)),
+        ):
+            self.stdout.write(f"{name}: {rows} строк, {repeat} повторов")
+            baseline = None
+            for label, renderer_class in RENDERERS:
+                renderer = renderer_class()
+                started = time.perf_counter()
+                for _ in range(repeat):
+                    content = renderer.render(data, renderer.media_type, {})
+                per_row = (time.perf_counter() - started) / (repeat * rows) * 1e6
+                baseline = baseline or per_row
+                self.stdout.write(
+                    f"  {label:<14} {per_row:8.3f} мкс/строка  "
+                    f"x{baseline / per_row:5.2f}  {len(content)} байт"
+                )
+
+    @staticmethod
+    def order_page(rows):
+        """
+        Возвращает сериализованную страницу заказов со встроенными мастером и клиентом.
+        """
+        now = timezone.now()
+        client = Client(id=1, full_name="Иван Петров", email="ivan@mail.ru", created_at=now)
+        master = Master(
+            id=1, full_name="Пётр Иванов", speciality_id=1, rating=Decimal("4.50")
+        )
+        orders = [
+            Order(
+                id=index,
+                number=Decimal(index % 1000),
+                id_user=client,
+                id_master=master,
+                create_at=now,
+                updated_at=now,
+                price=Decimal(1500 + index),
+            )
+            for index in range(rows)
+        ]
+        include = {"client": {}, "master": {}}
+        return {
+            "next": None,
+            "previous": None,
+            "results": OrderSerializer(orders, many=True, include=include).data,
+        }
+
+    @staticmethod
+    def review_page(rows):
+        """
+        Возвращает сериализованную страницу отзывов.
+        """
+        now = timezone.now()
+        reviews = [
+            Review(
+                id=index,
+                client_id=1,
+                master_id=1,
+                rating=Decimal("4.5"),
+                comment="Работа выполнена быстро и аккуратно, рекомендую.",
+                created_at=now,
+            )
+            for index in range(rows)
+        ]
+        return {
+            "next": None,
+            "previous": None,
+            "results": ReviewSerializer(reviews, many=True).data,
+        }
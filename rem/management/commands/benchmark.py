@@ -0,0 +1,228 @@
+"""
+Команда для измерения производительности API и админки на текущих данных
+со сравнением с сохранённым эталоном.
+"""
+
+import datetime
+import json
+import statistics
+import time
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client as TestClient
+from django.test.utils import override_settings
+
+from rem.mixins import QueryCounter
+from rem.models import Client, Master, Order, Review
+
+# (имя, путь); {order} и {master} заменяются id записей из середины таблиц
+SCENARIOS = (
+    ("orders-list", "/api/orders/?page_size=50"),
+    ("orders-list-include", "/api/orders/?page_size=50&include=master.speciality,client"),
+    ("orders-filter", "/api/orders/?price_from=2000&price_to=5000&page_size=50"),
+    ("orders-ordering", "/api/orders/?ordering=-price&page_size=50"),
+    ("orders-by-master", "/api/orders/?id_master={master}&page_size=50"),
+    ("orders-retrieve", "/api/orders/{order}/?include=master,client"),
+    ("masters-list", "/api/masters/?include=speciality"),
+    ("masters-statistics", "/api/masters/statistics/"),
+    ("masters-pro", "/api/masters/pro/?include=speciality"),
+    ("reviews-list", "/api/reviews/?page_size=50&include=master,client"),
+    ("analytics-masters-summary", "/api/analytics/masters/summary/"),
+    ("search", "/api/search/?q=быстро"),
+    ("autocomplete", "/api/autocomplete/?q=Иван"),
+    ("admin-orders", "/admin/rem/order/"),
+    ("admin-masters", "/admin/rem/master/"),
+    ("admin-clients", "/admin/rem/client/"),
+    ("admin-reviews", "/admin/rem/review/"),
+)
+SCENARIO_NAMES = tuple(name for name, _ in SCENARIOS)
+DUMMY_CACHES = {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+
+
+class Command(BaseCommand):
+    """
+    Выполняет запросы к эндпоинтам ``rem`` и спискам админки внутри
+    процесса (``django.test.Client``, без HTTP-сервера) и выводит
+    пропускную способность, p50/p99 задержки и число SQL-запросов на
+    запрос. Данные создаются командой ``generate_data``.
+
+    Запросы выполняются в транзакции, которая откатывается: временный
+    суперпользователь для админки и сессии не сохраняются. По умолчанию
+    кэш отключается, чтобы измерялись запросы к базе, а не попадания в
+    кэш ответов (``--warm-cache`` оставляет настроенный кэш).
+
+    Результаты можно сохранить как эталон (``--save-baseline``) и
+    сравнить с ним (``--baseline``): регрессией считается рост p50
+    больше чем на ``--tolerance`` или рост числа запросов.
+
+    Пример::
+
+        python manage.py benchmark --requests 50 --save-baseline bench.json
+        python manage.py benchmark --baseline bench.json --fail-on-regression
+    """
+
+    help = "Измеряет задержки, пропускную способность и SQL-запросы эндпоинтов и админки."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "scenarios", nargs="*", help=f"Сценарии: {', '.join(SCENARIO_NAMES)} (по умолчанию — все)."
+        )
+        parser.add_argument("--requests", type=int, default=30, help="Запросов на сценарий.")
+        parser.add_argument("--warmup", type=int, default=3, help="Неучитываемых запросов перед измерением.")
+        parser.add_argument("--warm-cache", action="store_true", help="Не отключать кэш.")
+        parser.add_argument("--save-baseline", help="Сохранить результаты в JSON-файл эталона.")
+        parser.add_argument("--baseline", help="Сравнить результаты с JSON-файлом эталона.")
+        parser.add_argument(
+            "--tolerance", type=float, default=0.2, help="Допустимый рост p50 относительно эталона (доля)."
+        )
+        parser.add_argument(
+            "--fail-on-regression", action="store_true", help="Завершаться с ошибкой при регрессии."
+        )
+
+    def handle(self, *args, **options):
+        unknown = sorted(set(options["scenarios"]) - set(SCENARIO_NAMES))
+        if unknown:
+            raise CommandError(f"Неизвестные сценарии: {', '.join(unknown)}.")
+        if options["requests"] <= 0:
+            raise CommandError("--requests должно быть положительным.")
+        baseline = self.load_baseline(options["baseline"]) if options["baseline"] else None
+
+        ids = self.sample_ids()
+        scenarios = [
+            (name, path.format(**ids))
+            for name, path in SCENARIOS
+            if not options["scenarios"] or name in options["scenarios"]
+        ]
+        # Число запросов выводится в отчёте, предупреждения бюджета не нужны
+        overrides = {"DEBUG": False, "ALLOWED_HOSTS": ["testserver"], "REM_QUERY_BUDGET_MODE": "off"}
+        if not options["warm_cache"]:
+            overrides["CACHES"] = DUMMY_CACHES
+
+        results = {}
+        with override_settings(**overrides), transaction.atomic():
+            # API запрашивается анонимно, админка — под суперпользователем
+            # (чтение сессии и пользователя входит в её запросы)
+            api_client, admin_client = TestClient(), TestClient()
+            admin_client.force_login(
+                get_user_model().objects.create_superuser(f"benchmark-{time.time_ns()}", "", None)
+            )
+            for name, path in scenarios:
+                client = admin_client if path.startswith("/admin/") else api_client
+                results[name] = self.run(client, path, options["requests"], options["warmup"])
+                self.report(name, results[name], baseline)
+            transaction.set_rollback(True)
+
+        if options["save_baseline"]:
+            self.save_baseline(options["save_baseline"], results)
+        if baseline is not None:
+            regressions = self.regressions(results, baseline, options["tolerance"])
+            if regressions:
+                message = f"Регрессии относительно эталона: {', '.join(regressions)}."
+                if options["fail_on_regression"]:
+                    raise CommandError(message)
+                self.stdout.write(self.style.WARNING(message))
+            else:
+                self.stdout.write(self.style.SUCCESS("Регрессий относительно эталона нет."))
+
+    @staticmethod
+    def sample_ids():
+        """
+        Возвращает id заказа и мастера из середины таблиц для сценариев
+        с подстановкой.
+        """
+        ids = {}
+        for key, model in (("order", Order), ("master", Master)):
+            pks = model.objects.order_by("pk").values_list("pk", flat=True)
+            count = pks.count()
+            if not count:
+                raise CommandError("Нет данных: создайте их командой generate_data.")
+            ids[key] = pks[count // 2]
+        return ids
+
+    @staticmethod
+    def run(client, path, count, warmup):
+        """
+        Выполняет ``warmup`` + ``count`` запросов и возвращает сводку по
+        измеренным.
+        """
+        for _ in range(warmup):
+            client.get(path)
+        latencies, queries, errors = [], [], 0
+        started = time.perf_counter()
+        for _ in range(count):
+            counter = QueryCounter()
+            request_started = time.perf_counter()
+            with connection.execute_wrapper(counter):
+                response = client.get(path)
+            latencies.append((time.perf_counter() - request_started) * 1000)
+            queries.append(counter.count)
+            errors += response.status_code >= 400
+        elapsed = time.perf_counter() - started
+        latencies.sort()
+        return {
+            "path": path,
+            "requests": count,
+            "rps": round(count / elapsed, 2),
+            "p50": round(statistics.median(latencies), 3),
+            "p99": round(latencies[min(count - 1, int(count * 0.99))], 3),
+            "queries": max(queries),
+            "errors": errors,
+        }
+
+    def report(self, name, result, baseline):
+        """
+        Выводит строку результатов сценария, при наличии эталона — с
+        изменением относительно него.
+        """
+        line = (
+            f"{name:<26} {result['rps']:8.1f} запр/с  p50 {result['p50']:8.2f} мс  "
+            f"p99 {result['p99']:8.2f} мс  SQL {result['queries']:3}  ошибок {result['errors']}"
+        )
+        base = (baseline or {}).get(name)
+        if base:
+            change = (result["p50"] - base["p50"]) / base["p50"] * 100 if base["p50"] else 0.0
+            line += f"  p50 {change:+6.1f}%  SQL {result['queries'] - base['queries']:+d}"
+        self.stdout.write(line)
+
+    @staticmethod
+    def regressions(results, baseline, tolerance):
+        """
+        Возвращает имена сценариев, у которых p50 выросла больше чем на
+        ``tolerance`` или выросло число SQL-запросов.
+        """
+        names = []
+        for name, result in results.items():
+            base = baseline.get(name)
+            if base is None:
+                continue
+            if result["p50"] > base["p50"] * (1 + tolerance) or result["queries"] > base["queries"]:
+                names.append(name)
+        return names
+
+    @staticmethod
+    def load_baseline(path):
+        """
+        Возвращает результаты сценариев из файла эталона.
+        """
+        try:
+            return json.loads(Path(path).read_text(encoding="utf-8"))["results"]
+        except (OSError, ValueError, KeyError) as exc:
+            raise CommandError(f"Не удалось прочитать эталон {path}: {exc}")
+
+    def save_baseline(self, path, results):
+        """
+        Сохраняет результаты и размеры таблиц в файл эталона.
+        """
+        data = {
+            "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "dataset": {
+                model._meta.model_name: model.objects.count()
+                for model in (Client, Master, Order, Review)
+            },
+            "results": results,
+        }
+        Path(path).write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+        self.stdout.write(f"Эталон сохранён в {path}.")
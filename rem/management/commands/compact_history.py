@@ -0,0 +1,71 @@
+"""
+Команда для сжатия истории изменений моделей.
+"""
+
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from rem.history import compact_history
+
+
+class Command(BaseCommand):
+    """
+    Удаляет записи истории без изменений и архивирует записи старше
+    срока хранения (``REM_HISTORY_RETENTION``, ``rem.history``) — то же,
+    что ночная задача ``enforce_history_retention``, но без предела
+    числа пачек, если он не задан явно.
+
+    Пример::
+
+        python manage.py compact_history rem.Order --deduplicate-days 30
+    """
+
+    help = "Удаляет записи истории без изменений и архивирует устаревшие записи."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "models", nargs="*", help="Метки моделей (по умолчанию — из REM_HISTORY_RETENTION)."
+        )
+        parser.add_argument("--batch-size", type=int, help="Записей в пачке архивирования и удаления.")
+        parser.add_argument("--max-batches", type=int, help="Предел пачек на модель.")
+        parser.add_argument(
+            "--deduplicate-days",
+            type=int,
+            default=getattr(settings, "REM_HISTORY_DEDUPLICATE_DAYS", None),
+            help="Глубина поиска записей без изменений в днях.",
+        )
+        parser.add_argument(
+            "--deduplicate-all", action="store_true", help="Искать записи без изменений во всей истории."
+        )
+
+    def handle(self, *args, **options):
+        targets = []
+        for label in options["models"]:
+            try:
+                model = apps.get_model(label)
+            except (LookupError, ValueError):
+                raise CommandError(f"Неизвестная модель: {label}.")
+            if not hasattr(model, "history"):
+                raise CommandError(f"У модели {label} нет истории изменений.")
+            targets.append(model)
+        if options["batch_size"] is not None and options["batch_size"] <= 0:
+            raise CommandError("--batch-size должно быть положительным.")
+
+        started = time.perf_counter()
+        result, done = compact_history(
+            targets,
+            batch_size=options["batch_size"],
+            max_batches=options["max_batches"],
+            deduplicate_days=None if options["deduplicate_all"] else options["deduplicate_days"],
+        )
+        for label, counts in result.items():
+            self.stdout.write(
+                f"{label}: удалено без изменений {counts['deduplicated']}, "
+                f"архивировано {counts['archived']}"
+            )
+        self.stdout.write(f"Готово за {time.perf_counter() - started:.1f} с.")
+        if not done:
+            self.stdout.write(self.style.WARNING("Устаревшие записи остались: достигнут --max-batches."))
@@ -0,0 +1,78 @@
+"""
+Команда для генерации синтетических данных для нагрузочных измерений.
+"""
+
+import dataclasses
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from rem.datagen import DataGenerator, DatasetSize, rebuild_derived
+
+
+class Command(BaseCommand):
+    """
+    Создаёт специальности, услуги, клиентов, мастеров, заказы, отзывы и
+    историю изменений (``rem.datagen``) и перестраивает производные
+    данные. Размеры по умолчанию (100 тыс. заказов) умножаются на
+    ``--scale``; отдельные размеры можно задать явно.
+
+    Пример::
+
+        python manage.py generate_data --scale 10 --seed 1
+    """
+
+    help = "Генерирует синтетические данные для нагрузочных измерений."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scale", type=float, default=1.0, help="Множитель размеров по умолчанию.")
+        for field in dataclasses.fields(DatasetSize):
+            parser.add_argument(
+                f"--{field.name.replace('_', '-')}",
+                type=int,
+                help=f"Число записей ({field.name}), по умолчанию {field.default} × scale.",
+            )
+        parser.add_argument("--days", type=int, default=365, help="Глубина дат в днях.")
+        parser.add_argument("--seed", type=int, default=0, help="Начальное значение генератора.")
+        parser.add_argument("--batch-size", type=int, default=5000, help="Записей в пачке INSERT.")
+        parser.add_argument("--no-history", action="store_true", help="Не создавать записи истории.")
+        parser.add_argument(
+            "--skip-derived",
+            action="store_true",
+            help="Не перестраивать рейтинги, агрегаты и индексы поиска.",
+        )
+
+    def handle(self, *args, **options):
+        if options["scale"] <= 0 or options["batch_size"] <= 0:
+            raise CommandError("--scale и --batch-size должны быть положительными.")
+        size = DatasetSize().scaled(options["scale"])
+        overrides = {
+            field.name: options[field.name]
+            for field in dataclasses.fields(DatasetSize)
+            if options[field.name] is not None
+        }
+        size = dataclasses.replace(size, **overrides)
+
+        started = time.perf_counter()
+        generator = DataGenerator(
+            size,
+            days=options["days"],
+            seed=options["seed"],
+            batch_size=options["batch_size"],
+            with_history=not options["no_history"],
+        )
+        counts = generator.generate()
+        elapsed = time.perf_counter() - started
+        total = sum(counts.values())
+        self.stdout.write(
+            f"Создано {total} записей за {elapsed:.1f} с "
+            f"({total / elapsed:.0f} записей/с): "
+            + ", ".join(f"{kind}: {count}" for kind, count in counts.items())
+        )
+
+        if not options["skip_derived"]:
+            started = time.perf_counter()
+            result = rebuild_derived()
+            self.stdout.write(
+                f"Производные данные перестроены за {time.perf_counter() - started:.1f} с: {result}"
+            )
@@ -0,0 +1,35 @@
+"""
+Команда для перестройки индекса автодополнения имён.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from rem.autocomplete import AUTOCOMPLETE_KINDS, rebuild_autocomplete
+
+
+class Command(BaseCommand):
+    """
+    Перестраивает индекс автодополнения (``rem.autocomplete``) по именам
+    клиентов и мастеров. Используется после массовой загрузки данных и для
+    исправления расхождений.
+    """
+
+    help = "Перестраивает индекс автодополнения имён клиентов и мастеров."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "kinds", nargs="*", help=f"Типы: {', '.join(AUTOCOMPLETE_KINDS)} (по умолчанию — все)."
+        )
+        parser.add_argument("--batch-size", type=int, default=1000, help="Строк в пачке INSERT.")
+
+    def handle(self, *args, **options):
+        unknown = sorted(set(options["kinds"]) - set(AUTOCOMPLETE_KINDS))
+        if unknown:
+            raise CommandError(f"Неизвестные типы: {', '.join(unknown)}.")
+        with transaction.atomic():
+            result = rebuild_autocomplete(
+                options["kinds"] or AUTOCOMPLETE_KINDS, batch_size=options["batch_size"]
+            )
+        counts = ", ".join(f"{kind}: {count}" for kind, count in result.items())
+        self.stdout.write(f"Индекс автодополнения перестроен ({counts}).")
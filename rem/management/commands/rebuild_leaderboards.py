@@ -0,0 +1,24 @@
+"""
+Команда для перестройки рейтингов мастеров в Redis.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from rem.leaderboards import LeaderboardUnavailable, rebuild_leaderboards
+
+
+class Command(BaseCommand):
+    """
+    Перестраивает упорядоченные множества рейтингов мастеров по
+    специальностям (``rem.leaderboards``) по базе. Используется для
+    первоначального заполнения и после недоступности Redis.
+    """
+
+    help = "Перестраивает рейтинги мастеров в Redis."
+
+    def handle(self, *args, **options):
+        try:
+            count = rebuild_leaderboards()
+        except LeaderboardUnavailable as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(f"Перестроены рейтинги {count} мастеров.")
@@ -0,0 +1,27 @@
+"""
+Команда для перестройки таблицы полнотекстового поиска.
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from rem.search import fts_enabled, rebuild_search_index
+
+
+class Command(BaseCommand):
+    """
+    Перестраивает таблицу полнотекстового поиска FTS5 (``rem.search``) по
+    услугам, мастерам и отзывам. Используется после массовой загрузки
+    данных и для исправления расхождений.
+    """
+
+    help = "Перестраивает таблицу полнотекстового поиска."
+
+    def handle(self, *args, **options):
+        if not fts_enabled():
+            self.stdout.write("Поиск выполняется без FTS5: перестраивать нечего.")
+            return
+        with transaction.atomic():
+            result = rebuild_search_index()
+        counts = ", ".join(f"{kind}: {count}" for kind, count in result.items())
+        self.stdout.write(f"Таблица поиска перестроена ({counts}).")
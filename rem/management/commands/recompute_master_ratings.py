@@ -0,0 +1,40 @@
+"""
+Команда для пересчёта рейтингов мастеров по отзывам.
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from rem.models import Master
+from rem.ratings import recompute_master_ratings
+
+
+class Command(BaseCommand):
+    """
+    Пересчитывает количество отзывов, сумму и распределение оценок и средний
+    рейтинг мастеров по таблице отзывов. Используется для первоначального
+    заполнения и исправления расхождений; мастера обрабатываются пачками
+    по возрастанию id, каждая пачка — в своей транзакции.
+    """
+
+    help = "Пересчитывает рейтинги мастеров по отзывам."
+
+    def add_arguments(self, parser):
+        parser.add_argument("masters", nargs="*", type=int, help="Id мастеров (по умолчанию — все).")
+        parser.add_argument("--chunk-size", type=int, default=1000, help="Мастеров в пачке.")
+
+    def handle(self, *args, **options):
+        masters = Master.objects.order_by("pk")
+        if options["masters"]:
+            masters = masters.filter(pk__in=options["masters"])
+        pks = masters.values_list("pk", flat=True)
+
+        total, last_pk = 0, 0
+        while True:
+            chunk = list(pks.filter(pk__gt=last_pk)[: options["chunk_size"]])
+            if not chunk:
+                break
+            last_pk = chunk[-1]
+            with transaction.atomic():
+                total += recompute_master_ratings(Master.objects.filter(pk__in=chunk))
+        self.stdout.write(f"Пересчитаны рейтинги {total} мастеров.")
@@ -0,0 +1,494 @@
+"""
+Этот модуль содержит метрики приложения в формате Prometheus: время
+ответа, число и время SQL-запросов и попадания в кэш ответов по
+действиям ViewSet'ов, а также длительность задач Celery из ``rem.tasks``.
+
+Наблюдения накапливаются в памяти процесса (словарь под блокировкой,
+без обращений к сети на запрос). Раз в ``REM_METRICS_FLUSH_INTERVAL``
+секунд процесс прибавляет накопленные приращения к общему хэшу Redis
+одним конвейером в фоновом потоке (запрос, заметивший истёкший
+интервал, не ждёт Redis и не занимает цикл событий ASGI), поэтому
+``/metrics`` отдаёт сумму по всем веб-воркерам и воркерам Celery.
+Если кэш — не Redis или Redis недоступен, отдаются значения текущего
+процесса.
+
+Метка ``view`` — имя действия ViewSet'а (``order-list``,
+``master-statistics``, ``order-change-price``) или имя маршрута для
+остальных представлений; запросы к несуществующим адресам получают
+метку ``unmatched``, чтобы число рядов не зависело от присланных путей.
+"""
+
+import bisect
+import contextvars
+import json
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import NamedTuple
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+METRICS_KEY = "rem:metrics"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+UNMATCHED_VIEW = "unmatched"
+# Учитываются только задачи приложения
+TASK_PREFIX = "rem.tasks."
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+TASK_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0)
+
+
+class Metric(NamedTuple):
+    """
+    Описание семейства метрик: имя, тип (``counter`` или ``histogram``),
+    описание, имена меток и границы корзин гистограммы.
+    """
+
+    name: str
+    kind: str
+    help: str
+    labels: tuple
+    buckets: tuple = ()
+
+
+HTTP_REQUESTS = Metric(
+    "rem_http_requests_total", "counter",
+    "Число HTTP-запросов.", ("view", "method", "status"),
+)
+HTTP_LATENCY = Metric(
+    "rem_http_request_duration_seconds", "histogram",
+    "Время обработки HTTP-запроса в секундах.", ("view", "method"), LATENCY_BUCKETS,
+)
+DB_QUERIES = Metric(
+    "rem_db_queries_per_request", "histogram",
+    "Число SQL-запросов на HTTP-запрос.", ("view",), QUERY_COUNT_BUCKETS,
+)
+DB_TIME = Metric(
+    "rem_db_query_duration_seconds_total", "counter",
+    "Суммарное время SQL-запросов в секундах.", ("view",),
+)
+CACHE_REQUESTS = Metric(
+    "rem_cache_requests_total", "counter",
+    "Обращения к кэшу ответов: result — hit или miss.", ("view", "result"),
+)
+TASK_LATENCY = Metric(
+    "rem_celery_task_duration_seconds", "histogram",
+    "Время выполнения задачи Celery в секундах.", ("task", "state"), TASK_BUCKETS,
+)
+METRICS = (HTTP_REQUESTS, HTTP_LATENCY, DB_QUERIES, DB_TIME, CACHE_REQUESTS, TASK_LATENCY)
+METRICS_BY_NAME = {metric.name: metric for metric in METRICS}
+
+
+def _bucket_label(bound):
+    """
+    Возвращает значение метки ``le`` для границы корзины.
+    """
+    return "+Inf" if bound is None else repr(float(bound))
+
+
+class Registry:
+    """
+    Значения метрик процесса.
+
+    Ряд задаётся ключом (имя, суффикс, значения меток): суффикс ``""`` —
+    счётчик, ``"bucket"``/``"sum"``/``"count"`` — части гистограммы.
+    Корзины хранятся без накопления (наблюдение попадает в одну
+    корзину), накопленные значения ``le`` вычисляются при выводе.
+    ``totals`` — значения за время жизни процесса, ``pending`` —
+    приращения, ещё не переданные в Redis.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.totals = {}
+        self.pending = {}
+        self.last_flush = time.monotonic()
+
+    def _add(self, key, amount):
+        self.totals[key] = self.totals.get(key, 0) + amount
+        self.pending[key] = self.pending.get(key, 0) + amount
+
+    def inc(self, metric, labels, amount=1):
+        """
+        Увеличивает счётчик.
+        """
+        with self.lock:
+            self._add((metric.name, "", labels), amount)
+
+    def observe(self, metric, labels, value):
+        """
+        Добавляет наблюдение в гистограмму.
+        """
+        index = bisect.bisect_left(metric.buckets, value)
+        bound = metric.buckets[index] if index < len(metric.buckets) else None
+        with self.lock:
+            self._add((metric.name, "bucket", labels + (_bucket_label(bound),)), 1)
+            self._add((metric.name, "sum", labels), value)
+            self._add((metric.name, "count", labels), 1)
+
+    def take_pending(self):
+        """
+        Забирает накопленные приращения.
+        """
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.last_flush = time.monotonic()
+        return pending
+
+    def restore_pending(self, pending):
+        """
+        Возвращает приращения, которые не удалось передать.
+        """
+        with self.lock:
+            for key, amount in pending.items():
+                self.pending[key] = self.pending.get(key, 0) + amount
+
+    def snapshot(self):
+        """
+        Возвращает копию значений процесса.
+        """
+        with self.lock:
+            return dict(self.totals)
+
+
+registry = Registry()
+
+
+def metrics_enabled():
+    """
+    Возвращает ``True``, если сбор метрик включён (``REM_METRICS_ENABLED``).
+    """
+    return getattr(settings, "REM_METRICS_ENABLED", True)
+
+
+def _encode(key):
+    name, suffix, labels = key
+    return json.dumps([name, suffix, list(labels)], ensure_ascii=False)
+
+
+def _decode(field):
+    name, suffix, labels = json.loads(field)
+    return name, suffix, tuple(labels)
+
+
+def _redis():
+    """
+    Возвращает соединение с Redis кэша по умолчанию или ``None``.
+    """
+    try:
+        return get_redis_connection("default")
+    except NotImplementedError:
+        return None
+
+
+def flush():
+    """
+    Прибавляет накопленные приращения к общему хэшу метрик в Redis.
+    При ошибке приращения остаются в процессе до следующей попытки.
+    """
+    pending = registry.take_pending()
+    if not pending:
+        return
+    redis = _redis()
+    if redis is None:
+        return
+    try:
+        pipeline = redis.pipeline(transaction=False)
+        for key, amount in pending.items():
+            pipeline.hincrbyfloat(METRICS_KEY, _encode(key), amount)
+        pipeline.execute()
+    except RedisError as exc:
+        registry.restore_pending(pending)
+        logger.warning("Метрики не переданы в Redis: %s", exc)
+
+
+_flush_lock = threading.Lock()
+
+
+def maybe_flush():
+    """
+    Передаёт приращения в Redis, если с прошлой передачи прошло
+    ``REM_METRICS_FLUSH_INTERVAL`` секунд.
+
+    Передача выполняется в фоновом потоке, одновременно не больше одной:
+    вызывающий запрос или задача не ждут Redis (при его недоступности —
+    таймаута соединения).
+    """
+    interval = getattr(settings, "REM_METRICS_FLUSH_INTERVAL", 15)
+    if time.monotonic() - registry.last_flush < interval:
+        return
+    if not _flush_lock.acquire(blocking=False):
+        return
+    try:
+        threading.Thread(target=_flush_in_background, name="rem-metrics-flush", daemon=True).start()
+    except RuntimeError:
+        _flush_lock.release()
+        raise
+
+
+def _flush_in_background():
+    try:
+        flush()
+    except Exception:
+        logger.exception("Ошибка передачи метрик в Redis")
+    finally:
+        _flush_lock.release()
+
+
+def collect():
+    """
+    Возвращает значения метрик: общие из Redis или, если он недоступен,
+    значения текущего процесса.
+    """
+    redis = _redis()
+    if redis is not None:
+        flush()
+        try:
+            stored = redis.hgetall(METRICS_KEY)
+        except RedisError as exc:
+            logger.warning("Метрики не прочитаны из Redis: %s", exc)
+        else:
+            values = {}
+            for field, value in stored.items():
+                key = _decode(field)
+                if key[0] in METRICS_BY_NAME:
+                    values[key] = float(value)
+            return values
+    return registry.snapshot()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def render(values):
+    """
+    Возвращает значения метрик в текстовом формате Prometheus.
+    """
+    lines = []
+    for metric in METRICS:
+        lines += [f"# HELP {metric.name} {metric.help}", f"# TYPE {metric.name} {metric.kind}"]
+        series = sorted(key for key in values if key[0] == metric.name)
+        if metric.kind == "counter":
+            for _, _, labels in series:
+                lines.append(
+                    f"{metric.name}{_format_labels(metric.labels, labels)} "
+                    f"{_format_value(values[metric.name, '', labels])}"
+                )
+            continue
+        bounds = [_bucket_label(bound) for bound in (*metric.buckets, None)]
+        for _, suffix, labels in series:
+            if suffix != "count":
+                continue
+            total = 0
+            for bound in bounds:
+                total += values.get((metric.name, "bucket", labels + (bound,)), 0)
+                lines.append(
+                    f"{metric.name}_bucket"
+                    f"{_format_labels(metric.labels + ('le',), labels + (bound,))} "
+                    f"{_format_value(total)}"
+                )
+            label_text = _format_labels(metric.labels, labels)
+            lines.append(f"{metric.name}_sum{label_text} {_format_value(values[metric.name, 'sum', labels])}")
+            lines.append(f"{metric.name}_count{label_text} {_format_value(values[metric.name, 'count', labels])}")
+    return "\n".join(lines) + "\n"
+
+
+def metrics_view(request):
+    """
+    Отдаёт метрики для сбора Prometheus. Если задана настройка
+    ``REM_METRICS_TOKEN``, требуется заголовок ``Authorization: Bearer <токен>``.
+    По умолчанию токен не задан и метрики (имена представлений, число
+    запросов и ошибок) доступны без авторизации: в рабочем окружении
+    задайте токен или закройте ``/metrics`` на прокси.
+    """
+    token = getattr(settings, "REM_METRICS_TOKEN", None)
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        return HttpResponse(status=401)
+    return HttpResponse(render(collect()), content_type=CONTENT_TYPE)
+
+
+@dataclass
+class RequestMetrics:
+    """
+    Метрики текущего запроса: имя представления и SQL-запросы.
+    """
+
+    view: str = ""
+    queries: int = 0
+    query_time: float = 0.0
+
+
+_current = contextvars.ContextVar("rem_request_metrics", default=None)
+
+
+def set_view_name(name):
+    """
+    Задаёт метку ``view`` текущего запроса (вызывается ViewSet'ами).
+    """
+    state = _current.get()
+    if state is not None:
+        state.view = name
+
+
+def record_cache_event(event, name=""):
+    """
+    Учитывает обращение к кэшу ответов (``"hit"`` или ``"miss"``) с меткой
+    представления текущего запроса (вне запроса — ``name``).
+    """
+    if not metrics_enabled():
+        return
+    state = _current.get()
+    view = state.view if state is not None and state.view else name
+    registry.inc(CACHE_REQUESTS, (view, event))
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Обёртка выполнения SQL: считает запросы и их время для текущего запроса.
+    Вне HTTP-запроса ничего не измеряет.
+    """
+    state = _current.get()
+    if state is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        state.queries += 1
+        state.query_time += time.perf_counter() - started
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """
+    Добавляет ``record_query`` к обёрткам соединения. Обёртка ставится
+    первой: ``connection.execute_wrapper()`` снимает последнюю добавленную,
+    и соединение, открытое внутри такого блока, не должно её потерять.
+    Обёртка ищет состояние в контекстной переменной, поэтому учитывает и
+    запросы, выполняемые в потоках ``sync_to_async``.
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+connection_created.connect(install_query_recorder, dispatch_uid="rem_metrics_query_recorder")
+
+
+class MetricsMiddleware:
+    """
+    Промежуточный слой, измеряющий время ответа и SQL-запросы каждого
+    запроса. Для потоковых ответов измеряется время до начала передачи.
+    Ставится первым в ``MIDDLEWARE``, чтобы учитывать остальные слои.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not metrics_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = RequestMetrics()
+        token = _current.set(state)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.record(request, response, state, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        state = RequestMetrics()
+        token = _current.set(state)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.record(request, response, state, time.perf_counter() - started)
+        return response
+
+    @staticmethod
+    def record(request, response, state, elapsed):
+        """
+        Записывает метрики завершённого запроса.
+        """
+        view = state.view
+        if not view:
+            match = getattr(request, "resolver_match", None)
+            view = (match.url_name or match.view_name) if match else UNMATCHED_VIEW
+        registry.inc(HTTP_REQUESTS, (view, request.method, str(response.status_code)))
+        registry.observe(HTTP_LATENCY, (view, request.method), elapsed)
+        registry.observe(DB_QUERIES, (view,), state.queries)
+        registry.inc(DB_TIME, (view,), state.query_time)
+        maybe_flush()
+
+
+_task_started = {}
+
+
+def task_prerun(sender=None, task_id=None, task=None, **kwargs):
+    """
+    Запоминает время начала задачи приложения.
+    """
+    if task is not None and task.name.startswith(TASK_PREFIX):
+        _task_started[task_id] = time.perf_counter()
+
+
+def task_postrun(sender=None, task_id=None, task=None, state=None, **kwargs):
+    """
+    Записывает длительность завершённой задачи приложения.
+    """
+    started = _task_started.pop(task_id, None)
+    if started is None:
+        return
+    registry.observe(TASK_LATENCY, (task.name, state or "UNKNOWN"), time.perf_counter() - started)
+    maybe_flush()
+
+
+def worker_shutdown(**kwargs):
+    """
+    Передаёт оставшиеся приращения при остановке процесса воркера.
+    """
+    flush()
+
+
+def connect_task_signals():
+    """
+    Подключает учёт задач к сигналам Celery.
+    """
+    from celery import signals
+
+    if not metrics_enabled():
+        return
+    signals.task_prerun.connect(task_prerun, dispatch_uid="rem_metrics_task_prerun")
+    signals.task_postrun.connect(task_postrun, dispatch_uid="rem_metrics_task_postrun")
+    signals.worker_process_shutdown.connect(worker_shutdown, dispatch_uid="rem_metrics_worker_shutdown")
@@ -0,0 +1,81 @@
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.functions import TruncDate
+
+
+def fill_rollups(apps, schema_editor):
+    """
+    Заполняет агрегаты по существующим заказам.
+    """
+    Order = apps.get_model('rem', 'Order')
+    for model_name, field, order_field in (
+        ('DailyMasterRollup', 'master_id', 'id_master'),
+        ('DailySpecialityRollup', 'speciality_id', 'id_master__speciality'),
+    ):
+        model = apps.get_model('rem', model_name)
+        rows = (
+            Order.objects.annotate(day=TruncDate('create_at'))
+            .values('day', order_field)
+            .annotate(
+                order_count=Count('id'),
+                price_sum=Sum('price'),
+                price_min=Min('price'),
+                price_max=Max('price'),
+            )
+            .order_by()
+        )
+        model.objects.bulk_create(
+            [
+                model(**{field: row.pop(order_field)}, **row)
+                for row in rows
+            ],
+            batch_size=500,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rem', '0012_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyMasterRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('order_count', models.PositiveIntegerField(default=0, verbose_name='Количество заказов')),
+                ('price_sum', models.DecimalField(decimal_places=0, default=0, max_digits=16, verbose_name='Выручка')),
+                ('price_min', models.DecimalField(decimal_places=0, max_digits=10, null=True, verbose_name='Минимальная цена')),
+                ('price_max', models.DecimalField(decimal_places=0, max_digits=10, null=True, verbose_name='Максимальная цена')),
+                ('master', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='rem.master', verbose_name='Мастер')),
+            ],
+            options={
+                'verbose_name': 'Дневной агрегат мастера',
+                'verbose_name_plural': 'Дневные агрегаты мастеров',
+                'ordering': ['-day', 'master'],
+                'constraints': [models.UniqueConstraint(fields=('day', 'master'), name='rem_master_rollup_day_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailySpecialityRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('order_count', models.PositiveIntegerField(default=0, verbose_name='Количество заказов')),
+                ('price_sum', models.DecimalField(decimal_places=0, default=0, max_digits=16, verbose_name='Выручка')),
+                ('price_min', models.DecimalField(decimal_places=0, max_digits=10, null=True, verbose_name='Минимальная цена')),
+                ('price_max', models.DecimalField(decimal_places=0, max_digits=10, null=True, verbose_name='Максимальная цена')),
+                ('speciality', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='rem.speciality', verbose_name='Специальность')),
+            ],
+            options={
+                'verbose_name': 'Дневной агрегат специальности',
+                'verbose_name_plural': 'Дневные агрегаты специальностей',
+                'ordering': ['-day', 'speciality'],
+                'constraints': [models.UniqueConstraint(fields=('day', 'speciality'), name='rem_speciality_rollup_day_uniq')],
+            },
+        ),
+        migrations.RunPython(fill_rollups, migrations.RunPython.noop),
+    ]
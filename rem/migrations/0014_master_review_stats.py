@@ -0,0 +1,107 @@
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def fill_review_stats(apps, schema_editor):
+    """
+    Заполняет поля отзывов мастеров и средний рейтинг по существующим отзывам.
+    """
+    Master = apps.get_model('rem', 'Master')
+    Review = apps.get_model('rem', 'Review')
+    histogram = {
+        'reviews_1': Count('id', filter=Q(rating__lt=2)),
+        'reviews_2': Count('id', filter=Q(rating__gte=2, rating__lt=3)),
+        'reviews_3': Count('id', filter=Q(rating__gte=3, rating__lt=4)),
+        'reviews_4': Count('id', filter=Q(rating__gte=4, rating__lt=5)),
+        'reviews_5': Count('id', filter=Q(rating__gte=5)),
+    }
+    rows = (
+        Review.objects.values('master')
+        .annotate(review_count=Count('id'), rating_sum=Sum('rating'), **histogram)
+        .order_by()
+    )
+    for row in rows:
+        master_id = row.pop('master')
+        row['rating'] = round(row['rating_sum'] / row['review_count'], 2)
+        Master.objects.filter(pk=master_id).update(**row)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rem', '0013_daily_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='historicalmaster',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество отзывов'),
+        ),
+        migrations.AddField(
+            model_name='historicalmaster',
+            name='rating_sum',
+            field=models.DecimalField(decimal_places=1, default=0, max_digits=12, verbose_name='Сумма оценок'),
+        ),
+        migrations.AddField(
+            model_name='historicalmaster',
+            name='reviews_1',
+            field=models.PositiveIntegerField(default=0, verbose_name='Отзывов с оценкой 1'),
+        ),
+        migrations.AddField(
+            model_name='historicalmaster',
+            name='reviews_2',
+            field=models.PositiveIntegerField(default=0, verbose_name='Отзывов с оценкой 2'),
+        ),
+        migrations.AddField(
+            model_name='historicalmaster',
+            name='reviews_3',
+            field=models.PositiveIntegerField(default=0, verbose_name='Отзывов с оценкой 3'),
+        ),
+        migrations.AddField(
+            model_name='historicalmaster',
+            name='reviews_4',
+            field=models.PositiveIntegerField(default=0, verbose_name='Отзывов с оценкой 4'),
+        ),
+        migrations.AddField(
+            model_name='historicalmaster',
+            name='reviews_5',
+            field=models.PositiveIntegerField(default=0, verbose_name='Отзывов с оценкой 5'),
+        ),
+        migrations.AddField(
+            model_name='master',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество отзывов'),
+        ),
+        migrations.AddField(
+            model_name='master',
+            name='rating_sum',
+            field=models.DecimalField(decimal_places=1, default=0, max_digits=12, verbose_name='Сумма оценок'),
+        ),
+        migrations.AddField(
+            model_name='master',
+            name='reviews_1',
+            field=models.PositiveIntegerField(default=0, verbose_name='Отзывов с оценкой 1'),
+        ),
+        migrations.AddField(
+            model_name='master',
+            name='reviews_2',
+            field=models.PositiveIntegerField(default=0, verbose_name='Отзывов с оценкой 2'),
+        ),
+        migrations.AddField(
+            model_name='master',
+            name='reviews_3',
+            field=models.PositiveIntegerField(default=0, verbose_name='Отзывов с оценкой 3'),
+        ),
+        migrations.AddField(
+            model_name='master',
+            name='reviews_4',
+            field=models.PositiveIntegerField(default=0, verbose_name='Отзывов с оценкой 4'),
+        ),
+        migrations.AddField(
+            model_name='master',
+            name='reviews_5',
+            field=models.PositiveIntegerField(default=0, verbose_name='Отзывов с оценкой 5'),
+        ),
+        migrations.RunPython(fill_review_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+from django.db import migrations
+
+# (код типа, таблица, колонка заголовка, колонка текста); rowid документа —
+# id * 4 + код типа (см. rem.search)
+SOURCES = (
+    (1, 'rem_service', 'name', 'description'),
+    (2, 'rem_master', 'full_name', 'description'),
+    (3, 'rem_review', None, 'comment'),
+)
+
+
+def normalized(column):
+    """
+    Возвращает SQL-выражение колонки с заменой «ё» на «е».
+    """
+    return f"REPLACE(REPLACE(COALESCE({column}, ''), 'ё', 'е'), 'Ё', 'Е')"
+
+
+def create_search_index(apps, schema_editor):
+    """
+    Создаёт таблицу полнотекстового поиска FTS5 и заполняет её (только SQLite).
+    """
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE rem_search USING fts5("
+        "title, body, tokenize = 'unicode61 remove_diacritics 2')"
+    )
+    for code, table, title, body in SOURCES:
+        title = normalized(title) if title else "''"
+        schema_editor.execute(
+            f"INSERT INTO rem_search (rowid, title, body) "
+            f"SELECT id * 4 + {code}, {title}, {normalized(body)} FROM {table}"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    """
+    Удаляет таблицу полнотекстового поиска.
+    """
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS rem_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rem', '0014_master_review_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,89 @@
+import re
+
+from django.db import migrations, models
+
+
+def words(name):
+    """
+    Возвращает нормализованные слова имени (см. rem.autocomplete.normalize).
+    """
+    return sorted(set(re.findall(r"\w+", (name or "").casefold().replace("ё", "е"))))
+
+
+def trigrams(word):
+    """
+    Возвращает триграммы слова (см. rem.autocomplete.trigrams).
+    """
+    padded = f"  {word} "
+    return {padded[index: index + 3] for index in range(len(padded) - 2)}
+
+
+def fill_autocomplete(apps, schema_editor):
+    """
+    Заполняет индекс автодополнения по именам клиентов и мастеров.
+    """
+    AutocompleteToken = apps.get_model('rem', 'AutocompleteToken')
+    AutocompleteTrigram = apps.get_model('rem', 'AutocompleteTrigram')
+    for kind, model_name in (('client', 'Client'), ('master', 'Master')):
+        tokens, vocabulary = [], set()
+        for object_id, name in apps.get_model('rem', model_name).objects.values_list('pk', 'full_name'):
+            object_words = words(name)
+            vocabulary.update(object_words)
+            tokens += [
+                AutocompleteToken(kind=kind, object_id=object_id, token=word, name=name)
+                for word in object_words
+            ]
+        AutocompleteToken.objects.bulk_create(tokens, batch_size=1000)
+        AutocompleteTrigram.objects.bulk_create(
+            [
+                AutocompleteTrigram(kind=kind, token=word, trigram=gram)
+                for word in sorted(vocabulary)
+                for gram in sorted(trigrams(word))
+            ],
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rem', '0015_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AutocompleteToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('client', 'Клиент'), ('master', 'Мастер')], max_length=10, verbose_name='Тип')),
+                ('object_id', models.PositiveIntegerField(verbose_name='Id объекта')),
+                ('token', models.CharField(max_length=200, verbose_name='Слово')),
+                ('name', models.CharField(max_length=200, verbose_name='Имя')),
+            ],
+            options={
+                'verbose_name': 'Слово автодополнения',
+                'verbose_name_plural': 'Слова автодополнения',
+                'indexes': [
+                    models.Index(fields=['kind', 'token'], name='rem_autocomplete_token_idx'),
+                    models.Index(fields=['kind', 'object_id', 'token'], name='rem_autocomplete_object_idx'),
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name='AutocompleteTrigram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('client', 'Клиент'), ('master', 'Мастер')], max_length=10, verbose_name='Тип')),
+                ('token', models.CharField(max_length=200, verbose_name='Слово')),
+                ('trigram', models.CharField(max_length=3, verbose_name='Триграмма')),
+            ],
+            options={
+                'verbose_name': 'Триграмма автодополнения',
+                'verbose_name_plural': 'Триграммы автодополнения',
+                'constraints': [
+                    models.UniqueConstraint(fields=('kind', 'trigram', 'token'), name='rem_autocomplete_trigram_uniq'),
+                ],
+            },
+        ),
+        migrations.RunPython(fill_autocomplete, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rem', '0016_autocomplete'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['id_master', 'create_at'], name='rem_order_master_create_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['id_user', 'create_at'], name='rem_order_user_create_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['price'], name='rem_order_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['updated_at'], name='rem_order_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['number'], name='rem_order_number_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['master', 'created_at'], name='rem_review_master_created_idx'),
+        ),
+        # Одиночные индексы внешних ключей избыточны при составных индексах выше
+        migrations.AlterField(
+            model_name='order',
+            name='id_master',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='rem.master', verbose_name='ID мастера'),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='id_user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='rem.client', verbose_name='ID клиента'),
+        ),
+        migrations.AlterField(
+            model_name='review',
+            name='master',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='rem.master', verbose_name='Мастер'),
+        ),
+    ]
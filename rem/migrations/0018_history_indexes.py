@@ -0,0 +1,47 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rem', '0017_order_review_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='historicalclient',
+            name='id',
+            field=models.BigIntegerField(auto_created=True, blank=True, verbose_name='ID'),
+        ),
+        migrations.AlterField(
+            model_name='historicalmaster',
+            name='id',
+            field=models.BigIntegerField(auto_created=True, blank=True, verbose_name='ID'),
+        ),
+        migrations.AlterField(
+            model_name='historicalorder',
+            name='id',
+            field=models.BigIntegerField(auto_created=True, blank=True, verbose_name='ID'),
+        ),
+        migrations.AlterField(
+            model_name='historicalspeciality',
+            name='id',
+            field=models.BigIntegerField(auto_created=True, blank=True, verbose_name='ID'),
+        ),
+        migrations.AddIndex(
+            model_name='historicalclient',
+            index=models.Index(fields=['id', 'history_date'], name='rem_hist_client_id_date'),
+        ),
+        migrations.AddIndex(
+            model_name='historicalmaster',
+            index=models.Index(fields=['id', 'history_date'], name='rem_hist_master_id_date'),
+        ),
+        migrations.AddIndex(
+            model_name='historicalorder',
+            index=models.Index(fields=['id', 'history_date'], name='rem_hist_order_id_date'),
+        ),
+        migrations.AddIndex(
+            model_name='historicalspeciality',
+            index=models.Index(fields=['id', 'history_date'], name='rem_hist_speciality_id_date'),
+        ),
+    ]
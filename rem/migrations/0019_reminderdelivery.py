@@ -0,0 +1,30 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rem', '0018_history_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReminderDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='День рассылки')),
+                ('kind', models.CharField(choices=[('recent', 'Недавний заказ'), ('stale', 'Давно не заказывал')], max_length=10, verbose_name='Повод')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает'), ('sent', 'Отправлено'), ('failed', 'Ошибка')], default='pending', max_length=10, verbose_name='Состояние')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='Отправлено')),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='rem.client', verbose_name='Клиент')),
+            ],
+            options={
+                'verbose_name': 'Доставка напоминания',
+                'verbose_name_plural': 'Доставки напоминаний',
+                'indexes': [models.Index(fields=['date', 'status'], name='rem_reminder_date_status_idx')],
+                'constraints': [models.UniqueConstraint(fields=('client', 'date'), name='rem_reminder_client_date_uniq')],
+            },
+        ),
+    ]
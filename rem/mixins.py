@@ -0,0 +1,565 @@
+"""
+Этот модуль содержит примеси для ViewSet'ов приложения:
+встраивание связанных объектов без N+1 запросов, выборочный вывод
+полей с сужением SELECT, условные GET-запросы (ETag/Last-Modified),
+кэширование ответов в Redis, потоковую выгрузку в CSV/NDJSON,
+контроль количества SQL-запросов на действие (бюджет запросов) и
+метку действия для метрик.
+"""
+
+import csv
+import datetime
+import hashlib
+import logging
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connection
+from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils import timezone
+from django.utils.http import http_date, quote_etag
+import orjson
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+
+from . import metrics
+from .caching import CACHED_ACTIONS, count_cache_event, get_model_versions
+from .renderers import encode_default
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """
+    Исключение: действие ViewSet'а выполнило больше SQL-запросов, чем заявлено.
+    """
+
+
+class QueryCounter:
+    """
+    Обёртка выполнения SQL (``connection.execute_wrapper``), считающая запросы.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class QueryBudgetMixin:
+    """
+    Примесь, проверяющая бюджет SQL-запросов для действий ViewSet'а.
+
+    Атрибут ``query_budget`` сопоставляет имя действия максимальному числу
+    запросов. Поведение при превышении задаётся настройкой
+    ``REM_QUERY_BUDGET_MODE``: ``"off"`` — не считать, ``"warn"`` —
+    писать предупреждение в лог, ``"raise"`` — выбрасывать
+    ``QueryBudgetExceeded`` (используется в тестах).
+    """
+
+    query_budget = {}
+
+    def get_query_budget(self):
+        """
+        Возвращает бюджет запросов текущего действия или ``None``.
+        """
+        return self.query_budget.get(getattr(self, "action", None))
+
+    def dispatch(self, request, *args, **kwargs):
+        """
+        Выполняет запрос, подсчитывая SQL-запросы, и сверяет их с бюджетом.
+        """
+        mode = getattr(settings, "REM_QUERY_BUDGET_MODE", "off")
+        if mode == "off":
+            return super().dispatch(request, *args, **kwargs)
+
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            response = super().dispatch(request, *args, **kwargs)
+        self.check_query_budget(counter.count, mode)
+        return response
+
+    def check_query_budget(self, count, mode):
+        """
+        Сверяет число выполненных запросов с бюджетом текущего действия.
+        """
+        budget = self.get_query_budget()
+        if budget is not None and count > budget:
+            message = (
+                f"{type(self).__name__}.{self.action}: выполнено {count} "
+                f"SQL-запросов при бюджете {budget}."
+            )
+            if mode == "raise":
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+
+    def stream_within_budget(self, chunks):
+        """
+        Отдаёт части потокового ответа, подсчитывая запросы при их чтении.
+
+        Потоковый ответ читается после ``dispatch``, поэтому запросы,
+        выполняемые генератором, сверяются с бюджетом отдельно, когда
+        поток исчерпан. Счётчик подключается только на время получения
+        очередной части, и запросы, выполненные между частями, не
+        учитываются.
+        """
+        mode = getattr(settings, "REM_QUERY_BUDGET_MODE", "off")
+        if mode == "off":
+            yield from chunks
+            return
+
+        counter = QueryCounter()
+        chunks = iter(chunks)
+        while True:
+            with connection.execute_wrapper(counter):
+                chunk = next(chunks, None)
+            if chunk is None:
+                break
+            yield chunk
+        self.check_query_budget(counter.count, mode)
+
+
+class ActionMetricsMixin:
+    """
+    Примесь, задающая метку ``view`` метрик запроса (см. ``rem.metrics``)
+    по имени действия: ``order-list``, ``master-statistics``,
+    ``order-change-price``.
+    """
+
+    def get_metrics_name(self):
+        """
+        Возвращает метку действия для метрик.
+        """
+        basename = getattr(self, "basename", None) or self.queryset.model._meta.model_name
+        action = getattr(self, "action", None) or self.request.method.lower()
+        return f"{basename}-{action}".replace("_", "-")
+
+    def initial(self, request, *args, **kwargs):
+        """
+        Задаёт метку действия до проверки прав, чтобы отказы тоже учитывались.
+        """
+        metrics.set_view_name(self.get_metrics_name())
+        super().initial(request, *args, **kwargs)
+
+
+class IncludeRelatedMixin:
+    """
+    Примесь, загружающая связи из параметра ``?include=`` через ``select_related``
+    и передающая их сериализатору, чтобы число запросов не зависело от
+    размера страницы.
+    """
+
+    include_query_param = "include"
+
+    def get_include(self):
+        """
+        Возвращает дерево запрошенных связей для текущего сериализатора.
+        """
+        if not hasattr(self, "_include"):
+            serializer_class = self.get_serializer_class()
+            parse_include = getattr(serializer_class, "parse_include", None)
+            request = getattr(self, "request", None)
+            if parse_include is None or request is None:
+                self._include = {}
+            else:
+                self._include = parse_include(
+                    request.query_params.get(self.include_query_param)
+                )
+        return self._include
+
+    def get_queryset(self):
+        """
+        Добавляет ``select_related`` для запрошенных связей.
+        """
+        queryset = super().get_queryset()
+        include = self.get_include()
+        if include:
+            paths = self.get_serializer_class().select_related_paths(include)
+            queryset = queryset.select_related(*paths)
+        return queryset
+
+    def get_serializer_context(self):
+        """
+        Передаёт дерево связей сериализатору.
+        """
+        context = super().get_serializer_context()
+        context["include"] = self.get_include()
+        return context
+
+
+class SparseFieldsetViewMixin:
+    """
+    Примесь, обрабатывающая параметры ``?fields=`` и ``?omit=``: сериализатор
+    выводит только запрошенные поля, а queryset загружает только нужные
+    столбцы через ``.only()``/``.defer()``.
+
+    Первичный ключ, поля сортировки пагинации и внешние ключи встраиваемых
+    связей загружаются всегда, чтобы не вызывать дозагрузку по строкам.
+    """
+
+    fields_query_param = "fields"
+    omit_query_param = "omit"
+
+    def get_sparse_fieldset(self):
+        """
+        Возвращает пару множеств (fields, omit) из параметров запроса.
+        """
+        if not hasattr(self, "_sparse_fieldset"):
+            request = getattr(self, "request", None)
+            if request is None or request.method not in SAFE_METHODS:
+                self._sparse_fieldset = (frozenset(), frozenset())
+            else:
+                self._sparse_fieldset = (
+                    self._parse_names(request.query_params.get(self.fields_query_param)),
+                    self._parse_names(request.query_params.get(self.omit_query_param)),
+                )
+        return self._sparse_fieldset
+
+    @staticmethod
+    def _parse_names(value):
+        """
+        Разбирает список имён полей, разделённых запятыми.
+        """
+        return frozenset(name.strip() for name in (value or "").split(",") if name.strip())
+
+    def get_queryset(self):
+        """
+        Сужает SELECT до запрошенных полей модели.
+        """
+        queryset = super().get_queryset()
+        fields, omit = self.get_sparse_fieldset()
+        if not fields and not omit:
+            return queryset
+
+        model = queryset.model
+        required = {model._meta.pk.name}
+        required.update(
+            name.lstrip("-") for name in getattr(self.paginator, "ordering", None) or ()
+        )
+        serializer_class = self.get_serializer_class()
+        for name in self.get_include():
+            required.add(serializer_class.expandable_fields[name][0])
+
+        if fields:
+            return queryset.only(*(self._model_fields(model, fields) | required))
+        deferred = self._model_fields(model, omit) - required
+        return queryset.defer(*deferred) if deferred else queryset
+
+    @staticmethod
+    def _model_fields(model, names):
+        """
+        Возвращает имена столбцов модели среди переданных имён полей.
+        """
+        result = set()
+        for name in names:
+            try:
+                field = model._meta.get_field(name)
+            except FieldDoesNotExist:
+                continue
+            if field.concrete and not field.many_to_many:
+                result.add(field.name)
+        return result
+
+    def get_serializer_context(self):
+        """
+        Передаёт наборы полей сериализатору.
+        """
+        context = super().get_serializer_context()
+        context["fields"], context["omit"] = self.get_sparse_fieldset()
+        return context
+
+
+class ConditionalGetMixin:
+    """
+    Примесь, добавляющая ETag, Last-Modified и Cache-Control к спискам и
+    детальным представлениям и отвечающая ``304 Not Modified`` на
+    ``If-None-Match``/``If-Modified-Since``.
+
+    Валидаторы вычисляются по версиям моделей ответа (см. ``rem.caching``),
+    поэтому ответ 304 не требует запросов к таблицам.
+
+    Атрибуты:
+        cache_control (dict): Директивы Cache-Control для успешных ответов.
+    """
+
+    cache_control = {"private": True, "no_cache": True}
+    conditional_vary_headers = ("Accept",)
+
+    def get_version_models(self):
+        """
+        Возвращает модели, от которых зависит ответ: модель queryset'а и
+        модели встраиваемых связей.
+        """
+        model = self.queryset.model
+        models = {model}
+        serializer_class = self.get_serializer_class()
+        select_related_paths = getattr(serializer_class, "select_related_paths", None)
+        if select_related_paths is not None:
+            for path in select_related_paths(self.get_include()):
+                related = model
+                for name in path.split("__"):
+                    related = related._meta.get_field(name).related_model
+                    models.add(related)
+        return models
+
+    def get_versions(self):
+        """
+        Возвращает версии моделей ответа (один раз за запрос).
+        """
+        if not hasattr(self, "_versions"):
+            self._versions = get_model_versions(self.get_version_models())
+        return self._versions
+
+    def get_request_digest(self, *headers):
+        """
+        Возвращает хэш пути запроса, заданных заголовков и версий моделей.
+        """
+        digest = hashlib.md5(usedforsecurity=False)
+        digest.update(self.request.get_full_path().encode("utf-8"))
+        for header in headers:
+            digest.update(b"|" + self.request.headers.get(header, "").encode("utf-8"))
+        versions = self.get_versions()
+        for model, version in sorted(versions.items(), key=lambda item: item[0]._meta.label):
+            digest.update(f"|{model._meta.label}:{version}".encode("utf-8"))
+        return digest.hexdigest()
+
+    def get_validators(self):
+        """
+        Возвращает пару (ETag, Last-Modified) для текущего запроса.
+        """
+        etag = quote_etag(self.get_request_digest(*self.conditional_vary_headers))
+        last_modified = max(self.get_versions().values()) // 1_000_000_000
+        return etag, last_modified
+
+    def conditional_get(self, handler, request, *args, **kwargs):
+        """
+        Выполняет обработчик, если у клиента нет актуальной копии ответа.
+        """
+        etag, last_modified = self.get_validators()
+        response = get_conditional_response(
+            request._request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        return self.patch_conditional_headers(response, etag, last_modified)
+
+    def patch_conditional_headers(self, response, etag, last_modified):
+        """
+        Добавляет валидаторы и Cache-Control к успешному ответу.
+        """
+        if response.status_code in (200, 304):
+            response["ETag"] = etag
+            response["Last-Modified"] = http_date(last_modified)
+            patch_cache_control(response, **self.cache_control)
+            patch_vary_headers(response, self.conditional_vary_headers)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        """
+        Возвращает список с поддержкой условного GET.
+        """
+        return self.conditional_get(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Возвращает объект с поддержкой условного GET.
+        """
+        return self.conditional_get(super().retrieve, request, *args, **kwargs)
+
+
+class CachedResponseMixin:
+    """
+    Примесь, кэширующая данные ответов выбранных действий в кэше (Redis).
+
+    Ключ включает схему, хост и путь запроса и версии моделей ответа
+    (абсолютные ссылки ответа зависят от хоста), поэтому запись
+    модели (сигналы ``post_save``/``post_delete`` обновляют версию) сразу
+    делает старые ключи недостижимыми без перебора ключей; они истекают
+    по таймауту. Кэшируются данные до рендеринга, поэтому один ключ
+    обслуживает все форматы ответа. Используется вместе с
+    ``ConditionalGetMixin``, от которого берутся версии моделей.
+
+    Атрибуты:
+        cache_actions (tuple): Действия, ответы которых кэшируются.
+        cache_timeout (int): Время жизни записи в секундах.
+    """
+
+    cache_actions = ()
+    cache_timeout = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for action in cls.cache_actions:
+            name = f"{cls.__name__}.{action}"
+            if name not in CACHED_ACTIONS:
+                CACHED_ACTIONS.append(name)
+
+    def get_cache_timeout(self):
+        """
+        Возвращает время жизни записи кэша.
+        """
+        if self.cache_timeout is not None:
+            return self.cache_timeout
+        return getattr(settings, "REM_RESPONSE_CACHE_TIMEOUT", 300)
+
+    def get_cache_origin(self):
+        """
+        Возвращает схему и хост запроса: данные ответа содержат абсолютные
+        ссылки (пагинация, ``url``), поэтому ответы разных хостов кэшируются
+        отдельно.
+        """
+        return f"{self.request.scheme}://{self.request.get_host()}"
+
+    def get_response_cache_key(self):
+        """
+        Возвращает пару (имя действия для счётчиков, ключ кэша ответа).
+        """
+        name = f"{type(self).__name__}.{self.action}"
+        digest = hashlib.md5(usedforsecurity=False)
+        digest.update(self.get_cache_origin().encode("utf-8"))
+        digest.update(self.get_request_digest().encode("ascii"))
+        return name, f"rem:response:{name}:{digest.hexdigest()}"
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        """
+        Возвращает ответ из кэша или выполняет обработчик и кэширует результат.
+        """
+        if self.action not in self.cache_actions or request.method not in ("GET", "HEAD"):
+            return handler(request, *args, **kwargs)
+
+        name, key = self.get_response_cache_key()
+        cached = cache.get(key)
+        if cached is not None:
+            count_cache_event(name, "hit")
+            return Response(cached)
+
+        count_cache_event(name, "miss")
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, timeout=self.get_cache_timeout())
+        return response
+
+    def list(self, request, *args, **kwargs):
+        """
+        Возвращает список, используя кэш ответов.
+        """
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Возвращает объект, используя кэш ответов.
+        """
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+
+class _Echo:
+    """
+    Псевдобуфер для ``csv.writer``: возвращает записанную строку.
+    """
+
+    def write(self, value):
+        return value
+
+
+def _export_value(value):
+    """
+    Приводит значение столбца к виду, принятому в API: Decimal — строкой,
+    даты — в формате ISO 8601 в текущем часовом поясе.
+    """
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, datetime.datetime) and timezone.is_aware(value):
+        value = timezone.localtime(value)
+    if isinstance(value, (datetime.date, datetime.time)):
+        return encode_default(value)
+    return value
+
+
+class ExportMixin:
+    """
+    Примесь, добавляющая действие ``export``: потоковую выгрузку всех записей,
+    отобранных фильтрами ViewSet'а, в CSV или NDJSON (``?export_format=``).
+
+    Записи читаются через ``values_list(...).iterator(chunk_size=...)`` без
+    создания объектов моделей и сразу отдаются клиенту, поэтому память
+    сервера не зависит от числа строк. Запросы выполняются при чтении
+    потока, после ``dispatch``, и сверяются с бюджетом действия ``export``
+    в ``stream_within_budget``. Столбцы можно сузить параметрами
+    ``?fields=``/``?omit=``.
+
+    Атрибуты:
+        export_fields (tuple): Столбцы выгрузки по умолчанию.
+    """
+
+    export_fields = ()
+    export_formats = {
+        "csv": "text/csv; charset=utf-8",
+        "ndjson": "application/x-ndjson",
+    }
+
+    def get_export_fields(self):
+        """
+        Возвращает столбцы выгрузки с учётом ``?fields=``/``?omit=``.
+        """
+        fields, omit = self.get_sparse_fieldset()
+        columns = [
+            name
+            for name in self.export_fields
+            if (not fields or name in fields) and name not in omit
+        ]
+        return columns or list(self.export_fields)
+
+    @action(methods=["GET"], detail=False)
+    def export(self, request):
+        """
+        Выгружает отфильтрованные записи потоком в CSV или NDJSON.
+        """
+        export_format = request.query_params.get("export_format", "csv")
+        if export_format not in self.export_formats:
+            raise ValidationError(
+                {"export_format": f"Допустимые форматы: {', '.join(self.export_formats)}."}
+            )
+
+        columns = self.get_export_fields()
+        chunk_size = getattr(settings, "REM_EXPORT_CHUNK_SIZE", 2000)
+        rows = (
+            self.filter_queryset(self.queryset.all())
+            .order_by("pk")
+            .values_list(*columns)
+            .iterator(chunk_size=chunk_size)
+        )
+        stream = self._csv_stream if export_format == "csv" else self._ndjson_stream
+        response = StreamingHttpResponse(
+            self.stream_within_budget(stream(columns, rows)),
+            content_type=self.export_formats[export_format],
+        )
+        filename = f"{self.queryset.model._meta.model_name}s.{export_format}"
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+    @staticmethod
+    def _csv_stream(columns, rows):
+        """
+        Генерирует строки CSV с заголовком.
+        """
+        writer = csv.writer(_Echo())
+        yield writer.writerow(columns)
+        for row in rows:
+            yield writer.writerow([_export_value(value) for value in row])
+
+    @staticmethod
+    def _ndjson_stream(columns, rows):
+        """
+        Генерирует строки NDJSON: по одному JSON-объекту на запись.
+        """
+        for row in rows:
+            yield orjson.dumps(
+                {column: _export_value(value) for column, value in zip(columns, row)}
+            ) + b"\n"
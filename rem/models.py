@@ -1,6 +1,6 @@
 from django.db import models
 from django.utils import timezone
-from simple_history.models import HistoricalRecords
+from .history import IndexedHistoricalRecords
 
 class Speciality(models.Model):
     """
@@ -10,10 +10,10 @@ class Speciality(models.Model):
 
     Атрибуты:
         name (str): Название специальности, должно быть уникальным.
-        history (HistoricalRecords): Хранит историю изменений объектов.
+        history (IndexedHistoricalRecords): Хранит историю изменений объектов.
     """
     name = models.CharField(max_length=200, unique=True)
-    history = HistoricalRecords()
+    history = IndexedHistoricalRecords()
 
     class Meta:
         """
@@ -42,12 +42,12 @@ class Client(models.Model):
         full_name (str): Полное имя клиента, должно быть уникальным.
         email (str): Электронная почта клиента, может быть пустым.
         created_at (datetime): Дата и время создания записи о клиенте.
-        history (HistoricalRecords): Хранит историю изменений объектов.
+        history (IndexedHistoricalRecords): Хранит историю изменений объектов.
     """
     full_name = models.CharField(max_length=200, unique=True)
     email = models.CharField(max_length=320, blank=True)
     created_at = models.DateTimeField(default=timezone.now)
-    history = HistoricalRecords()
+    history = IndexedHistoricalRecords()
 
     class Meta:
         """
@@ -56,9 +56,13 @@ class Client(models.Model):
         Атрибуты:
             verbose_name (str): Человекочитаемое название модели в единственном числе.
             verbose_name_plural (str): Человекочитаемое название модели во множественном числе.
+            indexes (list): Индексы модели, в том числе (дата создания, id) для keyset-пагинации.
         """
         verbose_name = "Клиент"
         verbose_name_plural = "Клиенты"
+        indexes = [
+            models.Index(fields=["created_at", "id"], name="rem_client_created_id_idx"),
+        ]
 
     def __str__(self):
         """
@@ -66,6 +70,18 @@ class Client(models.Model):
         """
         return str(self.full_name)
 
+# Поля мастера, которые поддерживает rem.ratings при изменении отзывов
+REVIEW_FIELDS = (
+    "review_count",
+    "rating_sum",
+    "reviews_1",
+    "reviews_2",
+    "reviews_3",
+    "reviews_4",
+    "reviews_5",
+)
+
+
 class Master(models.Model):
     """
     Модель мастера.
@@ -77,7 +93,15 @@ class Master(models.Model):
         speciality (ForeignKey): Ссылка на объект специальности, к которой относится мастер.
         description (str): Описание мастера, может быть пустым.
         rating (Decimal): Рейтинг мастера, с максимальной длиной 10 и двумя знаками после запятой.
-        history (HistoricalRecords): Хранит историю изменений объектов.
+            При наличии отзывов — средняя оценка отзывов; после удаления последнего
+            отзыва остаётся последняя средняя оценка.
+        review_count (int): Количество отзывов о мастере.
+        rating_sum (Decimal): Сумма оценок отзывов о мастере.
+        reviews_1 ... reviews_5 (int): Распределение оценок отзывов по целой части (от 1 до 5).
+        history (IndexedHistoricalRecords): Хранит историю изменений объектов.
+
+    Поля отзывов поддерживаются модулем ``rem.ratings`` при каждом изменении
+    отзывов и пересчитываются командой ``recompute_master_ratings``.
     """
     full_name = models.CharField(max_length=200, unique=True)
     speciality = models.ForeignKey(
@@ -87,7 +111,14 @@ class Master(models.Model):
     )
     description = models.CharField(max_length=300, blank=True, verbose_name="Описание")
     rating = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Рейтинг")
-    history = HistoricalRecords()
+    review_count = models.PositiveIntegerField(default=0, verbose_name="Количество отзывов")
+    rating_sum = models.DecimalField(max_digits=12, decimal_places=1, default=0, verbose_name="Сумма оценок")
+    reviews_1 = models.PositiveIntegerField(default=0, verbose_name="Отзывов с оценкой 1")
+    reviews_2 = models.PositiveIntegerField(default=0, verbose_name="Отзывов с оценкой 2")
+    reviews_3 = models.PositiveIntegerField(default=0, verbose_name="Отзывов с оценкой 3")
+    reviews_4 = models.PositiveIntegerField(default=0, verbose_name="Отзывов с оценкой 4")
+    reviews_5 = models.PositiveIntegerField(default=0, verbose_name="Отзывов с оценкой 5")
+    history = IndexedHistoricalRecords()
 
     class Meta:
         """
@@ -100,6 +131,47 @@ class Master(models.Model):
         verbose_name = "Мастер"
         verbose_name_plural = "Мастеры"
 
+    def save(self, *args, **kwargs):
+        """
+        Сохраняет мастера. Полное сохранение существующего мастера не
+        записывает поля отзывов: их меняют отзывы через ``F()``-выражения,
+        и устаревшие значения в памяти (форма админки, API, импорт) не
+        затирают изменения параллельных отзывов. Рейтинг входит в тот же
+        ``UPDATE`` только у мастера без отзывов (см. ``_do_update``).
+        """
+        if self._state.adding or kwargs.get("update_fields") is not None or kwargs.get("force_insert"):
+            return super().save(*args, **kwargs)
+        kwargs["update_fields"] = [
+            field.name
+            for field in self._meta.concrete_fields
+            if not field.primary_key
+            and field.name not in REVIEW_FIELDS
+            and (field.name != "rating" or not self.review_count)
+        ]
+        super().save(*args, **kwargs)
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        """
+        Обновляет строку мастера. Рейтинг записывается условно: если в базе
+        у мастера уже есть отзывы (экземпляр загружен до них), ``UPDATE``
+        оставляет рейтинг, вычисленный по отзывам.
+        """
+        values = [
+            (
+                field,
+                model,
+                models.Case(
+                    models.When(review_count=0, then=models.Value(value, output_field=field)),
+                    default=models.F(field.attname),
+                    output_field=field,
+                ),
+            )
+            if field.name == "rating" and not hasattr(value, "resolve_expression")
+            else (field, model, value)
+            for field, model, value in values
+        ]
+        return super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
+
     def __str__(self):
         """
         Возвращает строковое представление объекта мастера.
@@ -119,15 +191,21 @@ class Order(models.Model):
         create_at (datetime): Дата и время создания заказа.
         updated_at (datetime): Дата и время последнего обновления заказа.
         price (Decimal): Цена заказа.
-        history (HistoricalRecords): Хранит историю изменений объектов.
+        history (IndexedHistoricalRecords): Хранит историю изменений объектов.
     """
     number = models.DecimalField(max_digits=3, decimal_places=0, verbose_name="Номер Заказа")
-    id_user = models.ForeignKey(Client, on_delete=models.CASCADE, verbose_name="ID клиента")
-    id_master = models.ForeignKey(Master, on_delete=models.CASCADE, verbose_name="ID мастера")
+    # Одиночные индексы внешних ключей не создаются: их заменяют составные
+    # индексы (мастер, дата создания) и (клиент, дата создания)
+    id_user = models.ForeignKey(
+        Client, on_delete=models.CASCADE, db_index=False, verbose_name="ID клиента"
+    )
+    id_master = models.ForeignKey(
+        Master, on_delete=models.CASCADE, db_index=False, verbose_name="ID мастера"
+    )
     create_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(default=timezone.now)
     price = models.DecimalField(max_digits=10, decimal_places=0, verbose_name="Цена")
-    history = HistoricalRecords()
+    history = IndexedHistoricalRecords()
 
     class Meta:
         """
@@ -136,9 +214,21 @@ class Order(models.Model):
         Атрибуты:
             verbose_name (str): Человекочитаемое название модели в единственном числе.
             verbose_name_plural (str): Человекочитаемое название модели во множественном числе.
+            indexes (list): Индексы модели: (дата создания, id) для keyset-пагинации,
+                (мастер, дата создания) и (клиент, дата создания) для заказов
+                мастера или клиента за период, цена, дата изменения и номер для
+                фильтров, сортировок и поиска.
         """
         verbose_name = "Заказ"
         verbose_name_plural = "Заказы"
+        indexes = [
+            models.Index(fields=["create_at", "id"], name="rem_order_create_id_idx"),
+            models.Index(fields=["id_master", "create_at"], name="rem_order_master_create_idx"),
+            models.Index(fields=["id_user", "create_at"], name="rem_order_user_create_idx"),
+            models.Index(fields=["price"], name="rem_order_price_idx"),
+            models.Index(fields=["updated_at"], name="rem_order_updated_idx"),
+            models.Index(fields=["number"], name="rem_order_number_idx"),
+        ]
 
     def __str__(self):
         """
@@ -192,7 +282,10 @@ class Review(models.Model):
     """
 
     client = models.ForeignKey(Client, on_delete=models.CASCADE, verbose_name="Клиент")
-    master = models.ForeignKey(Master, on_delete=models.CASCADE, verbose_name="Мастер")
+    # Одиночный индекс мастера заменяет составной (мастер, дата создания)
+    master = models.ForeignKey(
+        Master, on_delete=models.CASCADE, db_index=False, verbose_name="Мастер"
+    )
     rating = models.DecimalField(max_digits=2, decimal_places=1, verbose_name="Рейтинг")
     comment = models.TextField()
     created_at = models.DateTimeField(default=timezone.now)
@@ -204,9 +297,15 @@ class Review(models.Model):
         Атрибуты:
             verbose_name (str): Человекочитаемое название модели в единственном числе.
             verbose_name_plural (str): Человекочитаемое название модели во множественном числе.
+            indexes (list): Индексы модели: (дата создания, id) для keyset-пагинации
+                и (мастер, дата создания) для отзывов о мастере.
         """
         verbose_name = "Отзыв"
         verbose_name_plural = "Отзывы"
+        indexes = [
+            models.Index(fields=["created_at", "id"], name="rem_review_created_id_idx"),
+            models.Index(fields=["master", "created_at"], name="rem_review_master_created_idx"),
+        ]
     
     def __str__(self):
         """
@@ -214,6 +313,300 @@ class Review(models.Model):
         """
         return f"Отзыв {self.id} для {self.master}"
 
+class DailyMasterRollup(models.Model):
+    """
+    Модель дневного агрегата заказов мастера.
+
+    Строки поддерживаются модулем ``rem.rollups`` при каждом изменении
+    заказов и перестраиваются задачей ``rebuild_rollups``.
+
+    Атрибуты:
+        day (date): День создания заказов (в текущем часовом поясе).
+        master (ForeignKey): Ссылка на мастера.
+        order_count (int): Количество заказов.
+        price_sum (Decimal): Сумма цен заказов.
+        price_min (Decimal): Минимальная цена заказа, пусто при отсутствии заказов.
+        price_max (Decimal): Максимальная цена заказа, пусто при отсутствии заказов.
+    """
+    day = models.DateField(verbose_name="День")
+    master = models.ForeignKey(Master, on_delete=models.CASCADE, verbose_name="Мастер")
+    order_count = models.PositiveIntegerField(default=0, verbose_name="Количество заказов")
+    price_sum = models.DecimalField(max_digits=16, decimal_places=0, default=0, verbose_name="Выручка")
+    price_min = models.DecimalField(max_digits=10, decimal_places=0, null=True, verbose_name="Минимальная цена")
+    price_max = models.DecimalField(max_digits=10, decimal_places=0, null=True, verbose_name="Максимальная цена")
+
+    class Meta:
+        """
+        Метаданные модели дневного агрегата мастера.
+
+        Атрибуты:
+            verbose_name (str): Человекочитаемое название модели в единственном числе.
+            verbose_name_plural (str): Человекочитаемое название модели во множественном числе.
+            ordering (list): Сортировка по умолчанию: новые дни первыми.
+            constraints (list): Одна строка на пару (день, мастер).
+        """
+        verbose_name = "Дневной агрегат мастера"
+        verbose_name_plural = "Дневные агрегаты мастеров"
+        ordering = ["-day", "master"]
+        constraints = [
+            models.UniqueConstraint(fields=["day", "master"], name="rem_master_rollup_day_uniq"),
+        ]
+
+    def __str__(self):
+        """
+        Возвращает строковое представление агрегата.
+        """
+        return f"{self.day} {self.master_id}"
+
+class DailySpecialityRollup(models.Model):
+    """
+    Модель дневного агрегата заказов по специальности мастера.
+
+    Атрибуты:
+        day (date): День создания заказов (в текущем часовом поясе).
+        speciality (ForeignKey): Ссылка на специальность.
+        order_count (int): Количество заказов.
+        price_sum (Decimal): Сумма цен заказов.
+        price_min (Decimal): Минимальная цена заказа, пусто при отсутствии заказов.
+        price_max (Decimal): Максимальная цена заказа, пусто при отсутствии заказов.
+    """
+    day = models.DateField(verbose_name="День")
+    speciality = models.ForeignKey(Speciality, on_delete=models.CASCADE, verbose_name="Специальность")
+    order_count = models.PositiveIntegerField(default=0, verbose_name="Количество заказов")
+    price_sum = models.DecimalField(max_digits=16, decimal_places=0, default=0, verbose_name="Выручка")
+    price_min = models.DecimalField(max_digits=10, decimal_places=0, null=True, verbose_name="Минимальная цена")
+    price_max = models.DecimalField(max_digits=10, decimal_places=0, null=True, verbose_name="Максимальная цена")
+
+    class Meta:
+        """
+        Метаданные модели дневного агрегата специальности.
+
+        Атрибуты:
+            verbose_name (str): Человекочитаемое название модели в единственном числе.
+            verbose_name_plural (str): Человекочитаемое название модели во множественном числе.
+            ordering (list): Сортировка по умолчанию: новые дни первыми.
+            constraints (list): Одна строка на пару (день, специальность).
+        """
+        verbose_name = "Дневной агрегат специальности"
+        verbose_name_plural = "Дневные агрегаты специальностей"
+        ordering = ["-day", "speciality"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["day", "speciality"], name="rem_speciality_rollup_day_uniq"
+            ),
+        ]
+
+    def __str__(self):
+        """
+        Возвращает строковое представление агрегата.
+        """
+        return f"{self.day} {self.speciality_id}"
+
+AUTOCOMPLETE_KINDS = [("client", "Клиент"), ("master", "Мастер")]
+
+
+class AutocompleteToken(models.Model):
+    """
+    Модель слова имени в индексе автодополнения.
+
+    Строки поддерживаются модулем ``rem.autocomplete`` при каждом изменении
+    имён клиентов и мастеров и перестраиваются командой ``rebuild_autocomplete``.
+
+    Атрибуты:
+        kind (str): Тип объекта: клиент или мастер.
+        object_id (int): Id клиента или мастера.
+        token (str): Нормализованное слово имени (casefold, «ё» заменена на «е»).
+        name (str): Имя объекта для вывода.
+    """
+    kind = models.CharField(max_length=10, choices=AUTOCOMPLETE_KINDS, verbose_name="Тип")
+    object_id = models.PositiveIntegerField(verbose_name="Id объекта")
+    token = models.CharField(max_length=200, verbose_name="Слово")
+    name = models.CharField(max_length=200, verbose_name="Имя")
+
+    class Meta:
+        """
+        Метаданные модели слова автодополнения.
+
+        Атрибуты:
+            verbose_name (str): Человекочитаемое название модели в единственном числе.
+            verbose_name_plural (str): Человекочитаемое название модели во множественном числе.
+            indexes (list): (тип, слово) для поиска по префиксу диапазоном,
+                (тип, id объекта, слово) для проверки остальных слов запроса
+                в имени объекта и для обновления.
+        """
+        verbose_name = "Слово автодополнения"
+        verbose_name_plural = "Слова автодополнения"
+        indexes = [
+            models.Index(fields=["kind", "token"], name="rem_autocomplete_token_idx"),
+            models.Index(
+                fields=["kind", "object_id", "token"], name="rem_autocomplete_object_idx"
+            ),
+        ]
+
+    def __str__(self):
+        """
+        Возвращает строковое представление слова.
+        """
+        return f"{self.kind} {self.object_id}: {self.token}"
+
+
+class AutocompleteTrigram(models.Model):
+    """
+    Модель триграммы слова в индексе автодополнения: используется для
+    поиска с опечатками. Триграммы хранятся для словаря слов имён, а не
+    для каждого объекта, поэтому их число не растёт с повторами имён.
+
+    Атрибуты:
+        kind (str): Тип объектов, в именах которых встречается слово.
+        token (str): Нормализованное слово.
+        trigram (str): Триграмма слова.
+    """
+    kind = models.CharField(max_length=10, choices=AUTOCOMPLETE_KINDS, verbose_name="Тип")
+    token = models.CharField(max_length=200, verbose_name="Слово")
+    trigram = models.CharField(max_length=3, verbose_name="Триграмма")
+
+    class Meta:
+        """
+        Метаданные модели триграммы автодополнения.
+
+        Атрибуты:
+            verbose_name (str): Человекочитаемое название модели в единственном числе.
+            verbose_name_plural (str): Человекочитаемое название модели во множественном числе.
+            constraints (list): Одна строка на (тип, триграмма, слово); индекс
+                ограничения покрывает подсчёт совпавших триграмм по словам.
+        """
+        verbose_name = "Триграмма автодополнения"
+        verbose_name_plural = "Триграммы автодополнения"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["kind", "trigram", "token"], name="rem_autocomplete_trigram_uniq"
+            ),
+        ]
+
+    def __str__(self):
+        """
+        Возвращает строковое представление триграммы.
+        """
+        return f"{self.kind} {self.token}: {self.trigram}"
+
+REMINDER_KINDS = [("recent", "Недавний заказ"), ("stale", "Давно не заказывал")]
+REMINDER_STATUSES = [("pending", "Ожидает"), ("sent", "Отправлено"), ("failed", "Ошибка")]
+
+
+class ReminderDelivery(models.Model):
+    """
+    Модель доставки напоминания клиенту.
+
+    Строки создаются задачей ``send_reminder_email`` (``rem.reminders``)
+    до отправки писем и обновляются после отправки пачки.
+
+    Атрибуты:
+        client (ForeignKey): Ссылка на клиента.
+        date (date): День рассылки.
+        kind (str): Повод напоминания: недавний заказ или давний последний заказ.
+        status (str): Состояние доставки: ожидает, отправлено или ошибка.
+        error (str): Текст ошибки отправки.
+        sent_at (datetime): Дата и время отправки, пусто до отправки.
+    """
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, verbose_name="Клиент")
+    date = models.DateField(verbose_name="День рассылки")
+    kind = models.CharField(max_length=10, choices=REMINDER_KINDS, verbose_name="Повод")
+    status = models.CharField(
+        max_length=10, choices=REMINDER_STATUSES, default="pending", verbose_name="Состояние"
+    )
+    error = models.TextField(blank=True, verbose_name="Ошибка")
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name="Отправлено")
+
+    class Meta:
+        """
+        Метаданные модели доставки напоминания.
+
+        Атрибуты:
+            verbose_name (str): Человекочитаемое название модели в единственном числе.
+            verbose_name_plural (str): Человекочитаемое название модели во множественном числе.
+            constraints (list): Одно напоминание клиенту в день; индекс ограничения
+                покрывает проверку недавних напоминаний клиента.
+            indexes (list): (день, состояние) для выбора доставок рассылки.
+        """
+        verbose_name = "Доставка напоминания"
+        verbose_name_plural = "Доставки напоминаний"
+        constraints = [
+            models.UniqueConstraint(fields=["client", "date"], name="rem_reminder_client_date_uniq"),
+        ]
+        indexes = [
+            models.Index(fields=["date", "status"], name="rem_reminder_date_status_idx"),
+        ]
+
+    def __str__(self):
+        """
+        Возвращает строковое представление доставки.
+        """
+        return f"{self.date} {self.client_id}: {self.status}"
+
+OUTBOX_STATUSES = [
+    ("pending", "Ожидает"),
+    ("processing", "Обрабатывается"),
+    ("done", "Доставлено"),
+    ("failed", "Ошибка"),
+]
+
+
+class OutboxMessage(models.Model):
+    """
+    Модель сообщения исходящей очереди (transactional outbox).
+
+    Строка создаётся в той же транзакции, что и изменение, вызвавшее
+    побочное действие (например, письмо новому клиенту), и доставляется
+    задачей ``drain_outbox`` (``rem.outbox``) после фиксации.
+
+    Атрибуты:
+        kind (str): Тип сообщения, по которому выбирается обработчик.
+        payload (dict): Данные сообщения.
+        status (str): Состояние: ожидает, обрабатывается, доставлено или ошибка.
+        attempts (int): Число попыток доставки.
+        available_at (datetime): Время, с которого сообщение можно доставлять.
+        locked_until (datetime): Окончание аренды сообщения обработчиком.
+        claim_token (str): Метка захвата сообщения обработчиком.
+        last_error (str): Текст последней ошибки доставки.
+        created_at (datetime): Дата и время создания сообщения.
+        processed_at (datetime): Дата и время доставки, пусто до доставки.
+    """
+    kind = models.CharField(max_length=50, verbose_name="Тип")
+    payload = models.JSONField(default=dict, verbose_name="Данные")
+    status = models.CharField(
+        max_length=10, choices=OUTBOX_STATUSES, default="pending", verbose_name="Состояние"
+    )
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Попыток")
+    available_at = models.DateTimeField(default=timezone.now, verbose_name="Доступно с")
+    locked_until = models.DateTimeField(null=True, blank=True, verbose_name="Аренда до")
+    claim_token = models.CharField(max_length=32, blank=True, verbose_name="Метка захвата")
+    last_error = models.TextField(blank=True, verbose_name="Ошибка")
+    created_at = models.DateTimeField(default=timezone.now, verbose_name="Создано")
+    processed_at = models.DateTimeField(null=True, blank=True, verbose_name="Доставлено")
+
+    class Meta:
+        """
+        Метаданные модели сообщения исходящей очереди.
+
+        Атрибуты:
+            verbose_name (str): Человекочитаемое название модели в единственном числе.
+            verbose_name_plural (str): Человекочитаемое название модели во множественном числе.
+            indexes (list): (состояние, доступно с) для выбора готовых к доставке
+                сообщений, (состояние, аренда до) для сообщений с истёкшей арендой.
+        """
+        verbose_name = "Сообщение исходящей очереди"
+        verbose_name_plural = "Исходящая очередь"
+        indexes = [
+            models.Index(fields=["status", "available_at"], name="rem_outbox_status_avail_idx"),
+            models.Index(fields=["status", "locked_until"], name="rem_outbox_status_lock_idx"),
+        ]
+
+    def __str__(self):
+        """
+        Возвращает строковое представление сообщения.
+        """
+        return f"{self.kind} {self.pk}: {self.status}"
+
 class Task(models.Model):
     """ Exemple de modèle pour représenter une tâche """
     title = models.CharField(max_length=200)
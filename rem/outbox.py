@@ -0,0 +1,156 @@
+"""
+Этот модуль содержит исходящую очередь (transactional outbox) побочных
+действий: писем и других событий, которые нельзя выполнять внутри
+транзакции запроса.
+
+``enqueue`` записывает ``OutboxMessage`` в текущей транзакции: сообщение
+появляется только вместе с изменением, вызвавшим его, и не появляется
+при откате. Задача ``drain_outbox`` захватывает готовые сообщения
+пачками по ``REM_OUTBOX_BATCH_SIZE``: ``UPDATE`` с условием на состояние
+ставит метку захвата и аренду на ``REM_OUTBOX_LEASE`` секунд, поэтому
+параллельные обработчики не берут одно сообщение. Сообщение передаётся
+обработчику своего типа (``@handler``) и отмечается доставленным только
+после его успешного выполнения; при ошибке повторяется с растущей
+задержкой, после ``REM_OUTBOX_MAX_ATTEMPTS`` попыток остаётся с ошибкой.
+Сообщения обработчика, упавшего без записи результата, снова становятся
+доступны по окончании аренды: доставка выполняется хотя бы один раз,
+поэтому обработчики должны допускать повтор. Попытки таких захватов тоже
+считаются, и сообщение, исчерпавшее их, отмечается ошибкой вместо
+очередного захвата.
+"""
+
+import datetime
+import logging
+import uuid
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+HANDLERS = {}
+
+
+def handler(kind):
+    """
+    Регистрирует функцию ``func(payload)`` обработчиком сообщений типа ``kind``.
+    """
+
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+
+    return register
+
+
+def enqueue(kind, payload=None, delay=None):
+    """
+    Добавляет сообщение в очередь в текущей транзакции. ``delay`` —
+    задержка доставки в секундах.
+    """
+    if kind not in HANDLERS:
+        raise ValueError(f"Нет обработчика сообщений {kind!r}.")
+    available_at = timezone.now()
+    if delay:
+        available_at += datetime.timedelta(seconds=delay)
+    return OutboxMessage.objects.create(kind=kind, payload=payload or {}, available_at=available_at)
+
+
+def claim(batch_size, lease):
+    """
+    Захватывает до ``batch_size`` готовых сообщений на ``lease`` секунд
+    и возвращает их список.
+    """
+    now = timezone.now()
+    max_attempts = getattr(settings, "REM_OUTBOX_MAX_ATTEMPTS", 10)
+    ready = Q(status="pending", available_at__lte=now) | Q(status="processing", locked_until__lt=now)
+    # Сообщение, обработчик которого на каждой попытке обрывал процесс без
+    # записи результата, не захватывается бесконечно: исчерпав попытки,
+    # оно остаётся с ошибкой
+    OutboxMessage.objects.filter(ready, attempts__gte=max_attempts).update(
+        status="failed",
+        locked_until=None,
+        last_error=f"Аренда истекла после {max_attempts} попыток без результата обработчика.",
+    )
+    ready &= Q(attempts__lt=max_attempts)
+    ids = list(OutboxMessage.objects.filter(ready).order_by("pk").values_list("pk", flat=True)[:batch_size])
+    if not ids:
+        return []
+    token = uuid.uuid4().hex
+    # Условие повторяется в UPDATE: сообщение, захваченное другим
+    # обработчиком после чтения id, не перезаписывается
+    OutboxMessage.objects.filter(ready, pk__in=ids).update(
+        status="processing",
+        claim_token=token,
+        locked_until=now + datetime.timedelta(seconds=lease),
+        attempts=F("attempts") + 1,
+    )
+    return list(OutboxMessage.objects.filter(pk__in=ids, claim_token=token).order_by("pk"))
+
+
+def deliver(message):
+    """
+    Выполняет обработчик сообщения и записывает результат. Возвращает
+    ``True`` при успешной доставке.
+    """
+    owned = OutboxMessage.objects.filter(pk=message.pk, claim_token=message.claim_token)
+    try:
+        HANDLERS[message.kind](message.payload)
+    except Exception as exc:
+        max_attempts = getattr(settings, "REM_OUTBOX_MAX_ATTEMPTS", 10)
+        delay = min(
+            getattr(settings, "REM_OUTBOX_RETRY_DELAY", 30) * 2 ** (message.attempts - 1),
+            getattr(settings, "REM_OUTBOX_MAX_RETRY_DELAY", 3600),
+        )
+        logger.warning("Сообщение очереди %s (%s) не доставлено: %s", message.pk, message.kind, exc)
+        owned.update(
+            status="failed" if message.attempts >= max_attempts else "pending",
+            available_at=timezone.now() + datetime.timedelta(seconds=delay),
+            locked_until=None,
+            last_error=f"{type(exc).__name__}: {exc}",
+        )
+        return False
+    owned.update(status="done", locked_until=None, processed_at=timezone.now(), last_error="")
+    return True
+
+
+def drain(batch_size=None, max_batches=None):
+    """
+    Доставляет готовые сообщения пачками, пока они есть (не больше
+    ``max_batches`` пачек). Возвращает пару (доставлено, с ошибкой).
+    """
+    batch_size = batch_size or getattr(settings, "REM_OUTBOX_BATCH_SIZE", 100)
+    lease = getattr(settings, "REM_OUTBOX_LEASE", 300)
+    delivered, failed, batches = 0, 0, 0
+    while max_batches is None or batches < max_batches:
+        messages = claim(batch_size, lease)
+        if not messages:
+            break
+        for message in messages:
+            if deliver(message):
+                delivered += 1
+            else:
+                failed += 1
+        batches += 1
+    return delivered, failed
+
+
+def purge(days):
+    """
+    Удаляет доставленные сообщения старше ``days`` дней и возвращает их число.
+    """
+    before = timezone.now() - datetime.timedelta(days=days)
+    return OutboxMessage.objects.filter(status="done", processed_at__lt=before).delete()[0]
+
+
+@handler("welcome_email")
+def send_welcome(payload):
+    """
+    Отправляет приветственное письмо новому клиенту.
+    """
+    from .views import send_welcome_email
+
+    send_welcome_email(payload["email"])
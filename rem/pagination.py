@@ -0,0 +1,257 @@
+"""
+Этот модуль содержит классы пагинации приложения.
+
+Keyset-пагинация (пагинация по курсору) не выполняет ``COUNT(*)`` и
+``OFFSET``: каждая страница выбирается условием по паре
+(дата создания, id), которое обслуживается составным индексом, поэтому
+время получения страницы не зависит от её номера. Если у представления
+есть ``OrderingFilter``, сортировка из параметра ``ordering`` заменяет
+сортировку по умолчанию (как в ``CursorPagination`` DRF).
+"""
+
+import base64
+import json
+from collections import OrderedDict
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import BasePagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Пагинация по ключу (keyset) для больших таблиц.
+
+    Курсор непрозрачен для клиента и содержит значения полей сортировки
+    последней (или первой) записи страницы и направление обхода.
+
+    Атрибуты:
+        ordering (tuple): Поля сортировки по умолчанию; последнее поле должно
+            быть уникальным.
+        page_size (int): Размер страницы по умолчанию.
+        page_size_query_param (str): Параметр запроса для размера страницы.
+        max_page_size (int): Максимально допустимый размер страницы.
+        cursor_query_param (str): Параметр запроса для курсора.
+    """
+
+    ordering = ("-id",)
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Неверный курсор."
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """
+        Возвращает записи текущей страницы.
+        """
+        queryset = self.get_page_queryset(queryset, request, view)
+        return self.build_page(list(queryset))
+
+    def get_ordering(self, request, queryset, view):
+        """
+        Возвращает сортировку страницы: из ``OrderingFilter`` представления,
+        дополненную ``id`` в том же направлении для уникальности ключа, или
+        сортировку по умолчанию.
+        """
+        for backend in getattr(view, "filter_backends", ()):
+            if issubclass(backend, OrderingFilter):
+                ordering = backend().get_ordering(request, queryset, view)
+                if ordering:
+                    ordering = tuple(ordering)
+                    if ordering[-1].lstrip("-") != "id":
+                        ordering += ("-id" if ordering[-1].startswith("-") else "id",)
+                    return ordering
+        return type(self).ordering
+
+    def get_page_queryset(self, queryset, request, view=None):
+        """
+        Возвращает ленивый queryset текущей страницы (на одну запись больше
+        размера страницы, чтобы определить наличие следующей).
+        """
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        self.fields = [
+            queryset.model._meta.get_field(name.lstrip("-")) for name in self.ordering
+        ]
+
+        ordering = self.ordering
+        if self.cursor is not None:
+            position, reverse = self.cursor
+            queryset = queryset.filter(self._position_filter(position, reverse))
+            if reverse:
+                ordering = self._reversed(self.ordering)
+
+        return queryset.order_by(*ordering)[: self.page_size + 1]
+
+    def build_page(self, rows):
+        """
+        Формирует страницу из выбранных записей и вычисляет соседние курсоры.
+        """
+        has_more = len(rows) > self.page_size
+        rows = rows[: self.page_size]
+        reverse = self.cursor is not None and self.cursor[1]
+
+        if reverse:
+            rows.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.cursor is not None
+
+        self.page = rows
+        return rows
+
+    def get_page_size(self, request):
+        """
+        Возвращает размер страницы, ограниченный ``max_page_size``.
+        """
+        if self.page_size_query_param:
+            try:
+                return _positive_int(
+                    request.query_params[self.page_size_query_param],
+                    strict=True,
+                    cutoff=self.max_page_size,
+                )
+            except (KeyError, ValueError):
+                pass
+        return self.page_size
+
+    def get_paginated_response(self, data):
+        """
+        Возвращает ответ со ссылками на соседние страницы.
+        """
+        return Response(
+            OrderedDict(
+                [
+                    ("next", self.get_next_link()),
+                    ("previous", self.get_previous_link()),
+                    ("results", data),
+                ]
+            )
+        )
+
+    def get_paginated_response_schema(self, schema):
+        """
+        Описывает схему ответа для генераторов документации.
+        """
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def get_next_link(self):
+        """
+        Возвращает ссылку на следующую страницу.
+        """
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self._position(self.page[-1]), reverse=False)
+
+    def get_previous_link(self):
+        """
+        Возвращает ссылку на предыдущую страницу.
+        """
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self._position(self.page[0]), reverse=True)
+
+    def encode_cursor(self, position, reverse):
+        """
+        Кодирует позицию и направление в URL с непрозрачным курсором.
+        """
+        payload = json.dumps({"p": position, "r": int(reverse)}, separators=(",", ":"))
+        token = base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        """
+        Декодирует курсор из запроса. Возвращает ``None`` для первой страницы.
+        """
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+            position, reverse = payload["p"], bool(payload["r"])
+            if not isinstance(position, list) or len(position) != len(self.ordering):
+                raise ValueError
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def _position(self, instance):
+        """
+        Возвращает значения полей сортировки записи в строковом виде.
+        """
+        return [field.value_to_string(instance) for field in self.fields]
+
+    def _position_filter(self, position, reverse):
+        """
+        Строит условие «после позиции» для составного ключа сортировки:
+        ``(a < x) OR (a = x AND b < y)``.
+        """
+        try:
+            values = [
+                field.to_python(value) for field, value in zip(self.fields, position)
+            ]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+        # Поля сортировки не бывают пустыми: такой курсор подделан
+        if any(value is None for value in values):
+            raise NotFound(self.invalid_cursor_message)
+
+        condition = Q()
+        equal = Q()
+        for name, field, value in zip(self.ordering, self.fields, values):
+            descending = name.startswith("-")
+            lookup = "lt" if descending != reverse else "gt"
+            condition |= equal & Q(**{f"{field.attname}__{lookup}": value})
+            equal &= Q(**{field.attname: value})
+        return condition
+
+    @staticmethod
+    def _reversed(ordering):
+        """
+        Возвращает обратный порядок сортировки.
+        """
+        return tuple(name[1:] if name.startswith("-") else f"-{name}" for name in ordering)
+
+
+class OrderKeysetPagination(KeysetPagination):
+    """
+    Keyset-пагинация заказов: новые заказы первыми.
+    """
+
+    ordering = ("-create_at", "-id")
+
+
+class CreatedAtKeysetPagination(KeysetPagination):
+    """
+    Keyset-пагинация для моделей с полем ``created_at`` (клиенты, отзывы).
+    """
+
+    ordering = ("-created_at", "-id")
+
+
+class DayKeysetPagination(KeysetPagination):
+    """
+    Keyset-пагинация дневных агрегатов: новые дни первыми.
+    """
+
+    ordering = ("-day", "-id")
@@ -0,0 +1,440 @@
+"""
+Этот модуль содержит профилирование отдельных запросов по требованию.
+
+``ProfilingMiddleware`` профилирует запрос, если в нём есть заголовок
+``REM_PROFILING_HEADER`` с подписанным токеном (``make_token``; токен
+действует ``REM_PROFILING_TOKEN_MAX_AGE`` секунд) или если запрос попал
+в выборку 1 из ``REM_PROFILING_SAMPLE_RATE``. Остальные запросы проходят
+без накладных расходов.
+
+Профиль снимается выборкой стеков: отдельный поток каждые
+``REM_PROFILING_INTERVAL`` секунд записывает стек потока запроса, и
+одинаковые стеки суммируются (формат «свёрнутых стеков» flame graph).
+В отличие от ``cProfile`` выборка не замедляет каждый вызов функции и
+даёт настоящие стеки для flame graph. Вместе с профилем сохраняется
+хронология SQL-запросов: смещение от начала запроса, длительность,
+текст и число параметров. Значения параметров сохраняются только при
+``REM_PROFILING_CAPTURE_PARAMS = True``: в них бывают персональные данные.
+
+Профили хранятся в каталоге ``REM_PROFILING_DIR`` кольцевым буфером
+из ``REM_PROFILING_MAX_PROFILES`` файлов: при записи нового самые
+старые удаляются. Просмотр — в админ-панели (``/admin/profiles/``).
+"""
+
+import collections
+import contextvars
+import gzip
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+from django.db.backends.signals import connection_created
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+SIGNING_SALT = "rem.profiling"
+TOKEN_VALUE = "profile"
+RESPONSE_HEADER = "X-Rem-Profile-Id"
+PROFILE_ID_PATTERN = re.compile(r"^\d+-[0-9a-f]{8}$")
+# Глубина стека и длина текста SQL, сохраняемые в профиле
+MAX_STACK_DEPTH = 128
+MAX_SQL_LENGTH = 2000
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def header_name():
+    """
+    Возвращает имя заголовка профилирования.
+    """
+    return _setting("REM_PROFILING_HEADER", "X-Rem-Profile")
+
+
+def token_max_age():
+    """
+    Возвращает срок действия токена профилирования в секундах.
+    """
+    return _setting("REM_PROFILING_TOKEN_MAX_AGE", 3600)
+
+
+def make_token():
+    """
+    Возвращает подписанный токен для заголовка профилирования.
+    """
+    return signing.TimestampSigner(salt=SIGNING_SALT).sign(TOKEN_VALUE)
+
+
+def check_token(value):
+    """
+    Возвращает ``True``, если токен подписан этим сервером и не истёк.
+    """
+    try:
+        unsigned = signing.TimestampSigner(salt=SIGNING_SALT).unsign(
+            value, max_age=token_max_age()
+        )
+    except signing.BadSignature:
+        return False
+    return unsigned == TOKEN_VALUE
+
+
+class StackSampler(threading.Thread):
+    """
+    Поток, периодически записывающий стек потока ``thread_id``.
+    ``stacks`` сопоставляет стек (кортеж кадров от внешнего к
+    внутреннему) числу выборок.
+    """
+
+    def __init__(self, thread_id, interval):
+        super().__init__(name="rem-profiler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.finished = threading.Event()
+        self._labels = {}
+
+    def label(self, code):
+        """
+        Возвращает подпись кадра: функция, файл и строка её начала.
+        """
+        label = self._labels.get(code)
+        if label is None:
+            filename = code.co_filename
+            # Путь сокращается относительно самого длинного подходящего
+            # каталога sys.path: «django/db/...», а не «site-packages/django/...»
+            prefixes = [path for path in sys.path if path and filename.startswith(path)]
+            if prefixes:
+                filename = filename[len(max(prefixes, key=len)):].lstrip(os.sep)
+            label = self._labels[code] = f"{code.co_name} ({filename}:{code.co_firstlineno})"
+        return label
+
+    def run(self):
+        while not self.finished.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                stack.append(self.label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.stacks[tuple(reversed(stack))] += 1
+
+    def stop(self):
+        """
+        Останавливает выборку.
+        """
+        self.finished.set()
+        self.join()
+
+
+class Capture:
+    """
+    Данные профилируемого запроса: выборка стеков и хронология SQL.
+    """
+
+    def __init__(self, thread_id):
+        self.sampler = StackSampler(thread_id, _setting("REM_PROFILING_INTERVAL", 0.001))
+        self.queries = []
+        self.query_count = 0
+        self.query_time = 0.0
+        self.max_queries = _setting("REM_PROFILING_MAX_QUERIES", 500)
+        self.capture_params = _setting("REM_PROFILING_CAPTURE_PARAMS", False)
+        self.started = time.perf_counter()
+        self.duration = None
+
+    def start(self):
+        self.started = time.perf_counter()
+        self.sampler.start()
+
+    def stop(self):
+        self.duration = time.perf_counter() - self.started
+        self.sampler.stop()
+
+    def add_query(self, sql, params, started, elapsed):
+        self.query_count += 1
+        self.query_time += elapsed
+        if len(self.queries) < self.max_queries:
+            query = {
+                "offset_ms": round((started - self.started) * 1000, 3),
+                "duration_ms": round(elapsed * 1000, 3),
+                "sql": sql[:MAX_SQL_LENGTH],
+                "param_count": len(params) if params else 0,
+            }
+            # Значения параметров (почта, имена, ключи сессий) попадают
+            # в файлы профилей и в админ-панель только по явной настройке
+            if self.capture_params:
+                query["params"] = repr(params)[:MAX_SQL_LENGTH]
+            self.queries.append(query)
+
+
+_current = contextvars.ContextVar("rem_profiling_capture", default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Обёртка выполнения SQL: записывает запросы профилируемого запроса.
+    """
+    capture = _current.get()
+    if capture is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        capture.add_query(sql, params, started, time.perf_counter() - started)
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """
+    Добавляет ``record_query`` к обёрткам соединения (первой, как и
+    ``rem.metrics.install_query_recorder``).
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+connection_created.connect(install_query_recorder, dispatch_uid="rem_profiling_query_recorder")
+
+
+class ProfileStore:
+    """
+    Кольцевой буфер профилей в каталоге: ``<id>.json.gz`` — профиль,
+    ``<id>.meta.json`` — сводка для списка. Id начинается с отметки
+    времени, поэтому порядок имён — порядок записи.
+    """
+
+    def __init__(self, directory=None, max_profiles=None):
+        self.directory = Path(directory or _setting("REM_PROFILING_DIR", "profiles"))
+        self.max_profiles = max_profiles or _setting("REM_PROFILING_MAX_PROFILES", 200)
+
+    def save(self, meta, profile):
+        """
+        Сохраняет профиль, удаляет лишние старые и возвращает id.
+        """
+        profile_id = f"{time.time_ns()}-{uuid.uuid4().hex[:8]}"
+        meta = {**meta, "id": profile_id}
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._write(f"{profile_id}.json.gz", gzip.compress(json.dumps({**profile, "meta": meta}).encode()))
+        self._write(f"{profile_id}.meta.json", json.dumps(meta).encode())
+        self.trim()
+        return profile_id
+
+    def _write(self, name, content):
+        """
+        Записывает файл атомарно: читатель не увидит его частично записанным.
+        """
+        temporary = self.directory / f".{name}.{uuid.uuid4().hex}"
+        temporary.write_bytes(content)
+        os.replace(temporary, self.directory / name)
+
+    def _ids(self):
+        if not self.directory.is_dir():
+            return []
+        return sorted(path.name[: -len(".meta.json")] for path in self.directory.glob("*.meta.json"))
+
+    def trim(self):
+        """
+        Удаляет самые старые профили сверх ``max_profiles``.
+        """
+        ids = self._ids()
+        for profile_id in ids[: max(0, len(ids) - self.max_profiles)]:
+            for suffix in (".meta.json", ".json.gz"):
+                # Параллельный процесс мог удалить файл раньше
+                (self.directory / f"{profile_id}{suffix}").unlink(missing_ok=True)
+
+    def list(self):
+        """
+        Возвращает сводки профилей, самые долгие запросы первыми.
+        """
+        metas = []
+        for profile_id in self._ids():
+            try:
+                metas.append(json.loads((self.directory / f"{profile_id}.meta.json").read_bytes()))
+            except (OSError, ValueError):
+                continue
+        return sorted(metas, key=lambda meta: meta["duration_ms"], reverse=True)
+
+    def load(self, profile_id):
+        """
+        Возвращает профиль по id или ``None``.
+        """
+        if not PROFILE_ID_PATTERN.match(profile_id):
+            return None
+        try:
+            return json.loads(gzip.decompress((self.directory / f"{profile_id}.json.gz").read_bytes()))
+        except (OSError, ValueError):
+            return None
+
+
+def collapsed_stacks(stacks):
+    """
+    Возвращает профиль в текстовом формате свёрнутых стеков
+    (``кадр;кадр;кадр число``) для flamegraph.pl и speedscope.
+    """
+    return "".join(f"{';'.join(stack)} {count}\n" for stack, count in stacks)
+
+
+def flame_blocks(stacks, min_share=0.002):
+    """
+    Возвращает прямоугольники flame graph (корень сверху): словари
+    ``label``, ``depth``, ``left`` и ``width`` (доли от всех выборок) и
+    ``samples``. Прямоугольники уже ``min_share`` отбрасываются.
+    """
+    total = sum(count for _, count in stacks)
+    if not total:
+        return []
+    root = {"children": {}, "samples": total}
+    for stack, count in stacks:
+        node = root
+        for label in stack:
+            node = node["children"].setdefault(label, {"children": {}, "samples": 0})
+            node["samples"] += count
+
+    blocks = []
+    pending = [(root, -1, 0)]
+    while pending:
+        node, depth, left = pending.pop()
+        offset = left
+        for label, child in sorted(node["children"].items()):
+            share = child["samples"] / total
+            if share >= min_share:
+                blocks.append(
+                    {
+                        "label": label,
+                        "depth": depth + 1,
+                        "left": offset / total,
+                        "width": share,
+                        "samples": child["samples"],
+                    }
+                )
+                pending.append((child, depth + 1, offset))
+            offset += child["samples"]
+    return blocks
+
+
+def top_frames(stacks, limit=30):
+    """
+    Возвращает кадры с наибольшим числом выборок: словари ``label``,
+    ``self`` (кадр на вершине стека) и ``total`` (кадр где-либо в стеке).
+    """
+    own, inclusive = collections.Counter(), collections.Counter()
+    for stack, count in stacks:
+        own[stack[-1]] += count
+        for label in set(stack):
+            inclusive[label] += count
+    return [
+        {"label": label, "self": own[label], "total": total}
+        for label, total in sorted(inclusive.items(), key=lambda item: (-own[item[0]], -item[1]))[:limit]
+    ]
+
+
+class ProfilingMiddleware:
+    """
+    Промежуточный слой, профилирующий запросы с подписанным заголовком
+    или из случайной выборки. Id сохранённого профиля возвращается в
+    заголовке ``X-Rem-Profile-Id``. Запросы из выборки сохраняются, только
+    если длились не меньше ``REM_PROFILING_SAMPLE_MIN_MS``.
+
+    Для асинхронных представлений выборка стеков снимается с потока
+    цикла событий, а SQL учитывается и в потоках ``sync_to_async``.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not _setting("REM_PROFILING_ENABLED", True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.store = ProfileStore()
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def get_trigger(self, request):
+        """
+        Возвращает причину профилирования (``"header"`` или ``"sample"``)
+        или ``None``.
+        """
+        token = request.headers.get(header_name())
+        if token:
+            if check_token(token):
+                return "header"
+            logger.warning("Неверный токен профилирования для %s", request.path)
+        rate = _setting("REM_PROFILING_SAMPLE_RATE", 0)
+        if rate and random.randrange(rate) == 0:
+            return "sample"
+        return None
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        trigger = self.get_trigger(request)
+        if trigger is None:
+            return self.get_response(request)
+        capture = Capture(threading.get_ident())
+        token = _current.set(capture)
+        capture.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            capture.stop()
+            _current.reset(token)
+        self.save(request, response, capture, trigger)
+        return response
+
+    async def __acall__(self, request):
+        trigger = self.get_trigger(request)
+        if trigger is None:
+            return await self.get_response(request)
+        capture = Capture(threading.get_ident())
+        token = _current.set(capture)
+        capture.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            capture.stop()
+            _current.reset(token)
+        self.save(request, response, capture, trigger)
+        return response
+
+    def save(self, request, response, capture, trigger):
+        """
+        Сохраняет профиль запроса и добавляет его id в ответ. Ошибка
+        записи не влияет на ответ.
+        """
+        duration_ms = round(capture.duration * 1000, 3)
+        if trigger == "sample" and duration_ms < _setting("REM_PROFILING_SAMPLE_MIN_MS", 0):
+            return
+        match = getattr(request, "resolver_match", None)
+        meta = {
+            "started_at": timezone.now().isoformat(),
+            "method": request.method,
+            "path": request.get_full_path()[:500],
+            "view": (match.url_name or match.view_name) if match else "",
+            "status": response.status_code,
+            "duration_ms": duration_ms,
+            "query_count": capture.query_count,
+            "query_ms": round(capture.query_time * 1000, 3),
+            "samples": sum(capture.sampler.stacks.values()),
+            "trigger": trigger,
+        }
+        profile = {
+            "stacks": [[list(stack), count] for stack, count in capture.sampler.stacks.most_common()],
+            "queries": capture.queries,
+        }
+        try:
+            response[RESPONSE_HEADER] = self.store.save(meta, profile)
+        except OSError as exc:
+            logger.warning("Профиль запроса %s не сохранён: %s", request.path, exc)
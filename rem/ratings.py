@@ -0,0 +1,161 @@
+"""
+Этот модуль поддерживает денормализованный рейтинг мастера по отзывам:
+количество отзывов (``review_count``), сумму оценок (``rating_sum``),
+распределение оценок (``reviews_1`` ... ``reviews_5``) и средний рейтинг
+(``rating``).
+
+Создание, изменение и удаление отзыва применяется одним ``UPDATE`` мастера
+через ``F()``-выражения, поэтому параллельные отзывы не теряют изменений,
+а чтение рейтинга не требует агрегации отзывов. Пока у мастера нет
+отзывов, ``rating`` задаётся вручную. Ручной рейтинг не хранится
+отдельно: после удаления последнего отзыва ``rating`` сохраняет последнюю
+среднюю оценку и снова может быть изменён вручную.
+"""
+
+from collections import Counter, defaultdict
+from decimal import Decimal
+
+from django.db.models import (
+    Case,
+    Count,
+    DecimalField,
+    F,
+    FloatField,
+    OuterRef,
+    Q,
+    Subquery,
+    Sum,
+    Value,
+    When,
+)
+from django.db.models.functions import Cast, Coalesce, Round
+
+from .caching import bump_model_version_on_commit
+from .models import Master, Review
+
+RATING_VALUES = (1, 2, 3, 4, 5)
+
+
+def rating_value(rating):
+    """
+    Возвращает столбец распределения для оценки: целая часть от 1 до 5.
+    """
+    return min(max(int(rating), RATING_VALUES[0]), RATING_VALUES[-1])
+
+
+def rating_value_q(value, field="rating"):
+    """
+    Возвращает условие попадания оценки в столбец распределения ``value``.
+    """
+    condition = Q()
+    if value > RATING_VALUES[0]:
+        condition &= Q(**{f"{field}__gte": value})
+    if value < RATING_VALUES[-1]:
+        condition &= Q(**{f"{field}__lt": value + 1})
+    return condition
+
+
+def average_rating(rating_sum, review_count):
+    """
+    Возвращает SQL-выражение среднего рейтинга с двумя знаками.
+
+    Деление выполняется над числами с плавающей точкой: SQLite хранит
+    целые суммы как INTEGER и иначе делил бы нацело.
+    """
+    return Round(
+        Cast(rating_sum, FloatField()) / Cast(review_count, FloatField()),
+        2,
+        output_field=DecimalField(max_digits=10, decimal_places=2),
+    )
+
+
+def review_state(review):
+    """
+    Возвращает загруженные значения отзыва, влияющие на рейтинг:
+    (id мастера, оценка), или ``None``, если часть полей отложена.
+    """
+    values = review.__dict__
+    try:
+        return values["master_id"], values["rating"]
+    except KeyError:
+        return None
+
+
+def change_master_rating(master_id, added=None, removed=None):
+    """
+    Применяет к рейтингу мастера добавление оценки ``added`` и/или
+    удаление оценки ``removed`` одним ``UPDATE``. Изменение оценки
+    отзыва передаётся обоими аргументами.
+    """
+    count = (added is not None) - (removed is not None)
+    delta = Decimal(added or 0) - Decimal(removed or 0)
+
+    distribution = Counter()
+    if added is not None:
+        distribution[rating_value(added)] += 1
+    if removed is not None:
+        distribution[rating_value(removed)] -= 1
+
+    review_count = F("review_count") + count
+    rating_sum = F("rating_sum") + Value(delta)
+    values = {
+        "review_count": review_count,
+        "rating_sum": rating_sum,
+        # Правые части UPDATE видят значения строки до изменения, поэтому
+        # средний рейтинг вычисляется по новым значениям из тех же выражений
+        "rating": Case(
+            When(review_count__gt=-count, then=average_rating(rating_sum, review_count)),
+            default=F("rating"),
+        ),
+    }
+    for value, change in distribution.items():
+        if change:
+            values[f"reviews_{value}"] = F(f"reviews_{value}") + change
+    Master.objects.filter(pk=master_id).update(**values)
+
+
+def apply_review_change(old=None, new=None):
+    """
+    Применяет к рейтингам мастеров изменение отзыва из состояния ``old``
+    в ``new`` (см. ``review_state``): создание, удаление или изменение
+    оценки или мастера.
+    """
+    if old == new:
+        return
+    # {id мастера: [добавленная оценка, удалённая оценка]}
+    changes = defaultdict(lambda: [None, None])
+    if old is not None:
+        changes[old[0]][1] = old[1]
+    if new is not None:
+        changes[new[0]][0] = new[1]
+    for master_id, (added, removed) in changes.items():
+        change_master_rating(master_id, added=added, removed=removed)
+    bump_model_version_on_commit(Master)
+
+
+def recompute_master_ratings(masters=None):
+    """
+    Пересчитывает поля отзывов мастеров queryset'а ``masters`` (по
+    умолчанию — всех) по таблице отзывов и возвращает число мастеров.
+    """
+    masters = Master.objects.all() if masters is None else masters
+    reviews = Review.objects.filter(master=OuterRef("pk")).order_by().values("master")
+
+    def total(aggregate, condition=Q(), default=0):
+        return Coalesce(
+            Subquery(reviews.filter(condition).annotate(value=aggregate).values("value")),
+            Value(default),
+        )
+
+    values = {
+        "review_count": total(Count("id")),
+        "rating_sum": total(Sum("rating"), default=Decimal(0)),
+    }
+    for value in RATING_VALUES:
+        values[f"reviews_{value}"] = total(Count("id"), rating_value_q(value))
+    updated = masters.update(**values)
+    masters.filter(review_count__gt=0).update(
+        rating=average_rating(F("rating_sum"), F("review_count"))
+    )
+    bump_model_version_on_commit(Master)
+    return updated
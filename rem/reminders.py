@@ -0,0 +1,182 @@
+"""
+Этот модуль содержит ежедневную рассылку напоминаний клиентам.
+
+Получатели — клиенты с почтой, последний заказ которых создан не раньше
+``REM_REMINDER_RECENT_DAYS`` дней назад (напоминание о заказе) или
+раньше ``REM_REMINDER_STALE_DAYS`` дней назад (приглашение вернуться),
+если им не отправлялось напоминание за последние
+``REM_REMINDER_REPEAT_DAYS`` дней. Они выбираются одним потоковым
+запросом; на каждую пачку из ``REM_REMINDER_CHUNK_SIZE`` клиентов
+создаются строки ``ReminderDelivery`` и ставится подзадача отправки.
+Уникальность (клиент, день) не даёт отправить напоминание дважды при
+повторном запуске.
+
+Подзадача отправляет письма пачки через одно SMTP-соединение
+(``send_messages``) не чаще ``REM_REMINDER_RATE_LIMIT`` писем в секунду
+и записывает состояние каждой доставки.
+"""
+
+import datetime
+import logging
+import smtplib
+import time
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Exists, Max, OuterRef, Q, Subquery
+from django.utils import timezone
+
+from .models import Client, Order, ReminderDelivery
+
+logger = logging.getLogger(__name__)
+
+SUBJECTS = {
+    "recent": "Напоминание о заказе",
+    "stale": "Мы по вам скучаем",
+}
+BODIES = {
+    "recent": "{name}, напоминаем о вашем заказе от {date:%d.%m.%Y}. Мастер скоро свяжется с вами.",
+    "stale": "{name}, ваш последний заказ был {date:%d.%m.%Y}. Будем рады помочь снова.",
+}
+
+
+def recipients(today, recent_since, stale_before, chunk_size):
+    """
+    Возвращает итератор пар (id клиента, дата последнего заказа) для
+    рассылки ``today``.
+    """
+    repeat_since = today - datetime.timedelta(days=getattr(settings, "REM_REMINDER_REPEAT_DAYS", 30))
+    # Последний заказ клиента берётся по индексу (клиент, дата создания)
+    last_order = Order.objects.filter(id_user=OuterRef("pk")).order_by("-create_at").values("create_at")[:1]
+    reminded = ReminderDelivery.objects.filter(client=OuterRef("pk"), date__gt=repeat_since)
+    return (
+        Client.objects.exclude(email="")
+        .annotate(last_order=Subquery(last_order))
+        .filter(Q(last_order__gte=recent_since) | Q(last_order__lt=stale_before))
+        .filter(~Exists(reminded))
+        .order_by("pk")
+        .values_list("pk", "last_order")
+        .iterator(chunk_size=chunk_size)
+    )
+
+
+def plan_reminders(today=None, dispatch=None):
+    """
+    Создаёт доставки напоминаний на день ``today`` и передаёт каждую
+    пачку id клиентов в ``dispatch(today, client_ids)``. Возвращает
+    число созданных доставок.
+    """
+    today = today or timezone.localdate()
+    chunk_size = getattr(settings, "REM_REMINDER_CHUNK_SIZE", 100)
+    now = timezone.now()
+    recent_since = now - datetime.timedelta(days=getattr(settings, "REM_REMINDER_RECENT_DAYS", 1))
+    stale_before = now - datetime.timedelta(days=getattr(settings, "REM_REMINDER_STALE_DAYS", 180))
+
+    # Пачка доставок записывается и ставится на отправку, пока курсор
+    # потокового запроса ещё открыт. Это безопасно: клиенты читаются по
+    # возрастанию id, и доставки (а затем их статусы в подзадаче)
+    # записываются только для уже прочитанных клиентов, поэтому условие
+    # ``NOT EXISTS`` для ещё не прочитанных строк от этих записей не зависит
+    total, chunk = 0, []
+    for client_id, last_order in recipients(today, recent_since, stale_before, chunk_size):
+        kind = "recent" if last_order >= recent_since else "stale"
+        chunk.append(ReminderDelivery(client_id=client_id, date=today, kind=kind))
+        if len(chunk) >= chunk_size:
+            total += _dispatch_chunk(today, chunk, dispatch)
+            chunk = []
+    if chunk:
+        total += _dispatch_chunk(today, chunk, dispatch)
+    return total
+
+
+def _dispatch_chunk(today, deliveries, dispatch):
+    """
+    Создаёт доставки пачки и передаёт id их клиентов на отправку.
+    """
+    ReminderDelivery.objects.bulk_create(deliveries, ignore_conflicts=True)
+    client_ids = [delivery.client_id for delivery in deliveries]
+    dispatch(today, client_ids)
+    return len(client_ids)
+
+
+def send_reminders(today, client_ids, connection=None):
+    """
+    Отправляет ожидающие напоминания клиентам ``client_ids`` за день
+    ``today`` через одно соединение и записывает состояние доставок.
+    Повторный вызов отправляет только оставшиеся ожидающие доставки.
+    Возвращает пару (отправлено, с ошибкой).
+    """
+    deliveries = list(
+        ReminderDelivery.objects.filter(date=today, client_id__in=client_ids, status="pending")
+        .select_related("client")
+        .order_by("pk")
+    )
+    if not deliveries:
+        return 0, 0
+    last_orders = dict(
+        Order.objects.filter(id_user__in=[delivery.client_id for delivery in deliveries])
+        .order_by()
+        .values("id_user")
+        .annotate(last=Max("create_at"))
+        .values_list("id_user", "last")
+    )
+    rate = getattr(settings, "REM_REMINDER_RATE_LIMIT", None)
+    interval = 1 / rate if rate else 0
+    from_email = getattr(settings, "REM_REMINDER_FROM_EMAIL", settings.DEFAULT_FROM_EMAIL)
+
+    connection = connection or get_connection()
+    sent, failed, next_at = 0, 0, time.monotonic()
+    try:
+        with connection:
+            for delivery in deliveries:
+                delay = next_at - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                next_at = time.monotonic() + interval
+                message = build_message(delivery, last_orders.get(delivery.client_id), from_email, connection)
+                # Постоянный отказ (5xx) помечает доставку ошибкой; временный
+                # (4xx) и обрыв соединения прерывают пачку, и её оставшиеся
+                # доставки ждут повтора задачи
+                try:
+                    connection.send_messages([message])
+                except (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException) as exc:
+                    if not is_permanent(exc):
+                        raise
+                    delivery.status, delivery.error = "failed", str(exc)
+                    failed += 1
+                    logger.warning("Напоминание клиенту %s не отправлено: %s", delivery.client_id, exc)
+                else:
+                    delivery.status, delivery.sent_at = "sent", timezone.now()
+                    sent += 1
+    finally:
+        # Состояние записывается и для части пачки, если соединение оборвалось
+        done = [delivery for delivery in deliveries if delivery.status != "pending"]
+        ReminderDelivery.objects.bulk_update(done, ["status", "error", "sent_at"])
+    return sent, failed
+
+
+def is_permanent(exc):
+    """
+    Возвращает ``True``, если SMTP-отказ постоянный (код 5xx): повтор
+    отправки не поможет.
+    """
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        codes = [code for code, _ in exc.recipients.values()]
+    else:
+        codes = [exc.smtp_code]
+    return bool(codes) and all(code >= 500 for code in codes)
+
+
+def build_message(delivery, last_order, from_email, connection):
+    """
+    Возвращает письмо напоминания для доставки.
+    """
+    client = delivery.client
+    date = timezone.localtime(last_order) if last_order else timezone.localtime()
+    return EmailMessage(
+        SUBJECTS[delivery.kind],
+        BODIES[delivery.kind].format(name=client.full_name, date=date),
+        from_email,
+        [client.email],
+        connection=connection,
+    )
@@ -0,0 +1,102 @@
+"""
+Этот модуль содержит рендереры и парсеры API.
+
+``FastJSONRenderer``/``FastJSONParser`` используют orjson вместо
+стандартного модуля json, ``MessagePackRenderer``/``MessagePackParser``
+добавляют двоичный формат MessagePack, выбираемый заголовком
+``Accept: application/msgpack``. Значения, которые форматы не умеют
+кодировать сами (Decimal, даты, ленивые строки), преобразуются тем же
+кодировщиком DRF, что и в стандартном ``JSONRenderer``, поэтому
+представление данных одинаково во всех форматах.
+"""
+
+import msgpack
+import orjson
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+_encoder = JSONEncoder()
+
+
+def encode_default(obj):
+    """
+    Преобразует значение, не поддерживаемое форматом, как ``JSONEncoder`` DRF.
+    """
+    return _encoder.default(obj)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSON-рендерер на orjson.
+
+    Запросы с отступами (``Accept: application/json; indent=4``) обрабатываются
+    стандартным рендерером.
+    """
+
+    options = orjson.OPT_PASSTHROUGH_DATETIME
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """
+        Кодирует данные в JSON.
+        """
+        if data is None:
+            return b""
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return orjson.dumps(data, default=encode_default, option=self.options)
+
+
+class FastJSONParser(BaseParser):
+    """
+    JSON-парсер на orjson.
+    """
+
+    media_type = "application/json"
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        """
+        Декодирует тело запроса из JSON.
+        """
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f"JSON parse error - {exc}")
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    Рендерер двоичного формата MessagePack.
+    """
+
+    media_type = "application/msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """
+        Кодирует данные в MessagePack.
+        """
+        if data is None:
+            return b""
+        return msgpack.packb(data, default=encode_default, use_bin_type=True)
+
+
+class MessagePackParser(BaseParser):
+    """
+    Парсер двоичного формата MessagePack.
+    """
+
+    media_type = "application/msgpack"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        """
+        Декодирует тело запроса из MessagePack.
+        """
+        try:
+            return msgpack.unpackb(stream.read(), raw=False)
+        except (ValueError, msgpack.ExtraData, msgpack.FormatError, msgpack.StackError) as exc:
+            raise ParseError(f"MessagePack parse error - {exc}")
@@ -0,0 +1,310 @@
+"""
+Этот модуль поддерживает дневные агрегаты заказов (``DailyMasterRollup``,
+``DailySpecialityRollup``): количество, сумму, минимальную и максимальную
+цену заказов за день по мастеру и по специальности.
+
+Одиночные изменения заказа применяются инкрементально одним ``UPDATE``
+на таблицу агрегатов: количество и сумма меняются через ``F()``, минимум
+и максимум — через ``Least``/``Greatest``, а пересчитываются подзапросом
+только если удалённая цена была крайней. Массовые операции пересчитывают
+затронутые дни одним агрегирующим запросом и одним upsert'ом на таблицу.
+Задача ``rebuild_rollups`` перестраивает агрегаты целиком и исправляет
+возможное расхождение (например, параллельные изменения одного заказа).
+"""
+
+import datetime
+from collections import defaultdict
+from decimal import Decimal
+from typing import NamedTuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, F, Max, Min, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest, Least, TruncDate
+from django.utils import timezone
+
+from .caching import bump_model_version_on_commit
+from .models import DailyMasterRollup, DailySpecialityRollup, Master, Order
+
+AGGREGATE_FIELDS = ("order_count", "price_sum", "price_min", "price_max")
+
+
+class Rollup(NamedTuple):
+    """
+    Описание таблицы агрегатов: модель, поле группировки и путь к нему от заказа.
+    """
+
+    model: type
+    field: str
+    order_field: str
+
+
+MASTER_ROLLUP = Rollup(DailyMasterRollup, "master", "id_master")
+SPECIALITY_ROLLUP = Rollup(DailySpecialityRollup, "speciality", "id_master__speciality")
+ROLLUPS = (MASTER_ROLLUP, SPECIALITY_ROLLUP)
+ROLLUP_MODELS = tuple(rollup.model for rollup in ROLLUPS)
+
+
+def day_bounds(day):
+    """
+    Возвращает границы дня [начало, конец) в текущем часовом поясе.
+    """
+    start = timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+    end = timezone.make_aware(
+        datetime.datetime.combine(day + datetime.timedelta(days=1), datetime.time.min)
+    )
+    return start, end
+
+
+def order_day(create_at):
+    """
+    Возвращает день заказа в текущем часовом поясе.
+    """
+    return timezone.localdate(create_at) if timezone.is_aware(create_at) else create_at.date()
+
+
+def order_state(order):
+    """
+    Возвращает загруженные значения заказа, влияющие на агрегаты:
+    (дата создания, id мастера, цена), или ``None``, если часть полей отложена.
+    """
+    values = order.__dict__
+    try:
+        return values["create_at"], values["id_master_id"], values["price"]
+    except KeyError:
+        return None
+
+
+def speciality_ids(master_ids, known=None):
+    """
+    Возвращает словарь {id мастера: id специальности}, запрашивая из базы
+    только отсутствующих в ``known``.
+    """
+    result = {pk: speciality for pk, speciality in (known or {}).items() if pk in master_ids}
+    missing = set(master_ids) - set(result)
+    if missing:
+        result.update(
+            Master.objects.filter(pk__in=missing).values_list("pk", "speciality_id")
+        )
+    return result
+
+
+def _bucket_orders(rollup, day, key):
+    """
+    Возвращает заказы, входящие в агрегат (день, ключ).
+    """
+    start, end = day_bounds(day)
+    return Order.objects.filter(
+        **{rollup.order_field: key}, create_at__gte=start, create_at__lt=end
+    )
+
+
+def _bucket_extreme(rollup, day, key, aggregate):
+    """
+    Возвращает подзапрос крайней цены заказов агрегата.
+    """
+    return Subquery(
+        _bucket_orders(rollup, day, key)
+        .order_by()
+        .values(rollup.order_field)
+        .annotate(value=aggregate("price"))
+        .values("value")
+    )
+
+
+def change_bucket(rollup, day, key, added=None, removed=None):
+    """
+    Применяет к агрегату (день, ключ) добавление заказа с ценой ``added``
+    и/или удаление заказа с ценой ``removed``. Изменение цены заказа
+    внутри одного агрегата передаётся обоими аргументами.
+
+    Вызывается после записи заказа в базу, поэтому подзапрос крайней цены
+    видит новое состояние.
+    """
+    count = (added is not None) - (removed is not None)
+    price_sum = F("price_sum")
+    price_min, price_max = F("price_min"), F("price_max")
+    if added is not None:
+        added = Value(Decimal(added))
+        price_sum = price_sum + added
+        price_min = Coalesce(Least("price_min", added), added)
+        price_max = Coalesce(Greatest("price_max", added), added)
+    if removed is not None:
+        removed = Decimal(removed)
+        price_sum = price_sum - Value(removed)
+        price_min = Case(
+            When(price_min=removed, then=_bucket_extreme(rollup, day, key, Min)),
+            default=price_min,
+        )
+        price_max = Case(
+            When(price_max=removed, then=_bucket_extreme(rollup, day, key, Max)),
+            default=price_max,
+        )
+
+    values = {"price_sum": price_sum, "price_min": price_min, "price_max": price_max}
+    if count:
+        values["order_count"] = F("order_count") + count
+    bucket = rollup.model.objects.filter(day=day, **{rollup.field: key})
+    if bucket.update(**values) or added is None:
+        return
+    # Первый заказ агрегата: создаём пустую строку и повторяем UPDATE,
+    # чтобы параллельная вставка той же строки не потеряла изменение
+    rollup.model.objects.bulk_create(
+        [rollup.model(day=day, **{f"{rollup.field}_id": key})], ignore_conflicts=True
+    )
+    bucket.update(**values)
+
+
+def apply_order_change(old=None, new=None, known_specialities=None):
+    """
+    Применяет к агрегатам изменение заказа из состояния ``old`` в ``new``
+    (см. ``order_state``): создание (``old`` пусто), удаление (``new``
+    пусто) или изменение даты, мастера или цены.
+
+    Возвращает словарь {id мастера: id специальности} затронутых мастеров.
+    """
+    if old == new:
+        return {}
+    states = [state for state in (old, new) if state is not None]
+    specialities = speciality_ids({state[1] for state in states}, known_specialities)
+
+    # {(агрегат, день, ключ): [добавленная цена, удалённая цена]}
+    changes = defaultdict(lambda: [None, None])
+    for position, state in ((1, old), (0, new)):
+        if state is None:
+            continue
+        create_at, master_id, price = state
+        day = order_day(create_at)
+        changes[MASTER_ROLLUP, day, master_id][position] = price
+        if master_id in specialities:
+            changes[SPECIALITY_ROLLUP, day, specialities[master_id]][position] = price
+
+    for (rollup, day, key), (added, removed) in changes.items():
+        change_bucket(rollup, day, key, added=added, removed=removed)
+    bump_model_version_on_commit(*ROLLUP_MODELS)
+    return specialities
+
+
+def aggregate_orders(rollup, orders):
+    """
+    Возвращает несохранённые строки агрегатов по заказам queryset'а.
+    """
+    rows = (
+        orders.annotate(day=TruncDate("create_at"))
+        .values("day", rollup.order_field)
+        .annotate(
+            order_count=Count("id"),
+            price_sum=Sum("price"),
+            price_min=Min("price"),
+            price_max=Max("price"),
+        )
+        .order_by()
+    )
+    return [
+        rollup.model(**{f"{rollup.field}_id": row.pop(rollup.order_field)}, **row)
+        for row in rows
+    ]
+
+
+def refresh_buckets(rollup, buckets):
+    """
+    Пересчитывает агрегаты из множества пар (день, ключ) по таблице заказов:
+    один агрегирующий запрос и один upsert. Агрегаты без заказов обнуляются.
+    """
+    if not buckets:
+        return
+    days = [day for day, _ in buckets]
+    start, _ = day_bounds(min(days))
+    _, end = day_bounds(max(days))
+    orders = Order.objects.filter(
+        **{f"{rollup.order_field}__in": {key for _, key in buckets}},
+        create_at__gte=start,
+        create_at__lt=end,
+    )
+    attname = f"{rollup.field}_id"
+    rows = {
+        (row.day, getattr(row, attname)): row for row in aggregate_orders(rollup, orders)
+    }
+    rollup.model.objects.bulk_create(
+        [
+            rows.get(bucket) or rollup.model(day=bucket[0], **{attname: bucket[1]})
+            for bucket in sorted(buckets)
+        ],
+        update_conflicts=True,
+        unique_fields=["day", rollup.field],
+        update_fields=AGGREGATE_FIELDS,
+        batch_size=getattr(settings, "REM_ROLLUP_BATCH_SIZE", 500),
+    )
+
+
+def refresh_order_rollups(states):
+    """
+    Пересчитывает агрегаты, затронутые заказами с состояниями
+    (дата создания, id мастера, ...). Используется массовыми операциями,
+    которые не отправляют сигналов.
+
+    Возвращает словарь {id мастера: id специальности} затронутых мастеров.
+    """
+    states = list(states)
+    if not states:
+        return {}
+    specialities = speciality_ids({state[1] for state in states})
+    master_buckets, speciality_buckets = set(), set()
+    for create_at, master_id, *_ in states:
+        day = order_day(create_at)
+        master_buckets.add((day, master_id))
+        if master_id in specialities:
+            speciality_buckets.add((day, specialities[master_id]))
+    refresh_buckets(MASTER_ROLLUP, master_buckets)
+    refresh_buckets(SPECIALITY_ROLLUP, speciality_buckets)
+    bump_model_version_on_commit(*ROLLUP_MODELS)
+    return specialities
+
+
+def refresh_master_speciality(master_id, old_speciality_id, new_speciality_id):
+    """
+    Переносит заказы мастера между агрегатами специальностей после смены
+    его специальности.
+    """
+    days = set(
+        Order.objects.filter(id_master=master_id)
+        .annotate(day=TruncDate("create_at"))
+        .values_list("day", flat=True)
+        .order_by()
+        .distinct()
+    )
+    refresh_buckets(
+        SPECIALITY_ROLLUP,
+        {(day, speciality) for day in days for speciality in (old_speciality_id, new_speciality_id)},
+    )
+    bump_model_version_on_commit(DailySpecialityRollup)
+
+
+def rebuild_rollups(date_from=None, date_to=None):
+    """
+    Перестраивает агрегаты за период [date_from, date_to] (по умолчанию —
+    за всё время) по таблице заказов и возвращает словарь
+    {имя модели агрегата: число строк}.
+    """
+    orders = Order.objects.all()
+    if date_from is not None:
+        orders = orders.filter(create_at__gte=day_bounds(date_from)[0])
+    if date_to is not None:
+        orders = orders.filter(create_at__lt=day_bounds(date_to)[1])
+
+    result = {}
+    batch_size = getattr(settings, "REM_ROLLUP_BATCH_SIZE", 500)
+    with transaction.atomic():
+        for rollup in ROLLUPS:
+            stale = rollup.model.objects.all()
+            if date_from is not None:
+                stale = stale.filter(day__gte=date_from)
+            if date_to is not None:
+                stale = stale.filter(day__lte=date_to)
+            stale.delete()
+            rows = rollup.model.objects.bulk_create(
+                aggregate_orders(rollup, orders), batch_size=batch_size
+            )
+            result[rollup.model.__name__] = len(rows)
+        bump_model_version_on_commit(*ROLLUP_MODELS)
+    return result
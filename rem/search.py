@@ -0,0 +1,268 @@
+"""
+Этот модуль содержит полнотекстовый поиск по услугам (``Service.name``,
+``Service.description``), мастерам (``Master.full_name``,
+``Master.description``) и комментариям отзывов (``Review.comment``).
+
+На SQLite документы хранятся в виртуальной таблице FTS5 ``rem_search``
+(создаётся миграцией ``0015_search_index``) с колонками ``title`` и
+``body``. Тип и id объекта закодированы в ``rowid``
+(``id * SEARCH_KINDS_COUNT + код типа``), поэтому обновление и удаление
+документа — одна операция по первичному ключу, а не поиск по колонкам.
+Результаты ранжируются по ``bm25`` (совпадения в заголовке весомее) и
+возвращаются с выделением совпадений.
+
+Таблица поддерживается сигналами сохранения и удаления моделей;
+``rebuild_search_index`` (и команда с тем же именем) перестраивает её
+целиком. На других СУБД поиск выполняется через ``icontains``.
+"""
+
+import html
+import re
+from typing import NamedTuple
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import Master, Review, Service
+
+SEARCH_TABLE = "rem_search"
+HIGHLIGHT_START, HIGHLIGHT_END = "<mark>", "</mark>"
+# Временные метки выделения: текст экранируется для HTML уже после
+# выделения, и метки не должны совпадать с символами текста
+_MARK_START, _MARK_END = "\x02", "\x03"
+SNIPPET_ELLIPSIS = "…"
+# Число слов во фрагменте текста с совпадениями
+SNIPPET_TOKENS = 16
+# Веса колонок для bm25: совпадение в заголовке в 10 раз весомее
+TITLE_WEIGHT, BODY_WEIGHT = 10.0, 1.0
+
+
+class SearchSource(NamedTuple):
+    """
+    Описание индексируемой модели: тип в результатах, код в ``rowid``,
+    модель и поля заголовка и текста (пустое поле — колонка не заполняется).
+    """
+
+    kind: str
+    code: int
+    model: type
+    title_field: str
+    body_field: str
+
+
+SEARCH_SOURCES = (
+    SearchSource("service", 1, Service, "name", "description"),
+    SearchSource("master", 2, Master, "full_name", "description"),
+    SearchSource("review", 3, Review, "", "comment"),
+)
+SEARCH_KINDS = tuple(source.kind for source in SEARCH_SOURCES)
+SEARCH_KINDS_COUNT = 4
+SOURCES_BY_KIND = {source.kind: source for source in SEARCH_SOURCES}
+SOURCES_BY_CODE = {source.code: source for source in SEARCH_SOURCES}
+SOURCES_BY_MODEL = {source.model: source for source in SEARCH_SOURCES}
+
+
+def fts_enabled():
+    """
+    Возвращает ``True``, если поиск выполняется через FTS5 (база — SQLite).
+    """
+    return connection.vendor == "sqlite"
+
+
+def normalize(text):
+    """
+    Приводит текст к индексируемому виду: токенизатор FTS5 не отождествляет
+    «ё» и «е», поэтому «ё» заменяется в документах и в запросах.
+    """
+    return (text or "").replace("ё", "е").replace("Ё", "Е")
+
+
+def query_terms(query):
+    """
+    Возвращает слова поискового запроса.
+    """
+    return re.findall(r"\w+", normalize(query))
+
+
+def match_expression(terms):
+    """
+    Возвращает выражение ``MATCH`` FTS5: все слова запроса как префиксы.
+    Слова берутся в кавычки, поэтому операторы FTS5 в запросе не действуют.
+    """
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def document_rowid(source, pk):
+    """
+    Возвращает ``rowid`` документа объекта в таблице поиска.
+    """
+    return pk * SEARCH_KINDS_COUNT + source.code
+
+
+def _document(source, instance):
+    """
+    Возвращает (заголовок, текст) документа объекта.
+    """
+    title = getattr(instance, source.title_field) if source.title_field else ""
+    return normalize(title), normalize(getattr(instance, source.body_field))
+
+
+def index_object(instance):
+    """
+    Добавляет или обновляет документ объекта в таблице поиска.
+    """
+    if not fts_enabled():
+        return
+    source = SOURCES_BY_MODEL[type(instance)]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT OR REPLACE INTO {SEARCH_TABLE} (rowid, title, body) VALUES (%s, %s, %s)",
+            [document_rowid(source, instance.pk), *_document(source, instance)],
+        )
+
+
+def remove_object(model, pk):
+    """
+    Удаляет документ объекта из таблицы поиска.
+    """
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s",
+            [document_rowid(SOURCES_BY_MODEL[model], pk)],
+        )
+
+
+def rebuild_search_index():
+    """
+    Перестраивает таблицу поиска по таблицам моделей и возвращает
+    словарь {тип: число документов}.
+    """
+    if not fts_enabled():
+        return {}
+    result = {}
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+        for source in SEARCH_SOURCES:
+            table = connection.ops.quote_name(source.model._meta.db_table)
+            title = (
+                _normalized_column(source.model, source.title_field)
+                if source.title_field else "''"
+            )
+            body = _normalized_column(source.model, source.body_field)
+            cursor.execute(
+                f"INSERT INTO {SEARCH_TABLE} (rowid, title, body) "
+                f"SELECT id * {SEARCH_KINDS_COUNT} + {source.code}, {title}, {body} FROM {table}"
+            )
+            result[source.kind] = cursor.rowcount
+        # Слияние сегментов индекса ускоряет последующие запросы
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')")
+    return result
+
+
+def _normalized_column(model, field_name):
+    """
+    Возвращает SQL-выражение колонки поля с заменой «ё» на «е».
+    """
+    column = connection.ops.quote_name(model._meta.get_field(field_name).column)
+    return f"REPLACE(REPLACE(COALESCE({column}, ''), 'ё', 'е'), 'Ё', 'Е')"
+
+
+def search(query, kinds=SEARCH_KINDS, limit=20, offset=0):
+    """
+    Ищет документы типов ``kinds`` по словам запроса и возвращает список
+    словарей ``type``, ``id``, ``title``, ``snippet`` (с выделением
+    совпадений) и ``rank`` (меньше — лучше), отсортированный по релевантности.
+    """
+    terms = query_terms(query)
+    if not terms:
+        return []
+    if fts_enabled():
+        return _fts_search(terms, kinds, limit, offset)
+    return _basic_search(terms, kinds, limit, offset)
+
+
+def _fts_search(terms, kinds, limit, offset):
+    """
+    Ищет через FTS5 одним запросом.
+    """
+    codes = [SOURCES_BY_KIND[kind].code for kind in kinds]
+    placeholders = ", ".join(["%s"] * len(codes))
+    sql = (
+        f"SELECT rowid, "
+        f"highlight({SEARCH_TABLE}, 0, %s, %s), "
+        f"snippet({SEARCH_TABLE}, 1, %s, %s, %s, {SNIPPET_TOKENS}), "
+        f"bm25({SEARCH_TABLE}, {TITLE_WEIGHT}, {BODY_WEIGHT}) AS score "
+        f"FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s "
+        f"AND rowid %% {SEARCH_KINDS_COUNT} IN ({placeholders}) "
+        f"ORDER BY score LIMIT %s OFFSET %s"
+    )
+    params = [
+        _MARK_START, _MARK_END,
+        _MARK_START, _MARK_END, SNIPPET_ELLIPSIS,
+        match_expression(terms), *codes, limit, offset,
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    return [
+        {
+            "type": SOURCES_BY_CODE[rowid % SEARCH_KINDS_COUNT].kind,
+            "id": rowid // SEARCH_KINDS_COUNT,
+            "title": _render(title),
+            "snippet": _render(snippet),
+            "rank": rank,
+        }
+        for rowid, title, snippet, rank in rows
+    ]
+
+
+def _basic_search(terms, kinds, limit, offset):
+    """
+    Ищет через ``icontains`` (без ранжирования) для СУБД без FTS5:
+    по одному запросу на тип, результаты упорядочены по типу и id.
+    """
+    results = []
+    for kind in kinds:
+        source = SOURCES_BY_KIND[kind]
+        fields = [name for name in (source.title_field, source.body_field) if name]
+        queryset = source.model.objects.order_by("pk")
+        for term in terms:
+            condition = Q()
+            for name in fields:
+                condition |= Q(**{f"{name}__icontains": term})
+            queryset = queryset.filter(condition)
+        for values in queryset.values("pk", *fields)[: offset + limit]:
+            title = values.get(source.title_field, "") if source.title_field else ""
+            results.append(
+                {
+                    "type": kind,
+                    "id": values["pk"],
+                    "title": _highlight(title, terms),
+                    "snippet": _highlight(values[source.body_field], terms),
+                    "rank": None,
+                }
+            )
+    return results[offset: offset + limit]
+
+
+def _highlight(text, terms):
+    """
+    Выделяет вхождения слов запроса в тексте (для поиска без FTS5).
+    """
+    pattern = "|".join(re.escape(term) for term in terms)
+    return _render(
+        re.sub(f"({pattern})", rf"{_MARK_START}\1{_MARK_END}", text or "", flags=re.IGNORECASE)
+    )
+
+
+def _render(text):
+    """
+    Экранирует текст для HTML и заменяет временные метки выделения тегами.
+    """
+    return (
+        html.escape(text or "")
+        .replace(_MARK_START, HIGHLIGHT_START)
+        .replace(_MARK_END, HIGHLIGHT_END)
+    )
@@ -0,0 +1,213 @@
+"""
+Этот модуль содержит правила отбора мастеров для действия ``pro``.
+
+Правило задаёт набор специальностей (по id или названию), границы
+рейтинга и домены почты клиентов, заказы которых исключают мастера.
+Домен сравнивается целиком и без учёта регистра (``@mail.ru`` не
+совпадает с ``@hotmail.ru``). Пресеты по умолчанию сохраняют прежнюю
+проверку действия ``pro`` — окончание адреса (``exclude_email_suffixes``,
+``email__endswith``): «mail.ru» исключает и ``@hotmail.ru``.
+Правило берётся из параметров запроса или из именованного пресета
+(настройка ``REM_PRO_PRESETS``) и компилируется в один запрос, где
+исключение по клиентам — подзапрос ``NOT EXISTS`` вместо соединения
+с заказами, поэтому мастера не дублируются.
+"""
+
+from decimal import Decimal, InvalidOperation
+from typing import NamedTuple
+
+from django.conf import settings
+from django.db.models import Exists, OuterRef, Q
+from rest_framework.exceptions import ValidationError
+
+from .models import Order
+
+# Наибольшее значение первичного ключа (BigAutoField)
+MAX_ID = 2**63 - 1
+RULE_PARAMS = ("preset", "speciality", "min_rating", "max_rating", "exclude_email_domain")
+
+DEFAULT_PRO_PRESETS = {
+    "electricians_painters": {
+        "label": "Мастеры (электрики или маляры) с рейтингом выше или равно 4. "
+        "Почта клиентов не оканчивается на 'gmail.com'",
+        "specialities": ["Электрик", "Маляр"],
+        "min_rating": 4,
+        "exclude_email_suffixes": ["gmail.com"],
+    },
+    "plumbers_carpenters": {
+        "label": "Мастеры (сантехники или плотники) с рейтингом ниже или равно 3. "
+        "Почта клиентов не оканчивается на 'mail.ru'",
+        "specialities": ["Сантехник", "Плотник"],
+        "max_rating": 3,
+        "exclude_email_suffixes": ["mail.ru"],
+    },
+}
+
+
+class SelectionRule(NamedTuple):
+    """
+    Правило отбора мастеров.
+
+    Атрибуты:
+        label (str): Человекочитаемое описание правила.
+        specialities (tuple): Id или названия специальностей; пусто — любые.
+        min_rating (Decimal): Нижняя граница рейтинга включительно.
+        max_rating (Decimal): Верхняя граница рейтинга включительно.
+        exclude_email_domains (tuple): Домены почты клиентов, заказы которых
+            исключают мастера.
+        exclude_email_suffixes (tuple): Окончания адресов почты клиентов
+            (сравнение ``endswith``), заказы которых исключают мастера.
+    """
+
+    label: str = ""
+    specialities: tuple = ()
+    min_rating: Decimal = None
+    max_rating: Decimal = None
+    exclude_email_domains: tuple = ()
+    exclude_email_suffixes: tuple = ()
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Создаёт правило из словаря пресета.
+        """
+        return cls(
+            label=data.get("label", ""),
+            specialities=tuple(str(name) for name in data.get("specialities", ())),
+            min_rating=_decimal(data.get("min_rating"), "min_rating"),
+            max_rating=_decimal(data.get("max_rating"), "max_rating"),
+            exclude_email_domains=tuple(
+                _domain(domain) for domain in data.get("exclude_email_domains", ())
+            ),
+            exclude_email_suffixes=tuple(
+                str(suffix) for suffix in data.get("exclude_email_suffixes", ())
+            ),
+        )
+
+    def cache_key(self):
+        """
+        Возвращает каноническое представление правила, не зависящее от
+        порядка значений в параметрах запроса.
+        """
+        return repr(
+            (
+                tuple(sorted(set(self.specialities))),
+                None if self.min_rating is None else str(self.min_rating.normalize()),
+                None if self.max_rating is None else str(self.max_rating.normalize()),
+                tuple(sorted(set(self.exclude_email_domains))),
+                tuple(sorted(set(self.exclude_email_suffixes))),
+            )
+        )
+
+    def apply(self, queryset):
+        """
+        Возвращает queryset мастеров, удовлетворяющих правилу.
+        """
+        if self.specialities:
+            ids = [_speciality_id(value) for value in self.specialities if value.isdecimal()]
+            names = [value for value in self.specialities if not value.isdecimal()]
+            queryset = queryset.filter(Q(speciality__in=ids) | Q(speciality__name__in=names))
+        if self.min_rating is not None:
+            queryset = queryset.filter(rating__gte=self.min_rating)
+        if self.max_rating is not None:
+            queryset = queryset.filter(rating__lte=self.max_rating)
+        if self.exclude_email_domains or self.exclude_email_suffixes:
+            clients = Q()
+            for domain in self.exclude_email_domains:
+                clients |= Q(id_user__email__iendswith=f"@{domain}")
+            for suffix in self.exclude_email_suffixes:
+                clients |= Q(id_user__email__endswith=suffix)
+            queryset = queryset.filter(
+                ~Exists(Order.objects.filter(clients, id_master=OuterRef("pk")))
+            )
+        return queryset.order_by("-rating", "id")
+
+
+def _decimal(value, name):
+    """
+    Преобразует границу рейтинга в Decimal.
+    """
+    if value in (None, ""):
+        return None
+    try:
+        result = Decimal(str(value))
+    except InvalidOperation:
+        raise ValidationError({name: "Ожидается число."})
+    # Decimal принимает NaN и Infinity, но поле рейтинга их не сравнивает
+    if not result.is_finite():
+        raise ValidationError({name: "Ожидается число."})
+    return result
+
+
+def _speciality_id(value):
+    """
+    Преобразует id специальности из правила в число.
+    """
+    try:
+        result = int(value)
+    except ValueError:
+        raise ValidationError({"speciality": f"Неверный id специальности: {value}."})
+    if result > MAX_ID:
+        raise ValidationError({"speciality": f"Неверный id специальности: {value}."})
+    return result
+
+
+def _domain(value):
+    """
+    Нормализует домен почты: нижний регистр, без ведущего ``@``.
+    """
+    return str(value).strip().lstrip("@").lower()
+
+
+def _split(value):
+    """
+    Разбирает список значений, разделённых запятыми.
+    """
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def get_presets():
+    """
+    Возвращает словарь {имя пресета: правило}.
+    """
+    presets = getattr(settings, "REM_PRO_PRESETS", None) or DEFAULT_PRO_PRESETS
+    return {name: SelectionRule.from_dict(data) for name, data in presets.items()}
+
+
+def rule_from_params(params):
+    """
+    Возвращает правило из параметров запроса или ``None``, если ни один
+    параметр правила не передан.
+
+    Параметр ``preset`` выбирает пресет; остальные параметры
+    (``speciality``, ``min_rating``, ``max_rating``, ``exclude_email_domain``,
+    списки — через запятую или повтором параметра) переопределяют его поля.
+    """
+    if not any(name in params for name in RULE_PARAMS):
+        return None
+
+    rule = SelectionRule()
+    preset = params.get("preset")
+    if preset:
+        presets = get_presets()
+        if preset not in presets:
+            raise ValidationError(
+                {"preset": f"Неизвестный пресет. Доступны: {', '.join(sorted(presets))}."}
+            )
+        rule = presets[preset]
+
+    specialities = [item for value in params.getlist("speciality") for item in _split(value)]
+    if specialities:
+        rule = rule._replace(specialities=tuple(specialities))
+    for name in ("min_rating", "max_rating"):
+        if params.get(name):
+            rule = rule._replace(**{name: _decimal(params.get(name), name)})
+    domains = [
+        _domain(item)
+        for value in params.getlist("exclude_email_domain")
+        for item in _split(value)
+    ]
+    if domains:
+        # Явные домены заменяют и окончания адресов из пресета
+        rule = rule._replace(exclude_email_domains=tuple(domains), exclude_email_suffixes=())
+    return rule
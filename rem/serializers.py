@@ -4,9 +4,154 @@
 """
 
 from rest_framework import serializers
-from .models import Client, Master, Order, Speciality, Service, Review
+from .models import (
+    Client,
+    DailyMasterRollup,
+    DailySpecialityRollup,
+    Master,
+    Order,
+    REVIEW_FIELDS,
+    Speciality,
+    Service,
+    Review,
+)
 
-class ClientSerializer(serializers.ModelSerializer):
+
+class ExpandableSerializerMixin:
+    """
+    Примесь для встраивания связанных объектов в ответ по параметру ``?include=``.
+
+    Атрибут ``expandable_fields`` сопоставляет имя связи в параметре
+    ``include`` паре (поле внешнего ключа, имя сериализатора). Встроенный
+    объект выводится под именем связи; вложенные связи задаются через точку,
+    например ``?include=master.speciality,client``. Набор связей передаётся
+    через контекст (``context["include"]``) представлением, которое также
+    загружает их через ``select_related``.
+    """
+
+    expandable_fields = {}
+
+    def __init__(self, *args, include=None, **kwargs):
+        self._include = include
+        super().__init__(*args, **kwargs)
+
+    @classmethod
+    def parse_include(cls, value):
+        """
+        Разбирает строку ``include`` в дерево связей, отбрасывая неизвестные имена.
+        """
+        tree = {}
+        for path in (value or "").split(","):
+            serializer_class = cls
+            node = tree
+            for name in path.strip().split("."):
+                expandable = getattr(serializer_class, "expandable_fields", {})
+                if name not in expandable:
+                    break
+                node = node.setdefault(name, {})
+                serializer_class = _serializer_by_name(expandable[name][1])
+        return tree
+
+    @classmethod
+    def select_related_paths(cls, include):
+        """
+        Возвращает пути ``select_related`` для дерева связей.
+        """
+        paths = []
+        for name, subtree in include.items():
+            source, serializer_name = cls.expandable_fields[name]
+            nested = _serializer_by_name(serializer_name).select_related_paths(subtree)
+            paths.extend(f"{source}__{path}" for path in nested)
+            if not nested:
+                paths.append(source)
+        return paths
+
+    def get_include(self):
+        """
+        Возвращает дерево встраиваемых связей для этого сериализатора.
+        """
+        if self._include is None:
+            self._include = self.context.get("include") or {}
+        return self._include
+
+    def to_representation(self, instance):
+        """
+        Добавляет встроенные представления связанных объектов.
+        """
+        data = super().to_representation(instance)
+        include = self.get_include()
+        if not include:
+            return data
+
+        nested = getattr(self, "_nested_serializers", None)
+        if nested is None:
+            nested = self._nested_serializers = {
+                name: _serializer_by_name(self.expandable_fields[name][1])(
+                    context=self.context, include=subtree, fields=(), omit=()
+                )
+                for name, subtree in include.items()
+            }
+        for name, serializer in nested.items():
+            related = getattr(instance, self.expandable_fields[name][0])
+            data[name] = serializer.to_representation(related) if related else None
+        return data
+
+
+class SparseFieldsetMixin:
+    """
+    Примесь для выборочного вывода полей по параметрам ``?fields=`` и ``?omit=``.
+
+    Наборы полей передаются через контекст (``context["fields"]`` и
+    ``context["omit"]``) представлением, которое также сужает SELECT
+    через ``.only()``/``.defer()``. Ограничение действует только при
+    чтении: сериализатор с входными данными проверяет все поля.
+    Пустой набор означает отсутствие ограничения.
+    """
+
+    def __init__(self, *args, fields=None, omit=None, **kwargs):
+        self._sparse_fields = fields
+        self._sparse_omit = omit
+        super().__init__(*args, **kwargs)
+
+    def get_fields(self):
+        """
+        Возвращает поля сериализатора с учётом ``fields`` и ``omit``.
+        """
+        fields = super().get_fields()
+        if hasattr(self, "initial_data"):
+            return fields
+
+        only = self._sparse_fields
+        if only is None:
+            only = self.context.get("fields") or ()
+        omit = self._sparse_omit
+        if omit is None:
+            omit = self.context.get("omit") or ()
+
+        if only:
+            fields = {name: field for name, field in fields.items() if name in only}
+        for name in omit:
+            fields.pop(name, None)
+        return fields
+
+
+class BaseModelSerializer(
+    SparseFieldsetMixin, ExpandableSerializerMixin, serializers.ModelSerializer
+):
+    """
+    Базовый сериализатор приложения: встраивание связей (``?include=``)
+    и выборочный вывод полей (``?fields=``/``?omit=``).
+    """
+
+
+def _serializer_by_name(name):
+    """
+    Возвращает класс сериализатора этого модуля по имени.
+    """
+    return globals()[name]
+
+
+class ClientSerializer(BaseModelSerializer):
     """Сериализатор для модели Клиент."""
 
     class Meta:
@@ -22,12 +167,27 @@ class ClientSerializer(serializers.ModelSerializer):
         return value  # Возвращает корректное значение
 
 
-class MasterSerializer(serializers.ModelSerializer):
+class MasterSerializer(BaseModelSerializer):
     """Сериализатор для модели Мастер."""
 
+    expandable_fields = {
+        "speciality": ("speciality", "SpecialitySerializer"),
+    }
+
     class Meta:
         model = Master  # Модель для сериализации
         fields = "__all__"  # Включить все поля модели
+        # Поля отзывов поддерживаются rem.ratings
+        read_only_fields = REVIEW_FIELDS
+
+    def get_fields(self):
+        """
+        При наличии отзывов рейтинг — средняя оценка, его меняют только отзывы.
+        """
+        fields = super().get_fields()
+        if isinstance(self.instance, Master) and self.instance.review_count:
+            fields["rating"].read_only = True
+        return fields
 
     def validate_rating(self, value):
         """Проверка рейтинга мастера."""
@@ -36,9 +196,14 @@ class MasterSerializer(serializers.ModelSerializer):
         return value  # Возвращает корректное значение
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(BaseModelSerializer):
     """Сериализатор для модели Заказ."""
 
+    expandable_fields = {
+        "client": ("id_user", "ClientSerializer"),
+        "master": ("id_master", "MasterSerializer"),
+    }
+
     class Meta:
         model = Order  # Модель для сериализации
         fields = "__all__"  # Включить все поля модели
@@ -50,7 +215,7 @@ class OrderSerializer(serializers.ModelSerializer):
         return value  # Возвращает корректное значение
 
 
-class SpecialitySerializer(serializers.ModelSerializer):
+class SpecialitySerializer(BaseModelSerializer):
     """Сериализатор для модели Специальность."""
 
     class Meta:
@@ -58,7 +223,7 @@ class SpecialitySerializer(serializers.ModelSerializer):
         fields = "__all__"  # Включить все поля модели
 
 
-class ServiceSerializer(serializers.ModelSerializer):
+class ServiceSerializer(BaseModelSerializer):
     """Сериализатор для модели Услуга."""
 
     class Meta:
@@ -66,9 +231,38 @@ class ServiceSerializer(serializers.ModelSerializer):
         fields = "__all__"  # Включить все поля модели
 
 
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(BaseModelSerializer):
     """Сериализатор для модели Отзыв."""
 
+    expandable_fields = {
+        "client": ("client", "ClientSerializer"),
+        "master": ("master", "MasterSerializer"),
+    }
+
     class Meta:
         model = Review  # Модель для сериализации
         fields = "__all__"  # Включить все поля модели
+
+
+class DailyMasterRollupSerializer(BaseModelSerializer):
+    """Сериализатор для дневного агрегата заказов мастера."""
+
+    expandable_fields = {
+        "master": ("master", "MasterSerializer"),
+    }
+
+    class Meta:
+        model = DailyMasterRollup  # Модель для сериализации
+        exclude = ("id",)  # Строка агрегата определяется днём и мастером
+
+
+class DailySpecialityRollupSerializer(BaseModelSerializer):
+    """Сериализатор для дневного агрегата заказов специальности."""
+
+    expandable_fields = {
+        "speciality": ("speciality", "SpecialitySerializer"),
+    }
+
+    class Meta:
+        model = DailySpecialityRollup  # Модель для сериализации
+        exclude = ("id",)  # Строка агрегата определяется днём и специальностью
@@ -0,0 +1,238 @@
+"""
+Этот модуль содержит обработчики сигналов моделей приложения.
+"""
+
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+
+from . import leaderboards
+from .autocomplete import AUTOCOMPLETE_MODELS, index_name, kind_of, remove_name
+from .caching import bump_model_version_on_commit
+from .models import Client, Master, Order, Review, Service, Speciality
+from .ratings import apply_review_change, review_state
+from .rollups import apply_order_change, order_state, refresh_master_speciality
+from .search import SEARCH_SOURCES, index_object, remove_object
+
+VERSIONED_MODELS = (Speciality, Client, Master, Order, Service, Review)
+
+
+def bump_version_on_commit(sender, **kwargs):
+    """
+    Обновляет версию изменённой модели после фиксации транзакции.
+    """
+    bump_model_version_on_commit(sender)
+
+
+for versioned_model in VERSIONED_MODELS:
+    post_save.connect(
+        bump_version_on_commit,
+        sender=versioned_model,
+        dispatch_uid=f"rem_version_save_{versioned_model.__name__}",
+    )
+    post_delete.connect(
+        bump_version_on_commit,
+        sender=versioned_model,
+        dispatch_uid=f"rem_version_delete_{versioned_model.__name__}",
+    )
+
+
+def remember_order_state(sender, instance, **kwargs):
+    """
+    Запоминает загруженные значения заказа, чтобы при сохранении знать,
+    из каких агрегатов его нужно убрать.
+    """
+    instance._rollup_state = order_state(instance)
+
+
+def load_order_state(sender, instance, **kwargs):
+    """
+    Загружает прежние значения заказа, если при загрузке часть полей была отложена.
+    """
+    if not instance._state.adding and getattr(instance, "_rollup_state", None) is None:
+        instance._rollup_state = (
+            Order.objects.filter(pk=instance.pk)
+            .values_list("create_at", "id_master_id", "price")
+            .first()
+        )
+
+
+def update_rollups_on_save(sender, instance, created, **kwargs):
+    """
+    Применяет создание или изменение заказа к дневным агрегатам.
+    """
+    old = None if created else instance._rollup_state
+    new = instance._rollup_state = (instance.create_at, instance.id_master_id, instance.price)
+    known = {}
+    master = instance._state.fields_cache.get("id_master")
+    if master is not None and "speciality_id" in master.__dict__:
+        known[master.pk] = master.speciality_id
+    specialities = apply_order_change(old, new, known_specialities=known)
+    leaderboards.record_order_change(old, new, specialities)
+
+
+def update_rollups_on_delete(sender, instance, **kwargs):
+    """
+    Убирает удалённый заказ из дневных агрегатов.
+    """
+    old = getattr(instance, "_rollup_state", None) or order_state(instance)
+    leaderboards.record_order_change(old, None, apply_order_change(old, None))
+
+
+post_init.connect(remember_order_state, sender=Order, dispatch_uid="rem_rollup_init_order")
+pre_save.connect(load_order_state, sender=Order, dispatch_uid="rem_rollup_pre_save_order")
+post_save.connect(update_rollups_on_save, sender=Order, dispatch_uid="rem_rollup_save_order")
+post_delete.connect(update_rollups_on_delete, sender=Order, dispatch_uid="rem_rollup_delete_order")
+
+
+def remember_master_speciality(sender, instance, **kwargs):
+    """
+    Запоминает загруженную специальность мастера.
+    """
+    instance._rollup_speciality_id = instance.__dict__.get("speciality_id")
+
+
+def move_master_rollups(sender, instance, created, **kwargs):
+    """
+    Переносит заказы мастера между агрегатами специальностей при смене
+    специальности и обновляет мастера в рейтингах.
+    """
+    old = instance._rollup_speciality_id
+    instance._rollup_speciality_id = instance.speciality_id
+    if not created and old is not None and old != instance.speciality_id:
+        refresh_master_speciality(instance.pk, old, instance.speciality_id)
+    leaderboards.record_master(
+        instance.pk, instance.speciality_id, instance.rating, old_speciality_id=old
+    )
+
+
+def remove_master_from_leaderboards(sender, instance, **kwargs):
+    """
+    Удаляет удалённого мастера из рейтингов.
+    """
+    leaderboards.remove_master(instance.pk, instance.speciality_id)
+
+
+post_init.connect(remember_master_speciality, sender=Master, dispatch_uid="rem_rollup_init_master")
+post_save.connect(move_master_rollups, sender=Master, dispatch_uid="rem_rollup_save_master")
+post_delete.connect(
+    remove_master_from_leaderboards, sender=Master, dispatch_uid="rem_leaderboard_delete_master"
+)
+
+
+def remember_review_state(sender, instance, **kwargs):
+    """
+    Запоминает загруженные мастера и оценку отзыва.
+    """
+    instance._rating_state = review_state(instance)
+
+
+def load_review_state(sender, instance, **kwargs):
+    """
+    Загружает прежние значения отзыва, если при загрузке часть полей была отложена.
+    """
+    if not instance._state.adding and getattr(instance, "_rating_state", None) is None:
+        instance._rating_state = (
+            Review.objects.filter(pk=instance.pk).values_list("master_id", "rating").first()
+        )
+
+
+def update_rating_on_save(sender, instance, created, **kwargs):
+    """
+    Применяет создание или изменение отзыва к рейтингу мастера.
+    """
+    old = None if created else instance._rating_state
+    new = instance._rating_state = (instance.master_id, instance.rating)
+    apply_review_change(old, new)
+    _refresh_rating_leaderboards(old, new)
+
+
+def update_rating_on_delete(sender, instance, **kwargs):
+    """
+    Убирает оценку удалённого отзыва из рейтинга мастера.
+    """
+    old = getattr(instance, "_rating_state", None) or review_state(instance)
+    apply_review_change(old, None)
+    _refresh_rating_leaderboards(old, None)
+
+
+def _refresh_rating_leaderboards(old, new):
+    """
+    Обновляет в рейтингах средние оценки мастеров, затронутых изменением отзыва.
+    """
+    if old != new:
+        leaderboards.refresh_masters(
+            {state[0] for state in (old, new) if state is not None}, metrics=("rating",)
+        )
+
+
+post_init.connect(remember_review_state, sender=Review, dispatch_uid="rem_rating_init_review")
+pre_save.connect(load_review_state, sender=Review, dispatch_uid="rem_rating_pre_save_review")
+post_save.connect(update_rating_on_save, sender=Review, dispatch_uid="rem_rating_save_review")
+post_delete.connect(update_rating_on_delete, sender=Review, dispatch_uid="rem_rating_delete_review")
+
+
+def update_search_index(sender, instance, **kwargs):
+    """
+    Добавляет или обновляет документ объекта в таблице полнотекстового поиска.
+    """
+    index_object(instance)
+
+
+def remove_from_search_index(sender, instance, **kwargs):
+    """
+    Удаляет документ удалённого объекта из таблицы полнотекстового поиска.
+    """
+    remove_object(sender, instance.pk)
+
+
+for search_source in SEARCH_SOURCES:
+    post_save.connect(
+        update_search_index,
+        sender=search_source.model,
+        dispatch_uid=f"rem_search_save_{search_source.model.__name__}",
+    )
+    post_delete.connect(
+        remove_from_search_index,
+        sender=search_source.model,
+        dispatch_uid=f"rem_search_delete_{search_source.model.__name__}",
+    )
+
+
+def remember_name(sender, instance, **kwargs):
+    """
+    Запоминает загруженное имя клиента или мастера.
+    """
+    instance._autocomplete_name = instance.__dict__.get("full_name")
+
+
+def update_autocomplete(sender, instance, created, **kwargs):
+    """
+    Записывает новое или изменённое имя в индекс автодополнения.
+    """
+    if created or instance._autocomplete_name != instance.full_name:
+        index_name(kind_of(sender), instance.pk, instance.full_name, created=created)
+    instance._autocomplete_name = instance.full_name
+
+
+def remove_from_autocomplete(sender, instance, **kwargs):
+    """
+    Удаляет имя удалённого объекта из индекса автодополнения.
+    """
+    remove_name(kind_of(sender), instance.pk)
+
+
+for autocomplete_model in AUTOCOMPLETE_MODELS.values():
+    post_init.connect(
+        remember_name,
+        sender=autocomplete_model,
+        dispatch_uid=f"rem_autocomplete_init_{autocomplete_model.__name__}",
+    )
+    post_save.connect(
+        update_autocomplete,
+        sender=autocomplete_model,
+        dispatch_uid=f"rem_autocomplete_save_{autocomplete_model.__name__}",
+    )
+    post_delete.connect(
+        remove_from_autocomplete,
+        sender=autocomplete_model,
+        dispatch_uid=f"rem_autocomplete_delete_{autocomplete_model.__name__}",
+    )
@@ -1,14 +1,128 @@
 from celery import shared_task
 import logging
+import smtplib
 
 logger = logging.getLogger(__name__)
 
+
 @shared_task
 def send_reminder_email():
-    logger.info("Отправка напоминания по электронной почте")
-    # Добавьте вашу логику отправки почты
+    """
+    Выбирает получателей напоминаний на сегодня и ставит подзадачу
+    ``send_reminder_chunk`` на каждую пачку клиентов.
+    """
+    from .reminders import plan_reminders
+
+    count = plan_reminders(
+        dispatch=lambda today, client_ids: send_reminder_chunk.delay(today.isoformat(), client_ids)
+    )
+    logger.info("Напоминания запланированы: %s клиентов", count)
+    return count
+
+
+@shared_task(
+    autoretry_for=(OSError, smtplib.SMTPException),
+    retry_backoff=True,
+    max_retries=5,
+)
+def send_reminder_chunk(date, client_ids):
+    """
+    Отправляет напоминания пачке клиентов через одно SMTP-соединение.
+    Если соединение не открылось, задача повторяется; отправленные
+    письма при повторе не дублируются.
+    """
+    import datetime
+
+    from .reminders import send_reminders
+
+    sent, failed = send_reminders(datetime.date.fromisoformat(date), client_ids)
+    logger.info("Напоминания отправлены: %s, с ошибкой: %s", sent, failed)
+    return sent, failed
+
 
 @shared_task
 def cleanup_old_orders():
     logger.info("Очистка старых заказов")
     # Добавьте вашу логику для очистки старых заказов
+
+
+@shared_task
+def rebuild_rollups(days=None):
+    """
+    Перестраивает дневные агрегаты заказов за последние ``days`` дней
+    (по умолчанию ``REM_ROLLUP_REBUILD_DAYS``; ``None`` — за всё время).
+    """
+    import datetime
+
+    from django.conf import settings
+    from django.utils import timezone
+
+    from .rollups import rebuild_rollups as rebuild
+
+    if days is None:
+        days = getattr(settings, "REM_ROLLUP_REBUILD_DAYS", None)
+    date_from = None
+    if days is not None:
+        date_from = timezone.localdate() - datetime.timedelta(days=days)
+    result = rebuild(date_from=date_from)
+    logger.info("Дневные агрегаты перестроены: %s", result)
+    return result
+
+
+@shared_task
+def rebuild_leaderboards():
+    """
+    Перестраивает рейтинги мастеров в Redis по базе и исправляет
+    расхождения после пропущенных обновлений.
+    """
+    from .leaderboards import LeaderboardUnavailable
+    from .leaderboards import rebuild_leaderboards as rebuild
+
+    try:
+        count = rebuild()
+    except LeaderboardUnavailable as exc:
+        logger.warning("Рейтинги мастеров не перестроены: %s", exc)
+        return None
+    logger.info("Рейтинги мастеров перестроены: %s мастеров", count)
+    return count
+
+
+@shared_task(bind=True)
+def enforce_history_retention(self):
+    """
+    Удаляет записи истории без изменений и архивирует записи старше
+    срока хранения (``REM_HISTORY_RETENTION``). За запуск обрабатывается
+    не больше ``REM_HISTORY_MAX_BATCHES`` пачек на модель; если
+    устаревшие записи остались, задача ставит себя в очередь снова.
+    """
+    from django.conf import settings
+
+    from .history import compact_history
+
+    result, done = compact_history(
+        max_batches=getattr(settings, "REM_HISTORY_MAX_BATCHES", 50),
+        deduplicate_days=getattr(settings, "REM_HISTORY_DEDUPLICATE_DAYS", 2),
+    )
+    logger.info("История изменений сжата: %s", result)
+    if not done:
+        self.apply_async(countdown=getattr(settings, "REM_HISTORY_RESCHEDULE_DELAY", 60))
+    return result
+
+
+@shared_task
+def drain_outbox():
+    """
+    Доставляет готовые сообщения исходящей очереди (rem.outbox) и
+    удаляет доставленные старше ``REM_OUTBOX_RETENTION_DAYS`` дней.
+    """
+    from django.conf import settings
+
+    from .outbox import drain, purge
+
+    delivered, failed = drain(max_batches=getattr(settings, "REM_OUTBOX_MAX_BATCHES", 10))
+    purged = purge(getattr(settings, "REM_OUTBOX_RETENTION_DAYS", 7))
+    if delivered or failed or purged:
+        logger.info(
+            "Исходящая очередь: доставлено %s, с ошибкой %s, удалено %s", delivered, failed, purged
+        )
+    return delivered, failed
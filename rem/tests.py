@@ -1,3 +1,1801 @@
-from django.test import TestCase
+"""
+Тесты приложения rem.
+"""
 
-# Create your tests here.
+import base64
+import csv
+import datetime
+import gzip
+import json
+import smtplib
+import tempfile
+import threading
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+import msgpack
+from asgiref.sync import async_to_sync
+from django.contrib import admin
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.mail.backends import locmem
+from django.db import DatabaseError, connection, transaction
+from django.db.models import QuerySet, Sum
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from . import leaderboards, metrics, outbox, search
+from .bulk import bulk_change_price
+from .history import compact_history, deferred_history
+from .mixins import QueryBudgetExceeded
+from .profiling import Capture
+from .renderers import FastJSONRenderer, MessagePackRenderer
+from .reminders import plan_reminders, send_reminders
+from .rollups import rebuild_rollups
+from .models import (
+    Client,
+    DailyMasterRollup,
+    DailySpecialityRollup,
+    Master,
+    Order,
+    OutboxMessage,
+    ReminderDelivery,
+    Review,
+    Service,
+    Speciality,
+)
+from .tasks import enforce_history_retention, send_reminder_chunk, send_reminder_email
+from .urls import router
+from .views import MasterViewSet, OrderFilter, OrderViewSet
+
+LOCMEM_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+}
+
+CRUD_ACTIONS = ("list", "retrieve", "create", "update", "partial_update", "destroy")
+
+
+def create_dataset(size):
+    """
+    Создаёт набор данных: специальность, клиента, мастера и ``size``
+    заказов и отзывов.
+    """
+    speciality = Speciality.objects.create(name="Электрик")
+    client = Client.objects.create(full_name="Иван Петров", email="ivan@mail.ru")
+    master = Master.objects.create(full_name="Пётр Иванов", speciality=speciality, rating=4)
+    for number in range(size):
+        Order.objects.create(number=number, id_user=client, id_master=master, price=100)
+        Review.objects.create(client=client, master=master, rating=4, comment="Хорошо")
+    Service.objects.create(name="Проводка", description="Замена проводки")
+    return client, master
+
+
+@override_settings(CACHES=LOCMEM_CACHES, REM_QUERY_BUDGET_MODE="raise")
+class QueryBudgetTests(TestCase):
+    """
+    Проверяет, что действия ViewSet'ов укладываются в заявленный бюджет
+    SQL-запросов. При превышении ``QueryBudgetMixin`` выбрасывает
+    ``QueryBudgetExceeded``, и тест падает.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.api = APIClient()
+        self.client_obj, self.master = create_dataset(5)
+        self.order = Order.objects.first()
+        self.review = Review.objects.first()
+        self.service = Service.objects.first()
+
+    def test_every_action_declares_budget(self):
+        """Каждое действие каждого ViewSet'а объявляет бюджет запросов."""
+        for prefix, viewset, basename in router.registry:
+            actions = {name for name in CRUD_ACTIONS if hasattr(viewset, name)}
+            actions.update(action.__name__ for action in viewset.get_extra_actions())
+            missing = actions - set(viewset.query_budget)
+            self.assertFalse(missing, f"{viewset.__name__}: нет бюджета для {missing}")
+
+    def test_read_actions(self):
+        """Списки и детальные представления со всеми связями укладываются в бюджет."""
+        urls = [
+            "/api/orders/?include=master.speciality,client&page_size=100",
+            f"/api/orders/{self.order.pk}/?include=master.speciality,client",
+            "/api/reviews/?include=master.speciality,client&page_size=100",
+            f"/api/reviews/{self.review.pk}/?include=master,client",
+            "/api/masters/?include=speciality",
+            f"/api/masters/{self.master.pk}/?include=speciality",
+            "/api/masters/statistics/",
+            "/api/masters/pro/?include=speciality",
+            "/api/clients/",
+            "/api/specialisties/",
+            "/api/services/",
+        ]
+        for url in urls:
+            response = self.api.get(url)
+            self.assertEqual(response.status_code, 200, url)
+
+    def test_write_actions(self):
+        """Операции записи укладываются в бюджет."""
+        order_data = {
+            "number": 7,
+            "id_user": self.client_obj.pk,
+            "id_master": self.master.pk,
+            "price": 300,
+        }
+        requests = [
+            ("post", "/api/orders/", order_data, 201),
+            ("put", f"/api/orders/{self.order.pk}/", order_data, 200),
+            ("patch", f"/api/orders/{self.order.pk}/", {"price": 150}, 200),
+            ("post", f"/api/orders/{self.order.pk}/change_price/", {"price": 200}, 200),
+            ("delete", f"/api/orders/{self.order.pk}/", None, 204),
+            ("post", "/api/clients/", {"full_name": "Анна", "email": "anna@gmail.com"}, 201),
+            ("patch", f"/api/clients/{self.client_obj.pk}/", {"email": "i@gmail.com"}, 200),
+            ("patch", f"/api/masters/{self.master.pk}/", {"rating": 5}, 200),
+            ("patch", f"/api/reviews/{self.review.pk}/", {"rating": 3}, 200),
+            ("delete", f"/api/reviews/{self.review.pk}/", None, 204),
+            ("post", "/api/services/", {"name": "Сантехника", "description": "Трубы"}, 201),
+            ("delete", f"/api/services/{self.service.pk}/", None, 204),
+        ]
+        for method, url, data, status_code in requests:
+            response = getattr(self.api, method)(url, data, format="json")
+            self.assertEqual(response.status_code, status_code, url)
+
+    def test_list_queries_do_not_depend_on_page_size(self):
+        """Число запросов списка со встроенными связями не зависит от размера страницы."""
+        counts = []
+        for page_size in (1, 5):
+            with CaptureQueriesContext(connection) as queries:
+                self.api.get(f"/api/orders/?include=master.speciality,client&page_size={page_size}")
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_budget_exceeded_raises(self):
+        """Превышение бюджета приводит к ошибке."""
+        original = MasterViewSet.query_budget
+        MasterViewSet.query_budget = {**original, "list": 0}
+        try:
+            with self.assertRaises(QueryBudgetExceeded):
+                self.api.get("/api/masters/")
+        finally:
+            MasterViewSet.query_budget = original
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class OrderIndexPlanTests(TestCase):
+    """
+    Проверяет по ``EXPLAIN QUERY PLAN`` SQLite, что фильтры и сортировки
+    заказов и отзывов обслуживаются индексами, а не полным просмотром
+    таблицы или временной сортировкой.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.api = APIClient()
+        self.client_obj, self.master = create_dataset(5)
+
+    def assertUsesIndex(self, queryset, index):
+        plan = queryset.explain()
+        self.assertIn(f"USING INDEX {index}", plan.replace("COVERING INDEX", "INDEX"))
+        self.assertNotIn("USE TEMP B-TREE", plan)
+
+    def filter_orders(self, **params):
+        return OrderFilter(params, queryset=Order.objects.all()).qs
+
+    def test_order_filters_use_indexes(self):
+        """Фильтры заказов по мастеру, клиенту, датам и цене используют индексы."""
+        since = "2024-01-01T00:00:00Z"
+        cases = [
+            (
+                self.filter_orders(id_master=self.master.pk, create_at_from=since),
+                "rem_order_master_create_idx",
+            ),
+            (
+                self.filter_orders(id_user=self.client_obj.pk, create_at_from=since),
+                "rem_order_user_create_idx",
+            ),
+            (self.filter_orders(create_at_from=since, create_at_to=since), "rem_order_create_id_idx"),
+            (self.filter_orders(updated_at_from=since), "rem_order_updated_idx"),
+            (self.filter_orders(price_from=100, price_to=200), "rem_order_price_idx"),
+        ]
+        for queryset, index in cases:
+            with self.subTest(index=index):
+                self.assertUsesIndex(queryset.order_by(), index)
+
+    def test_order_orderings_use_indexes(self):
+        """Сортировки заказов (как их строит keyset-пагинация) не требуют временной сортировки."""
+        cases = [
+            (Order.objects.order_by("-create_at", "-id"), "rem_order_create_id_idx"),
+            (Order.objects.order_by("price", "id"), "rem_order_price_idx"),
+            (Order.objects.order_by("-updated_at", "-id"), "rem_order_updated_idx"),
+            (
+                Order.objects.filter(id_master=self.master).order_by("-create_at", "-id"),
+                "rem_order_master_create_idx",
+            ),
+        ]
+        for queryset, index in cases:
+            with self.subTest(index=index):
+                self.assertUsesIndex(queryset, index)
+
+    def test_review_by_master_uses_index(self):
+        """Отзывы о мастере по дате выбираются по индексу (мастер, дата создания)."""
+        queryset = Review.objects.filter(master=self.master).order_by("-created_at")
+        self.assertUsesIndex(queryset, "rem_review_master_created_idx")
+
+    def test_order_filters_and_ordering_api(self):
+        """Включительные границы цены и дат и сортировка с курсором."""
+        orders = list(Order.objects.order_by("pk"))
+        for price, order in zip((100, 150, 200, 250, 300), orders):
+            Order.objects.filter(pk=order.pk).update(
+                price=price, updated_at=order.create_at + datetime.timedelta(days=price)
+            )
+
+        response = self.api.get("/api/orders/?price_from=150&price_to=250&page_size=10")
+        self.assertEqual(sorted(row["price"] for row in response.json()["results"]), ["150", "200", "250"])
+        response = self.api.get("/api/orders/?min_price=150&max_price=250&page_size=10")
+        self.assertEqual([row["price"] for row in response.json()["results"]], ["200"])
+
+        boundary = (orders[0].create_at + datetime.timedelta(days=200)).isoformat()
+        response = self.api.get("/api/orders/", {"updated_at_from": boundary, "page_size": 10})
+        self.assertEqual(len(response.json()["results"]), 3)
+
+        prices, url = [], "/api/orders/?ordering=-price&page_size=2"
+        while url:
+            page = self.api.get(url).json()
+            prices += [row["price"] for row in page["results"]]
+            url = page["next"]
+        self.assertEqual(prices, ["300", "250", "200", "150", "100"])
+
+    def test_order_search_rejects_non_finite_numbers(self):
+        """Поиск по ``NaN`` и бесконечности ничего не находит вместо ошибки."""
+        for term in ("NaN", "sNaN", "Infinity", "-Infinity", "100 NaN"):
+            with self.subTest(term=term):
+                response = self.api.get("/api/orders/", {"search": term})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json()["results"], [])
+        response = self.api.get("/api/orders/", {"search": "100", "page_size": 10})
+        self.assertEqual(len(response.json()["results"]), 5)
+
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend",
+    REM_REMINDER_CHUNK_SIZE=2,
+    REM_REMINDER_RATE_LIMIT=None,
+)
+class ReminderEmailTests(TestCase):
+    """
+    Проверяет рассылку напоминаний: выбор получателей, отправку пачками
+    через подзадачи и запись состояния доставок.
+    """
+
+    def setUp(self):
+        cache.clear()
+        # Подзадачи выполняются сразу, без брокера
+        conf = send_reminder_chunk.app.conf
+        self.addCleanup(setattr, conf, "task_always_eager", conf.task_always_eager)
+        conf.task_always_eager = True
+
+        speciality = Speciality.objects.create(name="Электрик")
+        master = Master.objects.create(full_name="Пётр Иванов", speciality=speciality, rating=4)
+        now = timezone.now()
+        ages = {
+            "recent@mail.ru": 0,
+            "stale@mail.ru": 200,
+            "stale2@mail.ru": 300,
+            "active@mail.ru": 30,
+            "": 0,
+        }
+        for number, (email, days) in enumerate(ages.items()):
+            client = Client.objects.create(full_name=f"Клиент {number}", email=email)
+            order = Order.objects.create(number=number, id_user=client, id_master=master, price=100)
+            Order.objects.filter(pk=order.pk).update(create_at=now - datetime.timedelta(days=days))
+
+    def test_reminders_are_sent_once_per_client(self):
+        """Письма получают клиенты с недавним или давним заказом, повторный запуск их не дублирует."""
+        self.assertEqual(send_reminder_email(), 3)
+        self.assertEqual(
+            sorted(message.to[0] for message in mail.outbox),
+            ["recent@mail.ru", "stale2@mail.ru", "stale@mail.ru"],
+        )
+        recent = next(message for message in mail.outbox if message.to == ["recent@mail.ru"])
+        self.assertEqual(recent.subject, "Напоминание о заказе")
+        self.assertEqual(
+            dict(ReminderDelivery.objects.values_list("client__email", "kind")),
+            {"recent@mail.ru": "recent", "stale@mail.ru": "stale", "stale2@mail.ru": "stale"},
+        )
+        self.assertFalse(ReminderDelivery.objects.exclude(status="sent").exists())
+        self.assertFalse(ReminderDelivery.objects.filter(sent_at=None).exists())
+
+        self.assertEqual(send_reminder_email(), 0)
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_temporary_refusal_is_retried(self):
+        """Постоянный отказ помечает доставку ошибкой, временный оставляет её до повтора."""
+        plan_reminders(dispatch=lambda today, client_ids: None)
+        today, client_ids = timezone.localdate(), list(Client.objects.values_list("pk", flat=True))
+        backend = RefusingEmailBackend(
+            refusals={
+                "stale@mail.ru": smtplib.SMTPRecipientsRefused({"stale@mail.ru": (550, b"No such user")}),
+                "stale2@mail.ru": smtplib.SMTPDataError(451, b"Try again later"),
+            }
+        )
+        with self.assertRaises(smtplib.SMTPDataError):
+            send_reminders(today, client_ids, connection=backend)
+        self.assertEqual(
+            dict(ReminderDelivery.objects.values_list("client__email", "status")),
+            {"recent@mail.ru": "sent", "stale@mail.ru": "failed", "stale2@mail.ru": "pending"},
+        )
+
+        self.assertEqual(send_reminders(today, client_ids), (1, 0))
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ["recent@mail.ru", "stale2@mail.ru"])
+
+
+class RefusingEmailBackend(locmem.EmailBackend):
+    """
+    Почтовый бэкенд для тестов: письма на адреса из ``refusals``
+    отклоняются заданной ошибкой SMTP, остальные попадают в ``mail.outbox``.
+    """
+
+    def __init__(self, refusals=None, **kwargs):
+        super().__init__(**kwargs)
+        self.refusals = refusals or {}
+
+    def send_messages(self, messages):
+        for message in messages:
+            if message.to[0] in self.refusals:
+                raise self.refusals[message.to[0]]
+        return super().send_messages(messages)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class BulkChangePriceTests(TestCase):
+    """
+    Проверяет массовое изменение цен заказов по фильтру.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.api = APIClient()
+        self.client_obj, self.master = create_dataset(3)
+        self.other = Master.objects.create(
+            full_name="Сергей Смирнов", speciality=self.master.speciality, rating=4
+        )
+        for number in (10, 11):
+            Order.objects.create(number=number, id_user=self.client_obj, id_master=self.other, price=100)
+
+    def test_empty_filters_are_rejected(self):
+        """Без непустого фильтра или поискового запроса цены не меняются."""
+        for query in ("", "?number=", "?search=", "?search=%20", "?id_master=&price_from="):
+            with self.subTest(query=query):
+                response = self.api.post(
+                    f"/api/orders/bulk_change_price/{query}", {"delta": "5"}, format="json"
+                )
+                self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exclude(price=100).exists())
+
+    def test_only_filtered_orders_are_repriced(self):
+        """Меняются цены только отобранных заказов, для них пишется история."""
+        history_before = Order.history.count()
+        response = self.api.post(
+            f"/api/orders/bulk_change_price/?id_master={self.other.pk}", {"delta": "5"}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["updated"], 2)
+        self.assertEqual(
+            sorted(Order.objects.values_list("id_master", "price")),
+            sorted([(self.master.pk, 100)] * 3 + [(self.other.pk, 105)] * 2),
+        )
+        changes = Order.history.filter(history_type="~")
+        self.assertEqual(Order.history.count(), history_before + 2)
+        self.assertEqual(sorted(changes.values_list("id_master", "price")), [(self.other.pk, 105)] * 2)
+
+    def test_skipped_orders_get_no_history(self):
+        """Заказ, пропущенный условием отбора после проверки, не получает истории."""
+        cheap = Order.objects.create(number=12, id_user=self.client_obj, id_master=self.other, price=3)
+        history_before = Order.history.count()
+        # Проверка «пропускает» заказ, как при его параллельном изменении
+        with mock.patch.object(QuerySet, "count", return_value=0):
+            updated, negative = bulk_change_price(Order.objects.filter(id_master=self.other), delta=-5)
+        self.assertEqual((updated, negative), (2, 0))
+        cheap.refresh_from_db()
+        self.assertEqual(cheap.price, 3)
+        self.assertEqual(Order.history.count(), history_before + 2)
+        self.assertFalse(Order.history.filter(id=cheap.pk, history_type="~").exists())
+
+    @override_settings(REM_BULK_REPRICE_CHUNK_SIZE=2)
+    def test_failure_rolls_back_all_chunks(self):
+        """Ошибка в одной пачке отменяет изменения уже обработанных пачек."""
+        refresh = mock.patch("rem.bulk.refresh_order_rollups", side_effect=[None, DatabaseError("сбой")])
+        with refresh, self.assertRaises(DatabaseError):
+            bulk_change_price(Order.objects.all(), delta=5)
+        self.assertFalse(Order.objects.exclude(price=100).exists())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class BulkCreateOrdersTests(TestCase):
+    """
+    Проверяет массовое создание заказов пакетом.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.api = APIClient()
+        self.client_obj, self.master = create_dataset(0)
+
+    def items(self, count, start=100, **overrides):
+        item = {"id_user": self.client_obj.pk, "id_master": self.master.pk, "price": 100, **overrides}
+        return [{**item, "number": start + index} for index in range(count)]
+
+    def post(self, body):
+        return self.api.post("/api/orders/bulk/", body, format="json")
+
+    def test_atomic_creates_orders_with_history(self):
+        """Корректный пакет создаётся целиком, для каждого заказа пишется история ``+``."""
+        response = self.post(self.items(3))
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(len(response.json()["created"]), 3)
+        self.assertEqual(response.json()["errors"], [])
+        self.assertEqual(
+            sorted(Order.history.values_list("history_type", "number")),
+            [("+", 100), ("+", 101), ("+", 102)],
+        )
+
+    def test_foreign_keys_are_checked_per_batch(self):
+        """Клиенты и мастера пакета проверяются одним запросом: число запросов не растёт."""
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(self.post(self.items(2)).status_code, 201)
+        with CaptureQueriesContext(connection) as large:
+            self.assertEqual(self.post(self.items(20, start=200)).status_code, 201)
+        self.assertEqual(len(small), len(large))
+
+    def test_atomic_rolls_back_on_error(self):
+        """В режиме ``atomic`` ошибка одного элемента отменяет весь пакет."""
+        items = self.items(3)
+        items[1]["id_master"] = 999999
+        response = self.post({"items": items, "mode": "atomic"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error["index"] for error in response.json()["errors"]], [1])
+        self.assertIn("id_master", response.json()["errors"][0]["errors"])
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(Order.history.exists())
+
+    def test_partial_creates_valid_items(self):
+        """В режиме ``partial`` создаются корректные заказы, ответ — 207 с ошибками."""
+        items = self.items(3)
+        items[0]["id_user"] = 999999
+        items[2]["price"] = "abc"
+        response = self.post({"items": items, "mode": "partial"})
+        self.assertEqual(response.status_code, 207, response.content)
+        body = response.json()
+        self.assertEqual([order["number"] for order in body["created"]], ["101"])
+        self.assertEqual([error["index"] for error in body["errors"]], [0, 2])
+        self.assertFalse(body["atomic"])
+        self.assertEqual(list(Order.objects.values_list("number", flat=True)), [101])
+        self.assertEqual(Order.history.count(), 1)
+
+    def test_partial_without_valid_items(self):
+        """Если не создан ни один заказ, ответ — 400."""
+        response = self.post({"items": self.items(2, id_master=999999), "mode": "partial"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(response.json()["errors"]), 2)
+        self.assertFalse(Order.objects.exists())
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class KeysetPaginationTests(TestCase):
+    """
+    Проверяет keyset-пагинацию заказов: проход по курсорам вперёд и назад,
+    сортировку ``?ordering=`` и отказ на подделанный курсор.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.api = APIClient()
+        create_dataset(5)
+        # Одинаковые даты создания: порядок внутри них задаёт id
+        Order.objects.filter(pk__in=Order.objects.order_by("pk").values("pk")[:3]).update(
+            create_at=timezone.now()
+        )
+
+    def walk(self, url):
+        pages = []
+        while url:
+            page = self.api.get(url).json()
+            pages.append(page)
+            url = page["next"]
+        return pages
+
+    def ids(self, page):
+        return [row["id"] for row in page["results"]]
+
+    def test_cursor_round_trip(self):
+        """Курсоры проходят все заказы по порядку без повторов, ссылка назад возвращает предыдущую страницу."""
+        pages = self.walk("/api/orders/?page_size=2")
+        expected = list(Order.objects.order_by("-create_at", "-id").values_list("pk", flat=True))
+        self.assertEqual([pk for page in pages for pk in self.ids(page)], expected)
+        self.assertIsNone(pages[0]["previous"])
+        for previous, page in zip(pages, pages[1:]):
+            back = self.api.get(page["previous"]).json()
+            self.assertEqual(self.ids(back), self.ids(previous))
+
+    def test_ordering_is_kept_in_cursor(self):
+        """Сортировка ``?ordering=`` сохраняется при переходе по курсорам."""
+        for number, order in enumerate(Order.objects.order_by("pk")):
+            Order.objects.filter(pk=order.pk).update(price=300 - number % 2 * 100)
+        pages = self.walk("/api/orders/?ordering=-price&page_size=2")
+        expected = list(Order.objects.order_by("-price", "-id").values_list("pk", flat=True))
+        self.assertEqual([pk for page in pages for pk in self.ids(page)], expected)
+
+    def test_tampered_cursor_is_rejected(self):
+        """Неразбираемый, неполный или с пустыми позициями курсор даёт 404, а не ошибку сервера."""
+        def token(payload):
+            return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+        cursors = [
+            "not-base64!",
+            token([1, 2]),
+            token({"p": [None, None], "r": 0}),
+            token({"p": ["2024-01-01T00:00:00Z"], "r": 0}),
+            token({"p": ["not a date", "1"], "r": 0}),
+        ]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                response = self.api.get("/api/orders/", {"cursor": cursor})
+                self.assertEqual(response.status_code, 404)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class MasterRatingTests(TestCase):
+    """
+    Проверяет поля отзывов мастера: их изменение при создании, изменении
+    и удалении отзывов и защиту от перезаписи устаревшими значениями.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.api = APIClient()
+        speciality = Speciality.objects.create(name="Электрик")
+        self.client_obj = Client.objects.create(full_name="Иван Петров", email="ivan@mail.ru")
+        self.master = Master.objects.create(full_name="Пётр Иванов", speciality=speciality, rating=3)
+        self.other = Master.objects.create(full_name="Сергей Смирнов", speciality=speciality, rating=3)
+
+    def review(self, rating, master=None):
+        return Review.objects.create(
+            client=self.client_obj, master=master or self.master, rating=rating, comment="Отзыв"
+        )
+
+    def counters(self, master):
+        master.refresh_from_db()
+        return (
+            master.review_count,
+            master.rating_sum,
+            [getattr(master, f"reviews_{value}") for value in range(1, 6)],
+            master.rating,
+        )
+
+    def test_review_changes_update_counters(self):
+        """Создание, изменение оценки, смена мастера и удаление отзыва меняют поля отзывов."""
+        first, second = self.review(5), self.review(4)
+        self.assertEqual(self.counters(self.master), (2, 9, [0, 0, 0, 1, 1], Decimal("4.50")))
+
+        second.rating = 2
+        second.save()
+        self.assertEqual(self.counters(self.master), (2, 7, [0, 1, 0, 0, 1], Decimal("3.50")))
+
+        second.master = self.other
+        second.save()
+        self.assertEqual(self.counters(self.master), (1, 5, [0, 0, 0, 0, 1], Decimal("5.00")))
+        self.assertEqual(self.counters(self.other), (1, 2, [0, 1, 0, 0, 0], Decimal("2.00")))
+
+        first.delete()
+        self.assertEqual(self.counters(self.master)[:3], (0, 0, [0, 0, 0, 0, 0]))
+
+    def test_last_review_delete_keeps_average(self):
+        """После удаления последнего отзыва рейтинг — последняя средняя оценка и снова задаётся вручную."""
+        self.review(4)
+        self.review(5).delete()
+        self.assertEqual(self.counters(self.master), (1, 4, [0, 0, 0, 1, 0], Decimal("4.00")))
+        Review.objects.get(master=self.master).delete()
+        self.assertEqual(self.counters(self.master), (0, 0, [0, 0, 0, 0, 0], Decimal("4.00")))
+
+        response = self.api.patch(f"/api/masters/{self.master.pk}/", {"rating": 2}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.counters(self.master)[3], Decimal("2.00"))
+
+    def test_save_is_single_update(self):
+        """Сохранение мастера без отзывов записывает рейтинг тем же ``UPDATE``."""
+        master = Master.objects.get(pk=self.other.pk)
+        master.rating = 5
+        with CaptureQueriesContext(connection) as queries:
+            master.save()
+        updates = [query["sql"] for query in queries if query["sql"].startswith("UPDATE")]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"rating"', updates[0])
+        self.assertEqual(self.counters(self.other)[3], Decimal("5.00"))
+
+    def test_stale_master_save_keeps_counters(self):
+        """Сохранение мастера, загруженного до отзыва, не затирает поля отзывов и рейтинг."""
+        stale = Master.objects.get(pk=self.master.pk)
+        self.review(5)
+        stale.description = "Опыт 10 лет"
+        stale.rating = 1
+        stale.save()
+        self.assertEqual(self.counters(self.master), (1, 5, [0, 0, 0, 0, 1], Decimal("5.00")))
+        self.assertEqual(self.master.description, "Опыт 10 лет")
+
+    def test_rating_is_read_only_with_reviews(self):
+        """Рейтинг мастера без отзывов задаётся через API, с отзывами — нет."""
+        response = self.api.patch(f"/api/masters/{self.other.pk}/", {"rating": 5}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.counters(self.other)[3], Decimal("5.00"))
+
+        self.review(4)
+        response = self.api.patch(
+            f"/api/masters/{self.master.pk}/", {"rating": 1, "review_count": 10}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.counters(self.master), (1, 4, [0, 0, 0, 1, 0], Decimal("4.00")))
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    REM_DEFERRED_HISTORY=["rem.Order"],
+    REM_DEFERRED_HISTORY_COLLAPSE=False,
+)
+class DeferredHistoryTests(TestCase):
+    """
+    Проверяет отложенную запись истории (``rem.history``): записи пишутся
+    при выходе из блока, совпадают с обычной историей, а записи
+    откатившихся транзакций не попадают в историю.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.api = APIClient()
+        self.client_obj, self.master = create_dataset(1)
+        self.order = Order.objects.get()
+
+    def history(self):
+        return list(self.order.history.order_by("history_date", "history_id").values_list("history_type", "price"))
+
+    def change_prices(self, *prices):
+        for price in prices:
+            self.order.price = price
+            self.order.save()
+
+    def test_history_is_written_on_exit(self):
+        """Записи появляются при выходе из блока и совпадают с записью без отсрочки."""
+        with deferred_history():
+            with self.captureOnCommitCallbacks(execute=True):
+                self.change_prices(200, 300)
+            self.assertEqual(self.history(), [("+", 100)])
+        self.assertEqual(self.history(), [("+", 100), ("~", 200), ("~", 300)])
+
+    def test_collapse_keeps_last_state(self):
+        """При объединении несколько изменений объекта дают одну запись."""
+        with deferred_history(collapse=True):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.change_prices(200, 300)
+        self.assertEqual(self.history(), [("+", 100), ("~", 300)])
+
+    def test_rolled_back_changes_are_not_recorded(self):
+        """Изменения откатившейся транзакции не попадают в историю."""
+        with deferred_history():
+            with self.captureOnCommitCallbacks(execute=True):
+                with self.assertRaises(ValueError), transaction.atomic():
+                    self.change_prices(999)
+                    raise ValueError
+                self.change_prices(200)
+        self.assertEqual(self.history(), [("+", 100), ("~", 200)])
+
+    def test_commit_after_request_is_recorded(self):
+        """Транзакция, зафиксированная после конца запроса, пишет историю сразу."""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.api.patch(f"/api/orders/{self.order.pk}/", {"price": 150}, format="json")
+            self.api.post(f"/api/orders/{self.order.pk}/change_price/", {"price": 200}, format="json")
+        self.assertEqual(self.history(), [("+", 100), ("~", 150), ("~", 200)])
+
+    def test_write_error_does_not_fail_block(self):
+        """Ошибка записи истории попадает в лог и не прерывает блок."""
+        failure = mock.patch.object(QuerySet, "bulk_create", side_effect=DatabaseError("нет таблицы"))
+        with failure, self.assertLogs("rem.history", "ERROR"):
+            with deferred_history():
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.change_prices(200)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.price, 200)
+        self.assertEqual(self.history(), [("+", 100)])
+
+    @override_settings(REM_DEFERRED_HISTORY=[])
+    def test_disabled_by_default(self):
+        """Без настройки история пишется при сохранении."""
+        with deferred_history():
+            self.change_prices(200)
+            self.assertEqual(self.history(), [("+", 100), ("~", 200)])
+
+
+class ProfilingCaptureTests(TestCase):
+    """
+    Тесты хронологии SQL в профиле запроса.
+    """
+
+    def test_params_are_not_stored_by_default(self):
+        """По умолчанию в профиль попадают текст SQL и число параметров."""
+        capture = Capture(0)
+        capture.add_query("SELECT 1 WHERE email = %s", ("client@example.com",), capture.started, 0.001)
+        self.assertEqual(capture.queries[0]["param_count"], 1)
+        self.assertNotIn("params", capture.queries[0])
+
+    @override_settings(REM_PROFILING_CAPTURE_PARAMS=True)
+    def test_params_are_stored_when_enabled(self):
+        """Значения параметров сохраняются только по настройке."""
+        capture = Capture(0)
+        capture.add_query("SELECT 1 WHERE email = %s", ("client@example.com",), capture.started, 0.001)
+        self.assertIn("client@example.com", capture.queries[0]["params"])
+
+
+class MetricsFlushTests(TestCase):
+    """
+    Тесты передачи метрик в Redis.
+    """
+
+    def test_flush_runs_outside_request_thread(self):
+        """Запрос, заметивший истёкший интервал, не ждёт передачи метрик."""
+        flushed = threading.Event()
+        threads = []
+
+        def fake_flush():
+            threads.append(threading.get_ident())
+            flushed.set()
+
+        with mock.patch("rem.metrics.flush", side_effect=fake_flush):
+            with mock.patch.object(metrics.registry, "last_flush", 0):
+                metrics.maybe_flush()
+                self.assertTrue(flushed.wait(5))
+        self.assertNotEqual(threads, [threading.get_ident()])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class AdminSearchTests(TestCase):
+    """
+    Тесты поиска клиентов и мастеров в админ-панели.
+    """
+
+    def setUp(self):
+        self.client_obj, self.master = create_dataset(0)
+
+    def search(self, model, term):
+        model_admin = admin.site._registry[model]
+        results, _ = model_admin.get_search_results(None, model.objects.all(), term)
+        return list(results)
+
+    def test_substring_of_name(self):
+        """Подстрока из середины имени находит клиента, как раньше."""
+        self.assertEqual(self.search(Client, "етров"), [self.client_obj])
+
+    def test_name_prefix_through_autocomplete_index(self):
+        """Префикс слова имени ищется без учёта регистра и «ё»."""
+        self.assertEqual(self.search(Master, "петр"), [self.master])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ProSelectionTests(TestCase):
+    """
+    Тесты отбора мастеров действием ``pro``: разбор правил, пресеты и
+    кэширование по правилу.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.api = APIClient()
+        plumber = Speciality.objects.create(name="Сантехник")
+        carpenter = Speciality.objects.create(name="Плотник")
+        self.plumber = Master.objects.create(full_name="Пётр Иванов", speciality=plumber, rating=3)
+        self.carpenter = Master.objects.create(full_name="Сергей Смирнов", speciality=carpenter, rating=2)
+        self.strong = Master.objects.create(full_name="Олег Орлов", speciality=plumber, rating=5)
+        client = Client.objects.create(full_name="Иван Петров", email="ivan@hotmail.ru")
+        Order.objects.create(number=1, id_user=client, id_master=self.plumber, price=100)
+
+    def pro(self, query):
+        response = self.api.get(f"/api/masters/pro/?page_size=10&{query}")
+        self.assertEqual(response.status_code, 200, response.content)
+        return [master["id"] for master in response.json()["results"]]
+
+    def test_rule_from_params(self):
+        """Специальности по названию и id, границы рейтинга включительно."""
+        self.assertEqual(
+            self.pro("speciality=Сантехник,Плотник&max_rating=3"), [self.plumber.pk, self.carpenter.pk]
+        )
+        self.assertEqual(
+            self.pro(f"speciality={self.plumber.speciality_id}&min_rating=3"),
+            [self.strong.pk, self.plumber.pk],
+        )
+
+    def test_invalid_params(self):
+        """Нечисловая граница рейтинга и неизвестный пресет — ошибка 400."""
+        self.assertEqual(self.api.get("/api/masters/pro/?min_rating=abc").status_code, 400)
+        self.assertEqual(self.api.get("/api/masters/pro/?preset=missing").status_code, 400)
+
+    def test_non_finite_rating_bounds(self):
+        """NaN и бесконечность в границах рейтинга — ошибка 400, а не 500."""
+        for query in ("min_rating=NaN", "min_rating=Infinity", "max_rating=-inf", "max_rating=sNaN"):
+            self.assertEqual(self.api.get(f"/api/masters/pro/?{query}").status_code, 400, query)
+
+    def test_speciality_ids(self):
+        """Нецифровые «цифры» считаются названием, слишком большой id — ошибка 400."""
+        self.assertEqual(self.pro("speciality=²"), [])
+        response = self.api.get("/api/masters/pro/?speciality=99999999999999999999999")
+        self.assertEqual(response.status_code, 400)
+
+    def test_preset_keeps_legacy_suffix_match(self):
+        """Пресет исключает, как и прежде, адреса, оканчивающиеся на «mail.ru»."""
+        self.assertEqual(self.pro("preset=plumbers_carpenters"), [self.carpenter.pk])
+
+    def test_email_domain_matches_whole_domain(self):
+        """Домен из параметра сравнивается целиком: @hotmail.ru не равен @mail.ru."""
+        self.assertEqual(
+            self.pro("preset=plumbers_carpenters&exclude_email_domain=mail.ru"),
+            [self.plumber.pk, self.carpenter.pk],
+        )
+        self.assertEqual(
+            self.pro("preset=plumbers_carpenters&exclude_email_domain=HOTMAIL.ru"), [self.carpenter.pk]
+        )
+
+    def test_cache_is_shared_by_equivalent_rules(self):
+        """Правила, отличающиеся порядком значений, используют одну запись кэша."""
+        self.pro("speciality=Сантехник,Плотник&max_rating=3")
+        with self.assertNumQueries(0):
+            self.pro("max_rating=3.0&speciality=Плотник&speciality=Сантехник")
+
+    def test_cache_is_invalidated_by_orders(self):
+        """Новый заказ клиента с исключаемой почтой меняет результат."""
+        query = "speciality=Плотник&exclude_email_domain=hotmail.ru"
+        self.assertEqual(self.pro(query), [self.carpenter.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            Order.objects.create(number=2, id_user=Client.objects.get(), id_master=self.carpenter, price=100)
+        self.assertEqual(self.pro(query), [])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SparseFieldsetTests(TestCase):
+    """
+    Тесты выборочного вывода полей вместе со встраиванием связей.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.api = APIClient()
+        create_dataset(3)
+
+    def test_fields_with_include(self):
+        """``?fields=`` сужает поля заказа, встроенный мастер выводится целиком одним запросом."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.api.get("/api/orders/?fields=id,price&include=master&page_size=5")
+        self.assertEqual(response.status_code, 200)
+        results = response.json()["results"]
+        self.assertEqual(len(results), 3)
+        self.assertEqual(set(results[0]), {"id", "price", "master"})
+        self.assertEqual(results[0]["master"]["full_name"], "Пётр Иванов")
+        self.assertEqual(len(queries), 1)
+        self.assertIn('"rem_order"."id_master_id"', queries[0]["sql"])
+        self.assertNotIn('"rem_order"."number"', queries[0]["sql"])
+
+
+@override_settings(REM_OUTBOX_MAX_ATTEMPTS=3, REM_OUTBOX_RETRY_DELAY=30, REM_OUTBOX_MAX_RETRY_DELAY=3600)
+class OutboxTests(TestCase):
+    """
+    Тесты исходящей очереди: запись в транзакции, повторы и аренда.
+    """
+
+    def setUp(self):
+        self.handled = []
+        self.failing = False
+        handlers = mock.patch.dict(outbox.HANDLERS, {"test": self.handle})
+        handlers.start()
+        self.addCleanup(handlers.stop)
+
+    def handle(self, payload):
+        if self.failing:
+            raise RuntimeError("сбой")
+        self.handled.append(payload)
+
+    def expire(self, message):
+        """Сдвигает готовность и аренду сообщения в прошлое."""
+        past = timezone.now() - datetime.timedelta(seconds=1)
+        OutboxMessage.objects.filter(pk=message.pk).update(available_at=past, locked_until=past)
+
+    def test_rollback_enqueues_nothing(self):
+        """Сообщение откаченной транзакции не попадает в очередь."""
+        with self.assertRaises(ValueError), transaction.atomic():
+            outbox.enqueue("test", {"n": 1})
+            raise ValueError
+        self.assertFalse(OutboxMessage.objects.exists())
+        self.assertEqual(outbox.drain(), (0, 0))
+
+    def test_delivery(self):
+        """Готовое сообщение доставляется один раз."""
+        outbox.enqueue("test", {"n": 1})
+        self.assertEqual(outbox.drain(), (1, 0))
+        self.assertEqual(outbox.drain(), (0, 0))
+        self.assertEqual(self.handled, [{"n": 1}])
+        self.assertEqual(OutboxMessage.objects.get().status, "done")
+
+    def test_failure_backoff_and_failed(self):
+        """Ошибка откладывает повтор с растущей задержкой, после предела — ошибка."""
+        message = outbox.enqueue("test")
+        self.failing = True
+        delays = []
+        for _ in range(3):
+            started = timezone.now()
+            with self.assertLogs("rem.outbox", "WARNING"):
+                self.assertEqual(outbox.drain(), (0, 1))
+            # До конца задержки сообщение не захватывается
+            self.assertEqual(outbox.drain(), (0, 0))
+            message.refresh_from_db()
+            delays.append(round((message.available_at - started).total_seconds() / 30))
+            self.expire(message)
+        self.assertEqual(delays, [1, 2, 4])
+        self.assertEqual((message.status, message.attempts), ("failed", 3))
+        self.assertIn("RuntimeError", message.last_error)
+        self.assertEqual(outbox.drain(), (0, 0))
+
+    def test_lease_expiry_reclaims(self):
+        """Сообщение упавшего обработчика захватывается снова после аренды."""
+        message = outbox.enqueue("test", {"n": 1})
+        self.assertEqual(len(outbox.claim(10, lease=300)), 1)
+        self.assertEqual(outbox.claim(10, lease=300), [])
+        self.expire(message)
+        self.assertEqual(outbox.drain(), (1, 0))
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), ("done", 2))
+
+    def test_poison_message_is_failed(self):
+        """Сообщение, исчерпавшее попытки по истечении аренды, больше не захватывается."""
+        message = outbox.enqueue("test")
+        for _ in range(3):
+            self.assertEqual(len(outbox.claim(10, lease=300)), 1)
+            self.expire(message)
+        self.assertEqual(outbox.claim(10, lease=300), [])
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), ("failed", 3))
+        self.assertEqual(self.handled, [])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SearchTests(TestCase):
+    """
+    Тесты полнотекстового поиска: индекс FTS5, его сигналы и ``/api/search/``.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.api = APIClient()
+        self.client_obj, self.master = create_dataset(1)
+        self.service = Service.objects.get()
+
+    def found(self, query, **params):
+        response = self.api.get("/api/search/", {"q": query, **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return [(result["type"], result["id"]) for result in response.json()["results"]]
+
+    def test_prefix_search_with_highlight(self):
+        """Слова запроса ищутся как префиксы, совпадения выделяются."""
+        response = self.api.get("/api/search/", {"q": "провод"})
+        self.assertEqual(response.status_code, 200)
+        result = response.json()["results"][0]
+        self.assertEqual((result["type"], result["id"]), ("service", self.service.pk))
+        self.assertEqual(result["title"], "<mark>Проводка</mark>")
+        self.assertIn("<mark>проводки</mark>", result["snippet"])
+
+    def test_title_ranks_above_body(self):
+        """Совпадение в заголовке весомее совпадения в тексте."""
+        other = Service.objects.create(name="Розетки", description="Установка после замены проводки")
+        self.assertEqual(self.found("проводк"), [("service", self.service.pk), ("service", other.pk)])
+
+    def test_yo_is_folded(self):
+        """«ё» и «е» не различаются ни в запросе, ни в документе."""
+        self.assertEqual(self.found("пётр"), [("master", self.master.pk)])
+        self.assertEqual(self.found("петр"), [("master", self.master.pk)])
+
+    def test_type_filter(self):
+        """Параметр ``type`` ограничивает типы результатов."""
+        self.assertEqual(self.found("хорошо", type="review"), [("review", Review.objects.get().pk)])
+        self.assertEqual(self.found("хорошо", type="service,master"), [])
+
+    def test_fts_operators_and_html_are_inert(self):
+        """Операторы FTS5 в запросе не действуют, текст экранируется для HTML."""
+        Service.objects.create(name="<b>Плитка</b>", description="")
+        self.assertEqual(self.found('плитка OR "NEAR(*'), [])
+        result = self.api.get("/api/search/", {"q": "плитка"}).json()["results"][0]
+        self.assertEqual(result["title"], "&lt;b&gt;<mark>Плитка</mark>&lt;/b&gt;")
+
+    def test_signals_keep_index_in_sync(self):
+        """Изменение и удаление объектов обновляют индекс."""
+        self.service.name = "Освещение"
+        self.service.save()
+        self.assertEqual(self.found("провод"), [("service", self.service.pk)])
+        self.assertEqual(self.found("освещ"), [("service", self.service.pk)])
+        self.service.description = ""
+        self.service.save()
+        self.assertEqual(self.found("провод"), [])
+        self.master.delete()
+        self.assertEqual(self.found("петр"), [])
+
+    def test_rebuild_index(self):
+        """Перестройка восстанавливает индекс по таблицам моделей."""
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {search.SEARCH_TABLE}")
+        self.assertEqual(self.found("провод"), [])
+        self.assertEqual(search.rebuild_search_index(), {"service": 1, "master": 1, "review": 1})
+        self.assertEqual(self.found("провод"), [("service", self.service.pk)])
+
+    def test_invalid_params(self):
+        """Пустой запрос, неизвестный тип и неверный ``limit`` — ошибка 400."""
+        for params in ({"q": ""}, {"q": "провод", "type": "order"}, {"q": "провод", "limit": "0"}):
+            self.assertEqual(self.api.get("/api/search/", params).status_code, 400)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, REM_HISTORY_RETENTION={"rem.Order": 30})
+class HistoryRetentionTests(TestCase):
+    """
+    Тесты сжатия истории: удаление записей без изменений и архивирование
+    устаревших записей перед удалением.
+    """
+
+    def setUp(self):
+        archive_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(archive_dir.cleanup)
+        self.archive_dir = Path(archive_dir.name)
+        overrides = override_settings(REM_HISTORY_ARCHIVE_DIR=self.archive_dir)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.client_obj, self.master = create_dataset(0)
+
+    def order(self, number, prices):
+        """Создаёт заказ и сохраняет его с каждой ценой из ``prices``."""
+        order = Order.objects.create(
+            number=number, id_user=self.client_obj, id_master=self.master, price=100
+        )
+        for price in prices:
+            order.price = price
+            order.save()
+        return order
+
+    def history(self, order):
+        records = Order.history.filter(id=order.pk).order_by("history_date", "history_id")
+        return list(records.values_list("history_type", "price"))
+
+    def age(self, days, **filters):
+        """Сдвигает дату записей истории заказов на ``days`` дней назад."""
+        Order.history.filter(**filters).update(history_date=timezone.now() - datetime.timedelta(days=days))
+
+    def test_deduplicate_keeps_changes_creations_and_deletions(self):
+        """Удаляются только записи ``~`` без изменений; ``+`` и ``-`` остаются."""
+        order = self.order(1, [100, 200, 200, 300, 300])
+        other = self.order(2, [])
+        other_pk = other.pk
+        other.delete()
+        other.pk = other_pk
+        result, done = compact_history(targets=[Order])
+        self.assertEqual(result["rem.Order"], {"deduplicated": 3, "archived": 0})
+        self.assertTrue(done)
+        self.assertEqual(self.history(order), [("+", 100), ("~", 200), ("~", 300)])
+        self.assertEqual(self.history(other), [("+", 100), ("-", 100)])
+
+    def test_deduplicate_keeps_first_record_in_window(self):
+        """Первая запись ``~`` объекта в окне проверки не сравнивается и остаётся."""
+        order = self.order(1, [200])
+        self.age(5, id=order.pk)
+        order.save()
+        order.save()
+        result, _ = compact_history(targets=[Order], deduplicate_days=2)
+        self.assertEqual(result["rem.Order"]["deduplicated"], 1)
+        self.assertEqual(self.history(order), [("+", 100), ("~", 200), ("~", 200)])
+
+    def test_archive_before_delete_in_batches(self):
+        """Устаревшие записи попадают в архив gzip и удаляются пачками с продолжением."""
+        old = self.order(1, [200])
+        recent = self.order(2, [])
+        self.age(40, id=old.pk)
+        history_ids = sorted(Order.history.filter(id=old.pk).values_list("history_id", flat=True))
+
+        result, done = compact_history(targets=[Order], batch_size=1, max_batches=1)
+        self.assertEqual(result["rem.Order"]["archived"], 1)
+        self.assertFalse(done)
+        result, done = compact_history(targets=[Order], batch_size=1, max_batches=5)
+        self.assertEqual(result["rem.Order"]["archived"], 1)
+        self.assertTrue(done)
+
+        self.assertEqual(self.history(old), [])
+        self.assertEqual(self.history(recent), [("+", 100)])
+        archived = []
+        for path in sorted(self.archive_dir.glob("rem.order/*.jsonl.gz")):
+            with gzip.open(path, "rt", encoding="utf-8") as archive:
+                archived += [json.loads(line) for line in archive]
+        self.assertEqual(sorted(row["history_id"] for row in archived), history_ids)
+        self.assertEqual(
+            sorted((row["history_type"], row["price"]) for row in archived), [("+", "100"), ("~", "200")]
+        )
+
+    @override_settings(REM_HISTORY_BATCH_SIZE=1, REM_HISTORY_MAX_BATCHES=1, REM_HISTORY_RESCHEDULE_DELAY=60)
+    def test_task_reschedules_until_done(self):
+        """Задача ставит себя в очередь снова, пока устаревшие записи остаются."""
+        self.order(1, [200])
+        self.age(40)
+        with mock.patch.object(enforce_history_retention, "apply_async") as reschedule:
+            enforce_history_retention()
+            reschedule.assert_called_once_with(countdown=60)
+            reschedule.reset_mock()
+            enforce_history_retention()
+            reschedule.assert_not_called()
+        self.assertFalse(Order.history.exists())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RollupTests(TestCase):
+    """
+    Проверяет, что инкрементально поддерживаемые дневные агрегаты заказов
+    совпадают с перестроенными ``rebuild_rollups``.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.api = APIClient()
+        self.client_obj, self.master = create_dataset(0)
+        self.other = Master.objects.create(
+            full_name="Сергей Смирнов", speciality=Speciality.objects.create(name="Маляр"), rating=3
+        )
+        self.today = timezone.now()
+        self.yesterday = self.today - datetime.timedelta(days=1)
+        self.orders = [
+            Order.objects.create(
+                number=number,
+                id_user=self.client_obj,
+                id_master=self.master,
+                price=price,
+                create_at=self.today,
+            )
+            for number, price in enumerate((100, 300, 500))
+        ]
+
+    def rollups(self):
+        """Возвращает непустые строки обеих таблиц агрегатов."""
+        return {
+            model.__name__: sorted(
+                model.objects.filter(order_count__gt=0).values_list(
+                    "day", field + "_id", "order_count", "price_sum", "price_min", "price_max"
+                )
+            )
+            for model, field in ((DailyMasterRollup, "master"), (DailySpecialityRollup, "speciality"))
+        }
+
+    def assertMatchesRebuild(self):
+        incremental = self.rollups()
+        rebuild_rollups()
+        self.assertEqual(incremental, self.rollups())
+        return incremental
+
+    def test_create(self):
+        """Создание заказов."""
+        rollups = self.assertMatchesRebuild()
+        day = timezone.localdate(self.today)
+        self.assertEqual(rollups["DailyMasterRollup"], [(day, self.master.pk, 3, 900, 100, 500)])
+
+    def test_price_change(self):
+        """Изменение крайней и средней цены пересчитывает минимум и максимум."""
+        order = self.orders[2]
+        order.price = 50
+        order.save()
+        self.orders[1].price = 1000
+        self.orders[1].save()
+        rollups = self.assertMatchesRebuild()
+        self.assertEqual(rollups["DailyMasterRollup"][0][2:], (3, 1150, 50, 1000))
+
+    def test_master_change(self):
+        """Заказ переходит к мастеру другой специальности."""
+        order = self.orders[0]
+        order.id_master = self.other
+        order.save()
+        rollups = self.assertMatchesRebuild()
+        self.assertEqual(len(rollups["DailySpecialityRollup"]), 2)
+
+    def test_date_change(self):
+        """Заказ переносится на другой день."""
+        order = self.orders[2]
+        order.create_at = self.yesterday
+        order.save()
+        rollups = self.assertMatchesRebuild()
+        self.assertEqual([row[2] for row in rollups["DailyMasterRollup"]], [1, 2])
+
+    def test_delete(self):
+        """Удаление заказа с крайней ценой и последнего заказа дня."""
+        self.orders[2].delete()
+        lone = Order.objects.create(
+            number=9, id_user=self.client_obj, id_master=self.other, price=70, create_at=self.yesterday
+        )
+        lone.delete()
+        rollups = self.assertMatchesRebuild()
+        self.assertEqual(rollups["DailyMasterRollup"][0][2:], (2, 400, 100, 300))
+
+    def test_api_after_changes(self):
+        """Изменения через API отражаются в аналитике и совпадают с перестройкой."""
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.api.post(
+                "/api/orders/",
+                {"number": 10, "id_user": self.client_obj.pk, "id_master": self.other.pk, "price": 200},
+                format="json",
+            )
+            self.assertEqual(response.status_code, 201, response.content)
+            self.api.patch(f"/api/orders/{self.orders[0].pk}/", {"price": 150}, format="json")
+            self.api.delete(f"/api/orders/{self.orders[1].pk}/")
+        summary = self.api.get("/api/analytics/specialities/summary/").json()
+        listed = self.api.get("/api/analytics/masters/?page_size=10").json()["results"]
+        rollups = self.assertMatchesRebuild()
+
+        by_speciality = {row[1]: row[2:] for row in rollups["DailySpecialityRollup"]}
+        self.assertEqual(
+            {row["speciality"]: (row["order_count"], Decimal(row["price_sum"])) for row in summary},
+            {key: (count, total) for key, (count, total, _, _) in by_speciality.items()},
+        )
+        self.assertEqual(
+            sorted((row["master"], row["order_count"], Decimal(row["price_min"])) for row in listed),
+            sorted((row[1], row[2], row[4]) for row in rollups["DailyMasterRollup"]),
+        )
+
+
+class FakeRedis:
+    """
+    Хранилище в памяти с командами упорядоченных множеств Redis, которые
+    использует ``rem.leaderboards``. Равные значения упорядочиваются по
+    строке участника, как в Redis.
+    """
+
+    def __init__(self):
+        self.data = {}
+
+    def pipeline(self, transaction=False):
+        return FakePipeline(self)
+
+    def exists(self, key):
+        return int(key in self.data)
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    def delete(self, key):
+        return int(self.data.pop(key, None) is not None)
+
+    def rename(self, key, new_key):
+        self.data[new_key] = self.data.pop(key)
+
+    def scan_iter(self, match):
+        prefix = match.split("*")[0]
+        return [key.encode() for key in self.data if key.startswith(prefix)]
+
+    def zadd(self, key, mapping, nx=False):
+        members = self.data.setdefault(key, {})
+        for member, score in mapping.items():
+            if not (nx and str(member) in members):
+                members[str(member)] = float(score)
+
+    def zincrby(self, key, amount, member):
+        members = self.data.setdefault(key, {})
+        members[str(member)] = members.get(str(member), 0.0) + amount
+
+    def zrem(self, key, member):
+        self.data.get(key, {}).pop(str(member), None)
+
+    def zscore(self, key, member):
+        return self.data.get(key, {}).get(str(member))
+
+    def _sorted(self, key):
+        return sorted(self.data.get(key, {}).items(), key=lambda item: (item[1], item[0]))
+
+    def zrevrange(self, key, start, stop, withscores=False):
+        return [(member.encode(), score) for member, score in self._sorted(key)[::-1][start: stop + 1]]
+
+    def zrangebyscore(self, key, low, high, withscores=False):
+        members = [(member.encode(), score) for member, score in self._sorted(key) if low <= score <= high]
+        return members if withscores else [member for member, _ in members]
+
+    def zcount(self, key, low, high):
+        low = float(low[1:]) if low.startswith("(") else float(low)
+        return sum(1 for _, score in self._sorted(key) if score > low)
+
+
+class FakePipeline:
+    """
+    Конвейер ``FakeRedis``: команды выполняются при ``execute``.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.commands = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.commands.append((name, args, kwargs))
+
+    def execute(self):
+        return [getattr(self.connection, name)(*args, **kwargs) for name, args, kwargs in self.commands]
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class LeaderboardTests(TestCase):
+    """
+    Проверяет рейтинги мастеров: чтение из Redis и из базы даёт один и тот
+    же порядок, включая мастеров с равными значениями.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.api = APIClient()
+        self.speciality = Speciality.objects.create(name="Электрик")
+        client = Client.objects.create(full_name="Иван Петров", email="ivan@mail.ru")
+        # Одиннадцать мастеров: id 10 и больше при сравнении строк оказались бы
+        # раньше id 2..9
+        self.masters = [
+            Master.objects.create(full_name=f"Мастер {number}", speciality=self.speciality, rating=4)
+            for number in range(11)
+        ]
+        self.masters[5].rating = 5
+        self.masters[5].save()
+        for master in self.masters[3:]:
+            Order.objects.create(number=master.pk, id_user=client, id_master=master, price=100)
+
+    def leaderboard(self, query=""):
+        response = self.api.get(f"/api/masters/leaderboard/?speciality={self.speciality.pk}{query}")
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def read_both(self, query):
+        """Возвращает (источник, места, место мастера) из базы и из Redis."""
+        results = []
+        for redis in (None, FakeRedis()):
+            cache.clear()
+            if redis is None:
+                data = self.leaderboard(query)
+            else:
+                with mock.patch("rem.leaderboards.get_connection", return_value=redis):
+                    leaderboards.rebuild_leaderboards()
+                    data = self.leaderboard(query)
+            ranks = [(row["master"]["id"], row["score"]) for row in data["results"]]
+            results.append((data["source"], ranks, data["master"]))
+        return results
+
+    def test_rating_ties_match(self):
+        """Равные рейтинги упорядочены по id в обоих источниках."""
+        master = self.masters[10].pk
+        database, redis = self.read_both(f"&metric=rating&limit=4&master={master}")
+        self.assertEqual((database[0], redis[0]), ("database", "redis"))
+        expected = [self.masters[5].pk] + [m.pk for m in self.masters[:3]]
+        self.assertEqual([pk for pk, _ in database[1]], expected)
+        self.assertEqual(database[1:], redis[1:])
+        self.assertEqual(database[2]["rank"], 11)
+
+    def test_order_ties_match(self):
+        """Равное число заказов: порядок и место мастера совпадают."""
+        database, redis = self.read_both(f"&metric=orders&limit=5&master={self.masters[1].pk}")
+        self.assertEqual([pk for pk, _ in database[1]], [m.pk for m in self.masters[3:8]])
+        self.assertEqual(database[1:], redis[1:])
+        self.assertEqual(database[2]["rank"], 10)
+
+    def test_writes_without_redis_do_not_warn(self):
+        """Без Redis изменения мастеров и заказов не засоряют лог предупреждениями."""
+        with self.assertNoLogs("rem.leaderboards", "WARNING"):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.masters[0].rating = 3
+                self.masters[0].save()
+                Order.objects.create(
+                    number=100, id_user=Client.objects.get(), id_master=self.masters[0], price=100
+                )
+
+    def test_invalid_ids(self):
+        """Слишком большие и неположительные id — ошибка 400."""
+        for query in (
+            "/api/masters/leaderboard/?speciality=99999999999999999999999",
+            f"/api/masters/leaderboard/?speciality={self.speciality.pk}&master=99999999999999999999999",
+            "/api/masters/leaderboard/?speciality=0",
+        ):
+            self.assertEqual(self.api.get(query).status_code, 400, query)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class AsyncReadViewTests(TestCase):
+    """
+    Проверяет асинхронные list и retrieve (``/api/async/<ресурс>/``):
+    ответы совпадают с ответами синхронных ViewSet'ов.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.api = APIClient()
+        self.client_obj, self.master = create_dataset(3)
+
+    def get_async(self, url):
+        return async_to_sync(self.async_client.get)(url)
+
+    def get_both(self, path):
+        sync_response = self.api.get(f"/api/{path}")
+        cache.clear()
+        async_response = self.get_async(f"/api/async/{path}")
+        self.assertEqual(sync_response.status_code, 200)
+        self.assertEqual(async_response.status_code, 200)
+        return sync_response.json(), async_response.json()
+
+    def test_list_matches_sync(self):
+        """Страница списка совпадает с синхронной, ссылки ведут на ту же страницу."""
+        for path in ("orders/?page_size=2", "masters/?limit=5", "reviews/?page_size=10"):
+            with self.subTest(path=path):
+                sync_data, async_data = self.get_both(path)
+                self.assertEqual(async_data["results"], sync_data["results"])
+                for link in ("next", "previous"):
+                    sync_link = sync_data.get(link)
+                    self.assertEqual(
+                        async_data.get(link), sync_link and sync_link.replace("/api/", "/api/async/")
+                    )
+
+    def test_retrieve_matches_sync(self):
+        """Объект совпадает с синхронным ответом, в том числе со встроенными связями."""
+        order = Order.objects.first()
+        for path in (f"orders/{order.pk}/?include=master,client", f"masters/{self.master.pk}/"):
+            with self.subTest(path=path):
+                sync_data, async_data = self.get_both(path)
+                self.assertEqual(async_data, sync_data)
+
+    def test_not_found(self):
+        """Неизвестный ресурс и несуществующий объект — 404."""
+        self.assertEqual(self.get_async("/api/async/unknown/").status_code, 404)
+        self.assertEqual(self.get_async("/api/async/clients/").status_code, 404)
+        self.assertEqual(self.get_async("/api/async/orders/999999/").status_code, 404)
+        self.assertEqual(self.get_async("/api/async/orders/abc/").status_code, 404)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ConditionalGetTests(TestCase):
+    """
+    Проверяет условные GET-запросы: ETag, Last-Modified и ответ 304.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.api = APIClient()
+        self.client_obj, self.master = create_dataset(2)
+
+    def test_not_modified(self):
+        """Повторный запрос с ``If-None-Match`` получает 304 без запросов к базе."""
+        response = self.api.get("/api/masters/")
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        self.assertTrue(response.has_header("Last-Modified"))
+        with self.assertNumQueries(0):
+            repeated = self.api.get("/api/masters/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(repeated.status_code, 304)
+        self.assertEqual(repeated["ETag"], etag)
+        since = self.api.get("/api/masters/", HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+        self.assertEqual(since.status_code, 304)
+
+    def test_write_changes_etag(self):
+        """Запись обновляет версию модели: следующий запрос получает 200 и новый ETag."""
+        url = f"/api/masters/{self.master.pk}/"
+        etag = self.api.get(url)["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.api.patch(url, {"description": "Стаж 10 лет"}, format="json")
+        self.assertEqual(response.status_code, 200)
+        response = self.api.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.json()["description"], "Стаж 10 лет")
+
+    def test_etag_depends_on_format_and_included_models(self):
+        """ETag различается для разных форматов и меняется при записи встроенной связи."""
+        url = "/api/orders/?page_size=5&include=master"
+        etag = self.api.get(url)["ETag"]
+        self.assertNotEqual(self.api.get(url, HTTP_ACCEPT="application/msgpack")["ETag"], etag)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.master.description = "Новое описание"
+            self.master.save()
+        self.assertEqual(self.api.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, ALLOWED_HOSTS=["testserver", "api.example.com"])
+class ResponseCacheTests(TestCase):
+    """
+    Проверяет кэш ответов: попадание, сброс после записи и ключ по хосту.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.api = APIClient()
+        self.client_obj, self.master = create_dataset(2)
+        for name in ("Анна Смирнова", "Олег Котов"):
+            Master.objects.create(full_name=name, speciality=self.master.speciality, rating=5)
+
+    def test_hit_without_queries(self):
+        """Повторный запрос обслуживается из кэша без запросов к базе."""
+        response = self.api.get("/api/masters/")
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(0):
+            cached = self.api.get("/api/masters/")
+        self.assertEqual(cached.json(), response.json())
+
+    def test_write_invalidates(self):
+        """Запись мастера делает закэшированный ответ недостижимым."""
+        url = f"/api/masters/{self.master.pk}/"
+        self.api.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.api.patch(url, {"description": "Стаж 10 лет"}, format="json")
+        self.assertEqual(self.api.get(url).json()["description"], "Стаж 10 лет")
+
+    def test_links_follow_host(self):
+        """Абсолютные ссылки пагинации строятся от хоста запроса, а не из чужой записи кэша."""
+        url = "/api/masters/"
+        local = self.api.get(url).json()
+        remote = self.api.get(url, HTTP_HOST="api.example.com", secure=True).json()
+        self.assertTrue(local["next"].startswith("http://testserver/"))
+        self.assertTrue(remote["next"].startswith("https://api.example.com/"))
+        pro = self.api.get("/api/masters/pro/?speciality=Электрик").json()
+        other = self.api.get("/api/masters/pro/?speciality=Электрик", HTTP_HOST="api.example.com")
+        self.assertTrue(pro["next"].startswith("http://testserver/"))
+        self.assertTrue(other.json()["next"].startswith("http://api.example.com/"))
+
+    def test_reviews_not_public(self):
+        """Отзывы не помечаются как общедоступные данные каталога."""
+        response = self.api.get("/api/reviews/")
+        self.assertNotIn("public", response["Cache-Control"])
+        self.assertIn("private", response["Cache-Control"])
+        self.assertIn("public", self.api.get("/api/masters/")["Cache-Control"])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RendererTests(TestCase):
+    """
+    Проверяет рендереры и парсеры orjson и MessagePack: выбор формата по
+    ``Accept``, кодирование Decimal и дат, разбор тела MessagePack.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.api = APIClient()
+        self.client_obj, self.master = create_dataset(2)
+
+    def test_encode_default(self):
+        """Decimal, даты и ленивые строки кодируются как в стандартном ``JSONRenderer``."""
+        data = {
+            "price": Decimal("10.50"),
+            "at": datetime.datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=datetime.timezone.utc),
+            "day": datetime.date(2024, 5, 1),
+            "time": datetime.time(9, 15),
+            "label": gettext_lazy("Мастер"),
+        }
+        expected = json.loads(JSONRenderer().render(data))
+        self.assertEqual(json.loads(FastJSONRenderer().render(data)), expected)
+        self.assertEqual(msgpack.unpackb(MessagePackRenderer().render(data), raw=False), expected)
+        self.assertEqual(expected["price"], 10.5)
+        self.assertEqual(expected["at"], "2024-05-01T12:30:15.123456Z")
+
+    def test_accept_negotiation(self):
+        """Формат ответа выбирается заголовком ``Accept``, данные совпадают с JSON."""
+        url = "/api/orders/?page_size=5"
+        response = self.api.get(url)
+        self.assertEqual(response["Content-Type"], "application/json")
+        packed = self.api.get(url, HTTP_ACCEPT="application/msgpack")
+        self.assertEqual(packed.status_code, 200)
+        self.assertEqual(packed["Content-Type"], "application/msgpack")
+        self.assertEqual(msgpack.unpackb(packed.content, raw=False), response.json())
+        indented = self.api.get(url, HTTP_ACCEPT="application/json; indent=4")
+        self.assertIn(b"\n    ", indented.content)
+        self.assertEqual(json.loads(indented.content), response.json())
+
+    def test_msgpack_request_body(self):
+        """Тело запроса MessagePack разбирается и ответ возвращается в том же формате."""
+        body = {
+            "number": 7,
+            "price": "250",
+            "id_user": self.client_obj.pk,
+            "id_master": self.master.pk,
+        }
+        response = self.api.post(
+            "/api/orders/",
+            msgpack.packb(body, use_bin_type=True),
+            content_type="application/msgpack",
+            HTTP_ACCEPT="application/msgpack",
+        )
+        self.assertEqual(response.status_code, 201)
+        data = msgpack.unpackb(response.content, raw=False)
+        self.assertEqual((data["number"], data["price"]), ("7", "250"))
+        order = Order.objects.get(pk=data["id"])
+        self.assertEqual((order.number, order.price), (7, 250))
+        retrieved = self.api.get(f"/api/orders/{order.pk}/").json()
+        self.assertEqual(data["create_at"], retrieved["create_at"])
+
+    def test_parse_errors(self):
+        """Повреждённое тело JSON или MessagePack возвращает 400."""
+        for content, content_type in ((b"{", "application/json"), (b"\xc1", "application/msgpack")):
+            with self.subTest(content_type=content_type):
+                response = self.api.post("/api/orders/", content, content_type=content_type)
+                self.assertEqual(response.status_code, 400)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, REM_QUERY_BUDGET_MODE="raise", REM_EXPORT_CHUNK_SIZE=2)
+class ExportTests(TestCase):
+    """
+    Проверяет потоковую выгрузку в CSV и NDJSON и бюджет запросов выгрузки.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.api = APIClient()
+        self.client_obj, self.master = create_dataset(5)
+        Order.objects.filter(number=3).update(price=500)
+
+    def export(self, url):
+        response = self.api.get(url)
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content).decode("utf-8")
+
+    def test_csv(self):
+        """CSV содержит заголовок и отфильтрованные заказы в представлении API."""
+        content = self.export("/api/orders/export/?price_from=200&fields=id,number,price,create_at")
+        rows = list(csv.reader(content.splitlines()))
+        order = Order.objects.get(number=3)
+        api = self.api.get(f"/api/orders/{order.pk}/").json()
+        self.assertEqual(rows[0], ["id", "number", "create_at", "price"])
+        self.assertEqual(rows[1:], [[str(order.pk), "3", api["create_at"], "500"]])
+
+    def test_ndjson(self):
+        """NDJSON содержит по одному объекту на заказ в порядке id."""
+        content = self.export("/api/orders/export/?export_format=ndjson&omit=create_at,updated_at")
+        rows = [json.loads(line) for line in content.splitlines()]
+        pks = Order.objects.order_by("pk").values_list("pk", flat=True)
+        self.assertEqual([row["id"] for row in rows], list(pks))
+        self.assertEqual(set(rows[0]), {"id", "number", "id_user", "id_master", "price"})
+        self.assertEqual(rows[0]["id_master"], self.master.pk)
+
+    def test_unknown_format(self):
+        """Неизвестный формат выгрузки возвращает 400."""
+        self.assertEqual(self.api.get("/api/orders/export/?export_format=xml").status_code, 400)
+
+    def test_budget_enforced_while_streaming(self):
+        """Запросы, выполненные при чтении потока, сверяются с бюджетом ``export``."""
+        original = OrderViewSet.query_budget
+        OrderViewSet.query_budget = {**original, "export": 0}
+        try:
+            response = self.api.get("/api/orders/export/")
+            with self.assertRaises(QueryBudgetExceeded):
+                b"".join(response.streaming_content)
+        finally:
+            OrderViewSet.query_budget = original
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class MasterStatisticsTests(TestCase):
+    """
+    Проверяет статистику мастеров на небольшом известном наборе данных.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.api = APIClient()
+        self.electrician = Speciality.objects.create(name="Электрик")
+        self.painter = Speciality.objects.create(name="Маляр")
+        Speciality.objects.create(name="Плотник")
+        for name, speciality, rating in (
+            ("Пётр Иванов", self.electrician, "4.5"),
+            ("Олег Котов", self.electrician, "3"),
+            ("Анна Смирнова", self.electrician, "3.99"),
+            ("Ирина Белова", self.painter, "5"),
+            ("Сергей Орлов", self.painter, "1.5"),
+        ):
+            Master.objects.create(full_name=name, speciality=speciality, rating=Decimal(rating))
+
+    def test_counts_averages_and_histogram(self):
+        """Количество, средний рейтинг и гистограмма считаются по каждой специальности."""
+        data = self.api.get("/api/masters/statistics/").json()
+        self.assertEqual(data["Всего специальностей"], 5)
+        self.assertEqual(
+            data["Статистика по специальностям"],
+            [
+                {
+                    "speciality": self.painter.pk,
+                    "speciality__name": "Маляр",
+                    "count": 2,
+                    "avg_rating": "3.25",
+                    "rating_histogram": {"1": 1, "2": 0, "3": 0, "4": 0, "5": 1},
+                },
+                {
+                    "speciality": self.electrician.pk,
+                    "speciality__name": "Электрик",
+                    "count": 3,
+                    "avg_rating": "3.83",
+                    "rating_histogram": {"1": 0, "2": 0, "3": 2, "4": 1, "5": 0},
+                },
+            ],
+        )
+
+    def test_rating_change(self):
+        """Изменение рейтинга мастера переносит его в другой интервал гистограммы."""
+        self.api.get("/api/masters/statistics/")
+        with self.captureOnCommitCallbacks(execute=True):
+            master = Master.objects.get(full_name="Сергей Орлов")
+            master.rating = Decimal("2")
+            master.save()
+        data = self.api.get("/api/masters/statistics/").json()
+        painters = data["Статистика по специальностям"][0]
+        self.assertEqual(painters["avg_rating"], "3.50")
+        self.assertEqual(painters["rating_histogram"], {"1": 0, "2": 1, "3": 0, "4": 0, "5": 1})
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class GenerateDataTests(TestCase):
+    """
+    Проверяет команду ``generate_data`` на маленьком наборе данных: число
+    строк, целостность внешних ключей и перестроение производных данных.
+    """
+
+    def generate(self, *args):
+        with mock.patch("rem.leaderboards.get_connection", return_value=FakeRedis()):
+            call_command(
+                "generate_data",
+                "--specialities=3",
+                "--services=2",
+                "--clients=5",
+                "--masters=4",
+                "--orders=20",
+                "--reviews=10",
+                "--history-updates=1",
+                "--days=30",
+                "--seed=1",
+                "--batch-size=7",
+                *args,
+                stdout=StringIO(),
+            )
+
+    def test_row_counts_and_foreign_keys(self):
+        """Создаётся заданное число строк, все внешние ключи ссылаются на существующие строки."""
+        self.generate()
+        counts = {
+            model: model.objects.count()
+            for model in (Speciality, Service, Client, Master, Order, Review)
+        }
+        self.assertEqual(
+            counts,
+            {Speciality: 3, Service: 2, Client: 5, Master: 4, Order: 20, Review: 10},
+        )
+        connection.check_constraints()
+        self.assertFalse(Master.objects.exclude(speciality__in=Speciality.objects.all()).exists())
+        self.assertFalse(Order.objects.exclude(id_user__in=Client.objects.all()).exists())
+        self.assertFalse(Order.objects.exclude(id_master__in=Master.objects.all()).exists())
+        self.assertFalse(Review.objects.exclude(client__in=Client.objects.all()).exists())
+        self.assertFalse(Review.objects.exclude(master__in=Master.objects.all()).exists())
+        self.assertEqual(Order.history.filter(history_type="+").count(), 20)
+        self.assertEqual(Order.history.filter(history_type="~").count(), 20)
+
+    def test_derived_data(self):
+        """Рейтинги мастеров и дневные агрегаты перестраиваются по созданным строкам."""
+        self.generate()
+        self.assertEqual(sum(Master.objects.values_list("review_count", flat=True)), 10)
+        total = DailyMasterRollup.objects.aggregate(total=Sum("order_count"))["total"]
+        self.assertEqual(total, 20)
+        rollups = DailyMasterRollup.objects.order_by("day", "master").values_list(
+            "day", "master", "order_count", "price_sum", "price_min", "price_max"
+        )
+        rows = list(rollups)
+        rebuild_rollups()
+        self.assertEqual(list(rollups), rows)
+
+    def test_repeat_run(self):
+        """Повторный запуск продолжает нумерацию имён и добавляет строки."""
+        self.generate("--no-history", "--skip-derived")
+        self.generate("--no-history", "--skip-derived")
+        self.assertEqual(Speciality.objects.count(), 6)
+        self.assertEqual(Master.objects.count(), 8)
+        self.assertEqual(Order.history.count(), 0)
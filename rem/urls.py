@@ -5,6 +5,8 @@
 from django.urls import path, include
 from rest_framework import routers
 from rem import views  # Замените 'app_name' на название вашего приложения
+from rem.async_views import async_read_urlpatterns
+from rem.metrics import metrics_view
 
 APP_NAME = "rem"
 
@@ -15,7 +17,15 @@ router.register("specialisties", views.SpecialityViewSet)
 router.register("orders", views.OrderViewSet)
 router.register("services", views.ServiceViewSet)
 router.register("reviews", views.ReviewViewSet)
+router.register("analytics/masters", views.MasterRollupViewSet)
+router.register("analytics/specialities", views.SpecialityRollupViewSet)
 
 urlpatterns = [
+    path("metrics", metrics_view, name="metrics"),
+    path("api/cache-stats/", views.CacheStatsView.as_view(), name="cache-stats"),
+    path("api/analytics/", views.AnalyticsRootView.as_view(), name="analytics"),
+    path("api/search/", views.SearchView.as_view(), name="search"),
+    path("api/autocomplete/", views.AutocompleteView.as_view(), name="autocomplete"),
     path("api/", include(router.urls)),
+    *async_read_urlpatterns(router),
 ]
@@ -5,22 +5,59 @@ API для моделей Client, Order, Speciality, Master, Service
 настраиваемые действия.
 """
 
+import hashlib
+from decimal import Decimal, InvalidOperation
+
 import django_filters
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.filters import SearchFilter
+from rest_framework.filters import OrderingFilter, SearchFilter
 from rest_framework import viewsets, serializers, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from django.db.models import Count, Q
-from .models import Client, Order, Speciality, Master, Service, Review
+from rest_framework.reverse import reverse
+from rest_framework.views import APIView
+from django.db import transaction
+from django.db.models import Avg, Count, Max, Min, Q, Sum
+from .bulk import (
+    MODE_ATOMIC,
+    OrderBulkRequestSerializer,
+    OrderRepriceSerializer,
+    bulk_change_price,
+    bulk_create_orders,
+)
+from . import autocomplete, leaderboards, outbox, search
+from .caching import get_cache_stats
+from .mixins import (
+    ActionMetricsMixin,
+    CachedResponseMixin,
+    ConditionalGetMixin,
+    ExportMixin,
+    IncludeRelatedMixin,
+    QueryBudgetMixin,
+    SparseFieldsetViewMixin,
+)
+from .models import (
+    Client,
+    DailyMasterRollup,
+    DailySpecialityRollup,
+    Order,
+    Speciality,
+    Master,
+    Service,
+    Review,
+)
+from .pagination import CreatedAtKeysetPagination, DayKeysetPagination, OrderKeysetPagination
 from .serializers import (
     ClientSerializer,
+    DailyMasterRollupSerializer,
+    DailySpecialityRollupSerializer,
     SpecialitySerializer,
     OrderSerializer,
     MasterSerializer,
     ServiceSerializer,
     ReviewSerializer,
 )
+from .selection import MAX_ID, RULE_PARAMS, get_presets, rule_from_params
 
 from django.core.cache import cache
 from django.shortcuts import get_list_or_404
@@ -51,9 +88,22 @@ class OrderFilter(django_filters.FilterSet):
     """
     Фильтр для модели Order. 
     Позволяет фильтровать заказы по цене и другим атрибутам.
+
+    ``min_price``/``max_price`` — строгие границы цены, ``price_from``/
+    ``price_to`` — включительные. Границы дат создания и изменения
+    включительные. Каждое условие обслуживается индексом заказа:
+    (мастер или клиент, дата создания), (дата создания, id), цена или
+    дата изменения.
     """
     min_price = django_filters.NumberFilter(field_name="price", lookup_expr="gt")
     max_price = django_filters.NumberFilter(field_name="price", lookup_expr="lt")
+    price_from = django_filters.NumberFilter(field_name="price", lookup_expr="gte")
+    price_to = django_filters.NumberFilter(field_name="price", lookup_expr="lte")
+    create_at_from = django_filters.IsoDateTimeFilter(field_name="create_at", lookup_expr="gte")
+    create_at_to = django_filters.IsoDateTimeFilter(field_name="create_at", lookup_expr="lte")
+    updated_at_from = django_filters.IsoDateTimeFilter(field_name="updated_at", lookup_expr="gte")
+    updated_at_to = django_filters.IsoDateTimeFilter(field_name="updated_at", lookup_expr="lte")
+    speciality = django_filters.NumberFilter(field_name="id_master__speciality")
 
     class Meta:
         model = Order
@@ -61,23 +111,107 @@ class OrderFilter(django_filters.FilterSet):
 
 
 
-class ClientViewSet(viewsets.ModelViewSet):
+# Справочники меняются редко: CDN и клиенты могут переиспользовать их минуту
+CATALOG_CACHE_CONTROL = {"public": True, "max_age": 60}
+
+# Столбцы гистограммы рейтингов мастеров (рейтинг от 1 до 5)
+RATING_HISTOGRAM_VALUES = (1, 2, 3, 4, 5)
+
+
+class BaseModelViewSet(
+    ActionMetricsMixin,
+    QueryBudgetMixin,
+    ConditionalGetMixin,
+    CachedResponseMixin,
+    SparseFieldsetViewMixin,
+    IncludeRelatedMixin,
+    viewsets.ModelViewSet,
+):
+    """
+    Базовый ViewSet приложения: CRUD-операции с встраиванием связей
+    по ``?include=``, выборочным выводом полей (``?fields=``/``?omit=``),
+    условными GET-запросами (ETag/304), кэшем ответов для действий из
+    ``cache_actions``, бюджетом SQL-запросов на действие и метрикой
+    действия.
+
+    Бюджет ``None`` означает, что число запросов зависит от данных
+    (например, каскадное удаление с записью истории для каждой
+    связанной строки).
+    """
+
+
+
+class ClientViewSet(ExportMixin, BaseModelViewSet):
     """
     API для управления клиентами. 
     Предоставляет операции CRUD для модели Client.
     """
     queryset = Client.objects.all()
     serializer_class = ClientSerializer
+    pagination_class = CreatedAtKeysetPagination
+    export_fields = ("id", "full_name", "email", "created_at")
+    # Новое или изменённое имя записывается в индекс автодополнения
+    # (rem.autocomplete): вставка слов и триграмм, при изменении — и
+    # удаление прежних слов. Создание выполняется в транзакции (начало и
+    # фиксация или точка сохранения) вместе с сообщением исходящей очереди
+    query_budget = {
+        "list": 1,
+        "retrieve": 1,
+        "create": 8,
+        "update": 7,
+        "partial_update": 7,
+        "destroy": None,
+        "export": 1,
+    }
+
+    def perform_create(self, serializer):
+        """
+        Создаёт клиента и в той же транзакции ставит в исходящую очередь
+        (rem.outbox) приветственное письмо: ответ не ждёт отправки почты,
+        а при откате письмо не отправляется.
+        """
+        with transaction.atomic():
+            client = serializer.save()
+            if client.email:
+                outbox.enqueue("welcome_email", {"client_id": client.pk, "email": client.email})
 
 
 
-class MasterViewSet(viewsets.ModelViewSet):
+class MasterViewSet(BaseModelViewSet):
     """
     API для управления мастерами. 
     Предоставляет операции CRUD и статистику по мастерам.
     """
     queryset = Master.objects.all()
     serializer_class = MasterSerializer
+    cache_control = CATALOG_CACHE_CONTROL
+    cache_actions = ("list", "retrieve", "statistics", "pro")
+    # Запись мастера обновляет его документ в таблице поиска (rem.search),
+    # новое или изменённое имя — индекс автодополнения (rem.autocomplete)
+    query_budget = {
+        "list": 2,
+        "retrieve": 1,
+        "create": 7,
+        "update": 9,
+        "partial_update": 9,
+        "destroy": None,
+        "statistics": 1,
+        "pro": 2,
+        # Из Redis читаются только id и значения, мастера загружаются одним
+        # запросом; без Redis — запрос первых N и два запроса места мастера
+        "leaderboard": 3,
+    }
+
+    def get_version_models(self):
+        """
+        Статистика группирует мастеров по специальностям и зависит от обеих
+        моделей; отбор ``pro`` также зависит от заказов и почты клиентов.
+        """
+        if self.action == "statistics":
+            return {Master, Speciality}
+        if self.action == "pro":
+            return {Master, Speciality, Order, Client}
+        return super().get_version_models()
 
     @action(methods=["GET"], detail=False)
     def statistics(self, request):
@@ -85,14 +219,51 @@ class MasterViewSet(viewsets.ModelViewSet):
         Возвращает статистику по мастерам 
         и количество каждой специальности.
         """
-        all_count = self.get_queryset().count()
-        speciality_count = (
-            self.get_queryset().values("speciality__name").annotate(count=Count("id"))
+        return self.cached_response(self._statistics, request)
+
+    def _statistics(self, request):
+        """
+        Вычисляет статистику по мастерам одним сгруппированным запросом:
+        количество мастеров, средний рейтинг и гистограмму рейтингов
+        (по целой части) для каждой специальности. Общее количество —
+        сумма по специальностям.
+        """
+        histogram = {
+            f"rating_{value}": Count(
+                "id", filter=Q(rating__gte=value, rating__lt=value + 1)
+            )
+            for value in RATING_HISTOGRAM_VALUES
+        }
+        rows = list(
+            self.get_queryset()
+            .values("speciality", "speciality__name")
+            .annotate(count=Count("id"), avg_rating=Avg("rating"), **histogram)
+            .order_by("speciality__name")
         )
 
+        speciality_count = []
+        for row in rows:
+            avg_rating = row.pop("avg_rating")
+            speciality_count.append(
+                {
+                    "speciality": row.pop("speciality"),
+                    "speciality__name": row.pop("speciality__name"),
+                    "count": row.pop("count"),
+                    # Как поле rating сериализатора: строка с двумя знаками
+                    "avg_rating": (
+                        None if avg_rating is None
+                        else str(Decimal(avg_rating).quantize(Decimal("0.01")))
+                    ),
+                    "rating_histogram": {
+                        str(value): row.pop(f"rating_{value}")
+                        for value in RATING_HISTOGRAM_VALUES
+                    },
+                }
+            )
+
         return Response(
             {
-                "Всего специальностей": all_count,
+                "Всего специальностей": sum(row["count"] for row in speciality_count),
                 "Статистика по специальностям": speciality_count,
             }
         )
@@ -100,52 +271,228 @@ class MasterViewSet(viewsets.ModelViewSet):
     @action(methods=["GET"], detail=False)
     def pro(self, request):
         """
-        Возвращает мастеров с определенными условиями 
-        в зависимости от их специальности и рейтинга.
+        Возвращает мастеров, отобранных правилом из параметров запроса
+        (``preset``, ``speciality``, ``min_rating``, ``max_rating``,
+        ``exclude_email_domain``), постранично.
+
+        Без параметров возвращает, как и прежде, результаты всех пресетов
+        под их описаниями.
         """
-        professionals = Master.objects.filter(
-            ((Q(speciality__name='Электрик') | Q(speciality__name='Маляр')) & Q(rating__gte=4)) &
-            ~Q(order__id_user__email__endswith="gmail.com")
-        )
-        professionals2 = Master.objects.filter(
-            ((Q(speciality__name='Сантехник') | Q(speciality__name='Плотник')) & Q(rating__lte=3)) &
-            ~Q(order__id_user__email__endswith="mail.ru")
+        return self.cached_response(self._pro, request)
+
+    def _pro(self, request):
+        """
+        Отбирает мастеров: один запрос на правило.
+        """
+        queryset = self.get_queryset().select_related("speciality")
+        rule = self.get_selection_rule()
+        if rule is None:
+            return Response(
+                {
+                    preset.label: self.get_serializer(preset.apply(queryset), many=True).data
+                    for preset in get_presets().values()
+                }
+            )
+
+        page = self.paginate_queryset(rule.apply(queryset))
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    def get_selection_rule(self):
+        """
+        Возвращает правило отбора ``pro`` из параметров запроса (один раз за запрос).
+        """
+        if not hasattr(self, "_selection_rule"):
+            self._selection_rule = rule_from_params(self.request.query_params)
+        return self._selection_rule
+
+    def get_response_cache_key(self):
+        """
+        Ключ кэша ``pro`` строится по каноническому правилу, поэтому
+        запросы, отличающиеся лишь порядком значений, используют одну запись.
+        """
+        if self.action != "pro":
+            return super().get_response_cache_key()
+        rule = self.get_selection_rule()
+        digest = hashlib.md5(usedforsecurity=False)
+        digest.update(self.get_cache_origin().encode("utf-8"))
+        digest.update(repr(None if rule is None else rule.cache_key()).encode("utf-8"))
+        params = sorted(
+            (name, value)
+            for name, values in self.request.query_params.lists()
+            if name not in RULE_PARAMS
+            for value in values
         )
+        digest.update(repr(params).encode("utf-8"))
+        versions = self.get_versions()
+        for model, version in sorted(versions.items(), key=lambda item: item[0]._meta.label):
+            digest.update(f"|{model._meta.label}:{version}".encode("utf-8"))
+        name = f"{type(self).__name__}.{self.action}"
+        return name, f"rem:response:{name}:{digest.hexdigest()}"
 
-        serializer1 = MasterSerializer(professionals, many=True)
-        serializer2 = MasterSerializer(professionals2, many=True)
+    @action(methods=["GET"], detail=False)
+    def leaderboard(self, request):
+        """
+        Возвращает первых ``limit`` (по умолчанию 10, не больше 100)
+        мастеров специальности ``speciality`` по метрике ``metric``
+        (``rating``, ``orders`` или ``revenue``) и, если передан
+        ``master``, место этого мастера.
+
+        Рейтинги читаются из упорядоченных множеств Redis
+        (``rem.leaderboards``); если Redis недоступен или рейтинги в нём
+        ещё не построены — из базы.
+        """
+        params = self._leaderboard_params(request.query_params)
+        speciality_id, metric, limit, master_id = params
+        queryset = self.get_queryset().filter(speciality=speciality_id)
+        try:
+            top = leaderboards.top_masters(speciality_id, metric, limit)
+            rank = (
+                None if master_id is None
+                else leaderboards.master_rank(speciality_id, metric, master_id)
+            )
+            masters = queryset.in_bulk([pk for pk, _ in top])
+            top = [(masters[pk], score) for pk, score in top if pk in masters]
+            source = "redis"
+        except leaderboards.LeaderboardUnavailable:
+            ranked = leaderboards.ranked_masters(queryset, metric)[:limit]
+            top = [(master, float(master.score)) for master in ranked]
+            rank = (
+                None if master_id is None
+                else leaderboards.master_rank_in(queryset, metric, master_id)
+            )
+            source = "database"
 
+        serializer = self.get_serializer([master for master, _ in top], many=True)
         return Response(
             {
-                "Мастеры (электрики или маляры) с рейтингом выше или равно 4. "
-                "Почта клиентов не оканчивается на 'gmail.com'": serializer1.data,
-                "Мастеры (сантехники или плотники) с рейтингом ниже или равно 3. "
-                "Почта клиентов не оканчивается на 'mail.ru'": serializer2.data,
+                "speciality": speciality_id,
+                "metric": metric,
+                "source": source,
+                "results": [
+                    {"rank": position, "score": score, "master": data}
+                    for position, ((_, score), data) in enumerate(zip(top, serializer.data), 1)
+                ],
+                "master": None if master_id is None else {
+                    "id": master_id,
+                    "rank": rank and rank[0],
+                    "score": rank and rank[1],
+                },
             }
         )
 
-
-
-class SpecialityViewSet(viewsets.ModelViewSet):
+    @staticmethod
+    def _leaderboard_params(params):
+        """
+        Проверяет параметры ``leaderboard`` и возвращает
+        (id специальности, метрика, limit, id мастера).
+        """
+        errors = {}
+        values = {}
+        for name, required, bounds in (
+            ("speciality", True, (1, MAX_ID)),
+            ("limit", False, (1, 100)),
+            ("master", False, (1, MAX_ID)),
+        ):
+            value = params.get(name)
+            if not value:
+                if required:
+                    errors[name] = "Обязательный параметр."
+                values[name] = None
+                continue
+            try:
+                values[name] = int(value)
+            except ValueError:
+                errors[name] = "Ожидается целое число."
+                continue
+            if bounds and not bounds[0] <= values[name] <= bounds[1]:
+                errors[name] = f"Ожидается число от {bounds[0]} до {bounds[1]}."
+        metric = params.get("metric") or "rating"
+        if metric not in leaderboards.METRICS:
+            errors["metric"] = f"Доступны: {', '.join(leaderboards.METRICS)}."
+        if errors:
+            raise serializers.ValidationError(errors)
+        return values["speciality"], metric, values["limit"] or 10, values["master"]
+
+
+
+class SpecialityViewSet(BaseModelViewSet):
     """
     API для управления специальностями. 
     Предоставляет операции CRUD для модели Speciality.
     """
     queryset = Speciality.objects.all()
     serializer_class = SpecialitySerializer
+    cache_control = CATALOG_CACHE_CONTROL
+    cache_actions = ("list", "retrieve")
+    query_budget = {
+        "list": 2,
+        "retrieve": 1,
+        "create": 3,
+        "update": 4,
+        "partial_update": 4,
+        "destroy": None,
+    }
 
 
 
-class OrderViewSet(viewsets.ModelViewSet):
+class OrderSearchFilter(SearchFilter):
+    """
+    Поиск заказов по номеру или цене: каждое слово запроса — число, которое
+    сравнивается с номером и ценой на равенство (по индексам), а не
+    подстрокой через ``LIKE``. Запрос с нечисловым или бесконечным словом
+    (``NaN``, ``Infinity``) ничего не находит.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        for term in self.get_search_terms(request):
+            try:
+                value = Decimal(term)
+            except InvalidOperation:
+                return queryset.none()
+            # NaN и бесконечность не сравниваются с DecimalField
+            if not value.is_finite():
+                return queryset.none()
+            queryset = queryset.filter(Q(number=value) | Q(price=value))
+        return queryset
+
+
+class OrderViewSet(ExportMixin, BaseModelViewSet):
     """
     API для управления заказами. 
     Предоставляет операции CRUD и настраиваемые действия для заказов.
+
+    Сортировка ``?ordering=`` — по дате создания, дате изменения или цене
+    (с ``-`` — по убыванию); постраничный вывод сохраняет её в курсоре.
     """
-    filter_backends = [SearchFilter, DjangoFilterBackend]
+    filter_backends = [OrderSearchFilter, DjangoFilterBackend, OrderingFilter]
     search_fields = ["number", "price"]
+    ordering_fields = ["create_at", "updated_at", "price"]
     filterset_class = OrderFilter
     queryset = Order.objects.all()
-    serializer_class = OrderSerializer    
+    serializer_class = OrderSerializer
+    pagination_class = OrderKeysetPagination
+    export_fields = ("id", "number", "id_user", "id_master", "create_at", "updated_at", "price")
+    # Запись заказа обновляет дневные агрегаты мастера и специальности
+    # (rem.rollups): обычно один UPDATE на таблицу, для первого заказа дня —
+    # ещё вставка строки и повторный UPDATE; при смене мастера или даты —
+    # и прежние агрегаты
+    query_budget = {
+        "list": 1,
+        "retrieve": 1,
+        "create": 10,
+        "update": 14,
+        "partial_update": 14,
+        "destroy": 6,
+        "change_price": 6,
+        # Пакет из REM_BULK_MAX_ITEMS заказов: SQLite ограничивает число
+        # параметров запроса, поэтому INSERT разбивается на пачки; ещё
+        # пять запросов пересчитывают дневные агрегаты затронутых дней
+        "bulk": 30,
+        # Один UPDATE и одна вставка истории на пачку: зависит от числа заказов
+        "bulk_change_price": None,
+        "export": 1,
+    }
 
     @action(methods=["POST"], detail=True)
     def change_price(self, request, pk=None):
@@ -161,6 +508,71 @@ class OrderViewSet(viewsets.ModelViewSet):
             )
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(methods=["POST"], detail=False)
+    def bulk(self, request):
+        """
+        Создаёт пакет заказов за несколько запросов к базе.
+
+        Тело — список заказов или ``{"items": [...], "mode": "atomic"|"partial"}``.
+        Возвращает 201, если созданы все заказы, 207 при частичном успехе
+        и 400, если не создан ни один.
+        """
+        serializer = OrderBulkRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user = request.user if request.user.is_authenticated else None
+        created, errors = bulk_create_orders(
+            serializer.validated_data["items"],
+            mode=serializer.validated_data["mode"],
+            user=user,
+        )
+
+        if not created:
+            response_status = status.HTTP_400_BAD_REQUEST
+        elif errors:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_201_CREATED
+        return Response(
+            {
+                "created": OrderSerializer(created, many=True).data,
+                "errors": errors,
+                "atomic": serializer.validated_data["mode"] == MODE_ATOMIC,
+            },
+            status=response_status,
+        )
+
+    @action(methods=["POST"], detail=False)
+    def bulk_change_price(self, request):
+        """
+        Изменяет цену всех заказов, отобранных параметрами ``OrderFilter``
+        (например, ``?id_master=3`` или ``?speciality=2``), на ``percent``
+        процентов или на ``delta``.
+        """
+        # Пустые значения (``?number=``, ``?search=``) фильтр пропускает,
+        # поэтому требуется хотя бы одно непустое условие
+        filterset = OrderFilter(request.query_params, queryset=Order.objects.all())
+        if not filterset.is_valid():
+            return Response(filterset.errors, status=status.HTTP_400_BAD_REQUEST)
+        conditions = [value for value in filterset.form.cleaned_data.values() if value not in (None, "")]
+        if not conditions and not OrderSearchFilter().get_search_terms(request):
+            return Response(
+                {"detail": "Укажите фильтр заказов в параметрах запроса."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        serializer = OrderRepriceSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        user = request.user if request.user.is_authenticated else None
+        updated, negative = bulk_change_price(
+            self.filter_queryset(Order.objects.all()), user=user, **serializer.validated_data
+        )
+        if negative:
+            return Response(
+                {"detail": f"Цена {negative} заказов стала бы меньше нуля."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return Response({"message": "Цены заказов изменены.", "updated": updated})
+
     def get_serializer_class(self):
         """
         Возвращает соответствующий сериализатор для 
@@ -168,27 +580,270 @@ class OrderViewSet(viewsets.ModelViewSet):
         """
         if self.action == "change_price":
             return OrderPriceSerializer
+        if self.action == "bulk":
+            return OrderBulkRequestSerializer
+        if self.action == "bulk_change_price":
+            return OrderRepriceSerializer
         return super().get_serializer_class()
 
 
 
-class ServiceViewSet(viewsets.ModelViewSet):
+class ServiceViewSet(BaseModelViewSet):
     """
     API для управления услугами. 
     Предоставляет операции CRUD для модели Service.
     """
     queryset = Service.objects.all()
     serializer_class = ServiceSerializer
+    cache_control = CATALOG_CACHE_CONTROL
+    cache_actions = ("list", "retrieve")
+    # Запись услуги обновляет её документ в таблице поиска (rem.search)
+    query_budget = {
+        "list": 2,
+        "retrieve": 1,
+        "create": 3,
+        "update": 4,
+        "partial_update": 4,
+        "destroy": 3,
+    }
 
 
 
-class ReviewViewSet(viewsets.ModelViewSet):
+class ReviewViewSet(ExportMixin, BaseModelViewSet):
     """
     API для управления отзывами. 
     Предоставляет операции CRUD для модели Review.
     """
     queryset = Review.objects.all()
     serializer_class = ReviewSerializer
+    pagination_class = CreatedAtKeysetPagination
+    export_fields = ("id", "client", "master", "rating", "comment", "created_at")
+    # Запись отзыва обновляет рейтинг мастера одним UPDATE, при смене
+    # мастера отзыва — двумя; ещё один запрос перечитывает новый рейтинг
+    # для рейтингов мастеров в Redis и ещё один обновляет документ отзыва
+    # в таблице поиска
+    query_budget = {
+        "list": 1,
+        "retrieve": 1,
+        "create": 6,
+        "update": 8,
+        "partial_update": 8,
+        "destroy": 5,
+        "export": 1,
+    }
+
+
+
+class MasterRollupFilter(django_filters.FilterSet):
+    """
+    Фильтр дневных агрегатов мастеров по периоду, мастеру и специальности.
+    """
+    date_from = django_filters.DateFilter(field_name="day", lookup_expr="gte")
+    date_to = django_filters.DateFilter(field_name="day", lookup_expr="lte")
+    speciality = django_filters.NumberFilter(field_name="master__speciality")
+
+    class Meta:
+        model = DailyMasterRollup
+        fields = ["master"]
+
+
+
+class SpecialityRollupFilter(django_filters.FilterSet):
+    """
+    Фильтр дневных агрегатов специальностей по периоду и специальности.
+    """
+    date_from = django_filters.DateFilter(field_name="day", lookup_expr="gte")
+    date_to = django_filters.DateFilter(field_name="day", lookup_expr="lte")
+
+    class Meta:
+        model = DailySpecialityRollup
+        fields = ["speciality"]
+
+
+
+class RollupViewSet(
+    ActionMetricsMixin,
+    QueryBudgetMixin,
+    ConditionalGetMixin,
+    CachedResponseMixin,
+    SparseFieldsetViewMixin,
+    IncludeRelatedMixin,
+    viewsets.ReadOnlyModelViewSet,
+):
+    """
+    Базовый ViewSet аналитики: чтение дневных агрегатов заказов
+    (см. ``rem.rollups``) вместо обхода таблицы заказов.
+
+    Список возвращает строки по дням, действие ``summary`` — итоги за
+    период по ключу группировки (``group_field``), самые доходные первыми.
+    """
+    pagination_class = DayKeysetPagination
+    cache_actions = ("list", "retrieve", "summary")
+    group_field = None
+    query_budget = {
+        "list": 1,
+        "retrieve": 1,
+        "summary": 1,
+    }
+
+    def get_queryset(self):
+        """
+        Возвращает агрегаты, в которых есть заказы.
+        """
+        return super().get_queryset().filter(order_count__gt=0)
+
+    @action(methods=["GET"], detail=False)
+    def summary(self, request):
+        """
+        Возвращает количество заказов, выручку и крайние цены за период
+        по каждому значению ключа группировки.
+        """
+        return self.cached_response(self._summary, request)
+
+    def _summary(self, request):
+        """
+        Вычисляет итоги за период.
+        """
+        totals = (
+            self.filter_queryset(self.get_queryset())
+            .values(self.group_field)
+            .annotate(
+                order_count=Sum("order_count"),
+                price_sum=Sum("price_sum"),
+                price_min=Min("price_min"),
+                price_max=Max("price_max"),
+            )
+            .order_by("-price_sum", self.group_field)
+        )
+        return Response(list(totals))
+
+
+
+class MasterRollupViewSet(RollupViewSet):
+    """
+    API аналитики заказов по мастерам и дням.
+    """
+    queryset = DailyMasterRollup.objects.all()
+    serializer_class = DailyMasterRollupSerializer
+    filterset_class = MasterRollupFilter
+    group_field = "master"
+
+
+
+class SpecialityRollupViewSet(RollupViewSet):
+    """
+    API аналитики заказов по специальностям и дням.
+    """
+    queryset = DailySpecialityRollup.objects.all()
+    serializer_class = DailySpecialityRollupSerializer
+    filterset_class = SpecialityRollupFilter
+    group_field = "speciality"
+
+
+
+class AnalyticsRootView(APIView):
+    """
+    Возвращает ссылки на ресурсы аналитики.
+    """
+
+    def get(self, request):
+        """
+        Возвращает ссылки на дневные агрегаты и итоги за период.
+        """
+        links = {}
+        for name, basename in (
+            ("masters", "dailymasterrollup"),
+            ("specialities", "dailyspecialityrollup"),
+        ):
+            links[name] = reverse(f"{basename}-list", request=request)
+            links[f"{name}_summary"] = reverse(f"{basename}-summary", request=request)
+        return Response(links)
+
+
+
+class SearchView(APIView):
+    """
+    Полнотекстовый поиск по услугам, мастерам и комментариям отзывов.
+
+    Параметры: ``q`` — слова запроса (ищутся как префиксы слов), ``type`` —
+    типы результатов через запятую (``service``, ``master``, ``review``;
+    по умолчанию все), ``limit`` (по умолчанию 20, не больше 100) и
+    ``offset``. Результаты упорядочены по релевантности, совпадения в
+    ``title`` и ``snippet`` выделены тегом ``<mark>``.
+    """
+
+    def get(self, request):
+        params = request.query_params
+        query = params.get("q", "").strip()
+        kinds = [kind.strip() for kind in params.get("type", "").split(",") if kind.strip()]
+        errors = {}
+        if not query:
+            errors["q"] = "Обязательный параметр."
+        unknown = sorted(set(kinds) - set(search.SEARCH_KINDS))
+        if unknown:
+            errors["type"] = (
+                f"Неизвестные типы: {', '.join(unknown)}. "
+                f"Доступны: {', '.join(search.SEARCH_KINDS)}."
+            )
+        limit, offset = params.get("limit", "20"), params.get("offset", "0")
+        if not limit.isdigit() or not 1 <= int(limit) <= 100:
+            errors["limit"] = "Ожидается число от 1 до 100."
+        if not offset.isdigit():
+            errors["offset"] = "Ожидается неотрицательное целое число."
+        if errors:
+            raise serializers.ValidationError(errors)
+
+        results = search.search(
+            query, kinds=kinds or search.SEARCH_KINDS, limit=int(limit), offset=int(offset)
+        )
+        return Response({"query": query, "results": results})
+
+
+class AutocompleteView(APIView):
+    """
+    Автодополнение имён клиентов и мастеров по индексу ``rem.autocomplete``.
+
+    Параметры: ``q`` — начало слов имени (регистр и «ё»/«е» не
+    различаются), ``type`` — ``client``, ``master`` или оба через запятую
+    (по умолчанию), ``limit`` (по умолчанию 10, не больше 50). Если имён
+    с такими префиксами мало, добавляются похожие имена (опечатки).
+    """
+
+    def get(self, request):
+        params = request.query_params
+        query = params.get("q", "").strip()
+        kinds = [kind.strip() for kind in params.get("type", "").split(",") if kind.strip()]
+        errors = {}
+        if not query:
+            errors["q"] = "Обязательный параметр."
+        unknown = sorted(set(kinds) - set(autocomplete.AUTOCOMPLETE_KINDS))
+        if unknown:
+            errors["type"] = (
+                f"Неизвестные типы: {', '.join(unknown)}. "
+                f"Доступны: {', '.join(autocomplete.AUTOCOMPLETE_KINDS)}."
+            )
+        limit = params.get("limit", "10")
+        if not limit.isdigit() or not 1 <= int(limit) <= 50:
+            errors["limit"] = "Ожидается число от 1 до 50."
+        if errors:
+            raise serializers.ValidationError(errors)
+
+        results = autocomplete.complete(
+            query, kinds=kinds or autocomplete.AUTOCOMPLETE_KINDS, limit=int(limit)
+        )
+        return Response({"query": query, "results": results})
+
+
+class CacheStatsView(APIView):
+    """
+    Возвращает счётчики попаданий и промахов кэша ответов по действиям.
+    """
+
+    def get(self, request):
+        """
+        Возвращает статистику кэша ответов.
+        """
+        return Response(get_cache_stats())
 
 
 
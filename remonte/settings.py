@@ -45,6 +45,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'rem.metrics.MetricsMiddleware',
+    'rem.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -53,6 +55,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'simple_history.middleware.HistoryRequestMiddleware',
+    'rem.history.DeferredHistoryMiddleware',
 ]
 
 ROOT_URLCONF = 'remonte.urls'
@@ -132,7 +135,18 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
     'PAGE_SIZE': 2,
-    'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend']
+    'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
+    'DEFAULT_RENDERER_CLASSES': [
+        'rem.renderers.FastJSONRenderer',
+        'rem.renderers.MessagePackRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'rem.renderers.FastJSONParser',
+        'rem.renderers.MessagePackParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
 from celery.schedules import crontab
@@ -146,6 +160,22 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'rem.tasks.cleanup_old_orders',
         'schedule': crontab(hour=0, minute=0),  # каждый день в полночь
     },
+    'rebuild-rollups-every-night': {
+        'task': 'rem.tasks.rebuild_rollups',
+        'schedule': crontab(hour=3, minute=0),  # каждый день в 03:00
+    },
+    'rebuild-leaderboards-every-night': {
+        'task': 'rem.tasks.rebuild_leaderboards',
+        'schedule': crontab(hour=3, minute=30),  # каждый день в 03:30
+    },
+    'enforce-history-retention-every-night': {
+        'task': 'rem.tasks.enforce_history_retention',
+        'schedule': crontab(hour=4, minute=0),  # каждый день в 04:00
+    },
+    'drain-outbox-every-10-seconds': {
+        'task': 'rem.tasks.drain_outbox',
+        'schedule': 10.0,  # каждые 10 секунд
+    },
 }
 
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
@@ -158,6 +188,115 @@ CACHES = {
         'LOCATION': 'redis://127.0.0.1:6379/1',
         'OPTIONS': {
             'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            # Недоступность Redis не должна ломать запросы: кэш работает как промах
+            'IGNORE_EXCEPTIONS': True,
         }
     }
 }
+
+DJANGO_REDIS_LOG_IGNORED_EXCEPTIONS = True
+
+# Бюджет SQL-запросов на действие ViewSet'а: "off", "warn" или "raise"
+REM_QUERY_BUDGET_MODE = 'warn' if DEBUG else 'off'
+
+# Массовое создание заказов: максимальный размер пакета, размер пачки INSERT
+# и режим по умолчанию ("atomic" — всё или ничего, "partial" — частичный успех)
+REM_BULK_MAX_ITEMS = 1000
+REM_BULK_BATCH_SIZE = 500
+REM_BULK_DEFAULT_MODE = 'atomic'
+# Размер пачки заказов для одного UPDATE при массовом изменении цен
+REM_BULK_REPRICE_CHUNK_SIZE = 500
+
+# Размер пачки строк, читаемых из базы при потоковой выгрузке
+REM_EXPORT_CHUNK_SIZE = 2000
+
+# Дневные агрегаты заказов: размер пачки upsert'а и глубина ночной перестройки
+# в днях (None — перестраивать за всё время)
+REM_ROLLUP_BATCH_SIZE = 500
+REM_ROLLUP_REBUILD_DAYS = None
+
+# Пресеты отбора мастеров для /api/masters/pro/?preset=<имя>: специальности
+# (id или названия), границы рейтинга и исключаемые домены почты клиентов
+# (exclude_email_domains — домен целиком) или окончания их адресов
+# (exclude_email_suffixes — endswith, как в прежнем отборе).
+# Пусто — пресеты по умолчанию из rem.selection.DEFAULT_PRO_PRESETS
+REM_PRO_PRESETS = None
+
+# Автодополнение имён: минимальная доля совпавших триграмм запроса, при
+# которой имя считается похожим (поиск с опечатками)
+REM_AUTOCOMPLETE_SIMILARITY = 0.4
+
+# Метрики для Prometheus (/metrics): включение сбора, интервал передачи
+# накопленных значений процесса в Redis (секунды) и токен доступа
+# (None — без проверки). Без токена /metrics открыт всем: в рабочем
+# окружении задайте токен или закройте адрес на прокси
+REM_METRICS_ENABLED = True
+REM_METRICS_FLUSH_INTERVAL = 15
+REM_METRICS_TOKEN = None
+
+# Профилирование запросов по требованию (rem.profiling): заголовок с
+# подписанным токеном и срок его действия (секунды), выборка 1 из N
+# запросов (0 — только по заголовку) и минимальное время сохраняемого
+# запроса из выборки (мс), интервал выборки стека (секунды), каталог и
+# размер кольцевого буфера профилей, предел числа SQL-запросов в профиле
+# и сохранение значений параметров SQL (в них бывают почта, имена и ключи
+# сессий; по умолчанию сохраняется только их число)
+REM_PROFILING_ENABLED = True
+REM_PROFILING_HEADER = 'X-Rem-Profile'
+REM_PROFILING_TOKEN_MAX_AGE = 3600
+REM_PROFILING_SAMPLE_RATE = 0
+REM_PROFILING_SAMPLE_MIN_MS = 200
+REM_PROFILING_INTERVAL = 0.001
+REM_PROFILING_DIR = BASE_DIR / 'profiles'
+REM_PROFILING_MAX_PROFILES = 200
+REM_PROFILING_MAX_QUERIES = 500
+REM_PROFILING_CAPTURE_PARAMS = False
+
+# История изменений (rem.history): срок хранения записей в днях по моделям
+# (None — хранить всегда), каталог архивов удалённых записей, размер пачки
+# архивирования и удаления, предел пачек на модель за запуск ночной задачи
+# и задержка её повторного запуска (секунды), глубина поиска записей без
+# изменений в днях (None — вся история)
+REM_HISTORY_RETENTION = {
+    'rem.Speciality': None,
+    'rem.Client': 365,
+    'rem.Master': 365,
+    'rem.Order': 180,
+}
+REM_HISTORY_ARCHIVE_DIR = BASE_DIR / 'history_archive'
+REM_HISTORY_BATCH_SIZE = 1000
+REM_HISTORY_MAX_BATCHES = 50
+REM_HISTORY_RESCHEDULE_DELAY = 60
+REM_HISTORY_DEDUPLICATE_DAYS = 2
+
+# Отложенная запись истории (rem.history): модели, записи истории которых
+# в запросе копятся и пишутся одним bulk_create в конце запроса (например,
+# ['rem.Order']), и объединение нескольких изменений объекта за запрос в
+# одну запись (меняет результаты запросов к истории). По умолчанию выключено
+REM_DEFERRED_HISTORY = []
+REM_DEFERRED_HISTORY_COLLAPSE = False
+
+# Ежедневные напоминания клиентам (rem.reminders): недавним заказом
+# считается созданный за REM_REMINDER_RECENT_DAYS дней, давним —
+# старше REM_REMINDER_STALE_DAYS дней; повторное напоминание клиенту —
+# не раньше чем через REM_REMINDER_REPEAT_DAYS дней. Клиентов в
+# подзадаче отправки, предел писем в секунду (None — без ограничения)
+# и адрес отправителя
+REM_REMINDER_RECENT_DAYS = 1
+REM_REMINDER_STALE_DAYS = 180
+REM_REMINDER_REPEAT_DAYS = 30
+REM_REMINDER_CHUNK_SIZE = 100
+REM_REMINDER_RATE_LIMIT = 10
+REM_REMINDER_FROM_EMAIL = 'noreply@example.com'
+
+# Исходящая очередь побочных действий (rem.outbox): сообщений в пачке
+# захвата, предел пачек за запуск задачи drain_outbox, аренда захваченного
+# сообщения (секунды), число попыток доставки, начальная и максимальная
+# задержка повтора (секунды) и срок хранения доставленных сообщений (дни)
+REM_OUTBOX_BATCH_SIZE = 100
+REM_OUTBOX_MAX_BATCHES = 10
+REM_OUTBOX_LEASE = 300
+REM_OUTBOX_MAX_ATTEMPTS = 10
+REM_OUTBOX_RETRY_DELAY = 30
+REM_OUTBOX_MAX_RETRY_DELAY = 3600
+REM_OUTBOX_RETENTION_DAYS = 7
@@ -22,6 +22,9 @@ from rest_framework.permissions import AllowAny
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 from rem import views
+from rem.admin import profiling_urls
+from rem.async_views import async_read_urlpatterns
+from rem.metrics import metrics_view
 
 APP_NAME = "rem"  # Renommé selon les conventions de Python
 
@@ -32,6 +35,8 @@ router.register("specialisties", views.SpecialityViewSet)
 router.register("orders", views.OrderViewSet)
 router.register("services", views.ServiceViewSet)
 router.register("reviews", views.ReviewViewSet)
+router.register("analytics/masters", views.MasterRollupViewSet)
+router.register("analytics/specialities", views.SpecialityRollupViewSet)
 
 schema_view = get_schema_view(  # Utiliser une convention de nommage pour les variables
     openapi.Info(
@@ -47,8 +52,15 @@ schema_view = get_schema_view(  # Utiliser une convention de nommage pour les va
 )
 
 urlpatterns = [
+    *profiling_urls(),
     path('admin/', admin.site.urls),
+    path("metrics", metrics_view, name="metrics"),
+    path("api/cache-stats/", views.CacheStatsView.as_view(), name="cache-stats"),
+    path("api/analytics/", views.AnalyticsRootView.as_view(), name="analytics"),
+    path("api/search/", views.SearchView.as_view(), name="search"),
+    path("api/autocomplete/", views.AutocompleteView.as_view(), name="autocomplete"),
     path("api/", include(router.urls)),
+    *async_read_urlpatterns(router),
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
 ]
 